@@ -0,0 +1,123 @@
+import asyncio
+import datetime
+import logging
+import typing
+
+from app.configs import monitor as config
+from rzd_client import client
+from rzd_client import models
+from rzd_client import tracing
+from shared import metrics
+
+logger = logging.getLogger(__name__)
+
+_CACHE_NAME = 'collector_snapshot'
+
+
+def _latest_snapshot(args: models.TrainsOverviewRequestArgs, max_age: float) -> typing.Optional[list]:
+    # Imported here: SQLAlchemy is only needed with the collector database
+    from sqlalchemy import select
+    from sqlalchemy.orm import Session
+    from collector_app import orm
+
+    fresh_since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=max_age)
+    query = (
+        select(orm.CollectedDataRaw.raw_data)
+        .join(orm.Config)
+        .where(
+            orm.Config.departure_date == args.departure_date,
+            orm.Config.departure_station_id == int(args.departure_station.code),
+            orm.Config.arrival_station_id == int(args.arrival_station.code),
+            orm.CollectedDataRaw.collected_at >= fresh_since,
+        )
+        .order_by(orm.CollectedDataRaw.collected_at.desc())
+        .limit(1)
+    )
+    with Session(orm.get_engine()) as session:
+        return session.execute(query).scalar()
+
+
+def _ensure_config(args: models.TrainsOverviewRequestArgs) -> bool:
+    """Create an enabled collector config for the route. False if one already exists."""
+    from sqlalchemy.orm import Session
+    from collector_app import orm
+
+    with Session(orm.get_engine()) as session:
+        exists = session.query(orm.Config.id).filter_by(
+            departure_date=args.departure_date,
+            departure_station_id=int(args.departure_station.code),
+            arrival_station_id=int(args.arrival_station.code),
+        ).first()
+        if exists:
+            return False
+        session.add(orm.Config(
+            departure_date=args.departure_date,
+            departure_station_id=int(args.departure_station.code),
+            arrival_station_id=int(args.arrival_station.code),
+            enabled=True,
+        ))
+        session.commit()
+        return True
+
+
+class AvailabilityService:
+    """
+    Read-through source of train overviews: the latest collector snapshot
+    of the route when it is fresh enough, RZD otherwise
+    """
+
+    def __init__(
+            self,
+            max_age: float = config.SNAPSHOT_MAX_AGE,
+            enabled: bool = config.COLLECTOR_DB_ENABLED,
+    ):
+        self.max_age = max_age
+        self.enabled = enabled
+        self._registered: typing.Set[models.TrainsOverviewRequestArgs] = set()
+
+    async def _from_snapshot(
+            self, args: models.TrainsOverviewRequestArgs,
+    ) -> typing.Optional[typing.List[models.TrainOverview]]:
+        if not self.enabled:
+            return None
+        loop = asyncio.get_running_loop()
+        try:
+            raw_data = await loop.run_in_executor(None, _latest_snapshot, args, self.max_age)
+        except Exception:
+            logger.warning('Cannot read collector snapshot for %s', args, exc_info=True)
+            metrics.CACHE_REQUESTS.inc(_CACHE_NAME, 'error')
+            return None
+        if raw_data is None:
+            metrics.CACHE_REQUESTS.inc(_CACHE_NAME, 'miss')
+            return None
+        metrics.CACHE_REQUESTS.inc(_CACHE_NAME, 'hit')
+        return [models.TrainOverview.from_rzd_json(data) for data in raw_data]
+
+    async def fetch_trains_overview(
+            self,
+            args: models.TrainsOverviewRequestArgs,
+            client_: typing.Optional[client.RZDClient] = None,
+            caller: str = tracing.CALLER_UNKNOWN,
+    ) -> typing.List[models.TrainOverview]:
+        trains = await self._from_snapshot(args)
+        if trains is not None:
+            return trains
+        if client_ is not None:
+            return await client_.fetch_trains_overview(args)
+        async with client.RZDClient(caller=caller) as client_:
+            return await client_.fetch_trains_overview(args)
+
+    def register_demand(self, args: models.TrainsOverviewRequestArgs):
+        """Ask the collector to poll the route, once per route and process."""
+        if not self.enabled or args in self._registered:
+            return
+        self._registered.add(args)
+        future = asyncio.get_running_loop().run_in_executor(None, _ensure_config, args)
+        future.add_done_callback(lambda f: self._on_registered(args, f))
+
+    def _on_registered(self, args, future: asyncio.Future):
+        if future.exception() is not None:
+            self._registered.discard(args)
+            logger.warning('Cannot register demand for %s: %r', args, future.exception())
+        elif future.result():
+            logger.info('Registered collector config for %s', args)
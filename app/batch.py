@@ -0,0 +1,194 @@
+import asyncio
+import csv
+import dataclasses
+import datetime
+import json
+import logging
+import sys
+import typing
+
+from app import helpers
+from app.monitor import AsyncMonitor
+from app.range_monitor import RangeMonitor
+from rzd_client import client
+from rzd_client import common
+from rzd_client import models
+from rzd_client import tracing
+
+if typing.TYPE_CHECKING:
+    from app import hub
+
+logger = logging.getLogger(__name__)
+
+ANY_TRAIN = '*'
+DEFAULT_CAR_TYPE = 'Плац'
+
+STATUS_FOUND = 'found'
+STATUS_FAILED = 'failed'
+STATUS_TIMEOUT = 'timeout'
+STATUS_INVALID = 'invalid'
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_TIMEOUT = 2
+
+
+@dataclasses.dataclass
+class MonitorDefinition:
+    """One line of a batch file, same fields as run_terminal.py arguments."""
+    id: str
+    departure: str
+    destination: str
+    train: str
+    date: str
+    type: str = DEFAULT_CAR_TYPE
+    count: int = 1
+    date_to: typing.Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data: dict, default_id: str) -> 'MonitorDefinition':
+        fields = {f.name for f in dataclasses.fields(cls)}
+        unknown = set(data) - fields
+        if unknown:
+            raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}')
+        # Empty CSV cells mean defaults
+        data = {k: v for k, v in data.items() if v not in (None, '')}
+        data.setdefault('id', default_id)
+        data['id'] = str(data['id'])
+        data['count'] = int(data.get('count', 1))
+        return cls(**data)
+
+
+def build_monitor(definition: MonitorDefinition, **kwargs) -> typing.Union[AsyncMonitor, RangeMonitor]:
+    """AsyncMonitor for one train and date, RangeMonitor for several trains or dates."""
+    car_type = helpers.service_category_by_char_code(definition.type)
+    trains = [t.strip() for t in definition.train.split(',') if t.strip()]
+    if definition.date_to or len(trains) != 1 or trains[0] == ANY_TRAIN:
+        date_from = common.parse_rzd_date(definition.date)
+        return RangeMonitor(
+            models.Station(definition.departure),
+            models.Station(definition.destination),
+            date_from=date_from,
+            date_to=common.parse_rzd_date(definition.date_to) if definition.date_to else date_from,
+            trains=None if ANY_TRAIN in trains else trains,
+            cars_type=car_type,
+            requested_count=definition.count,
+            **kwargs,
+        )
+    rzd_args = models.TrainDetailedRequestArgs.from_rzd_args(
+        {
+            'code0': definition.departure,
+            'code1': definition.destination,
+            'dt0': definition.date,
+            'tnum0': trains[0],
+        }
+    )
+    return AsyncMonitor(rzd_args, definition.count, car_type, **kwargs)
+
+
+def read_definitions(path: str) -> typing.Iterator[typing.Tuple[str, typing.Union[MonitorDefinition, Exception]]]:
+    """(id, definition or parse error) from a JSONL or CSV (with header) file."""
+    with open(path, encoding='utf8', newline='') as f:
+        if path.lower().endswith('.csv'):
+            rows = enumerate(csv.DictReader(f), start=2)
+        else:
+            rows = ((i, line) for i, line in enumerate(f, start=1) if line.strip())
+        for line_number, row in rows:
+            default_id = str(line_number)
+            try:
+                data = row if isinstance(row, dict) else json.loads(row)
+                yield default_id, MonitorDefinition.from_dict(data, default_id)
+            except (ValueError, TypeError) as e:
+                yield default_id, e
+
+
+class BatchRunner:
+    """Runs many monitors in one process on a shared client, writing JSON lines."""
+
+    def __init__(self, concurrency: int, timeout: typing.Optional[float] = None, out=sys.stdout):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.out = out
+        self.statuses: typing.Dict[str, str] = {}
+
+    def emit(self, monitor_id: str, event: str, **fields):
+        record = {
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'id': monitor_id,
+            'event': event,
+            **fields,
+        }
+        self.out.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.out.flush()
+
+    def _finish(self, monitor_id: str, status: str, **fields):
+        self.statuses[monitor_id] = status
+        self.emit(monitor_id, 'result', status=status, **fields)
+
+    async def _run_one(self, definition: MonitorDefinition, client_: client.RZDClient, hub_: 'hub.MonitorHub'):
+        found = False
+
+        async def callback(text):
+            nonlocal found
+            self.emit(definition.id, 'message', text=text)
+            if isinstance(mon, RangeMonitor) or mon.available:
+                # Tickets are there: this monitor is done
+                found = mon.stop = True
+
+        try:
+            mon = build_monitor(definition, callback=callback, prefix=f'[{definition.id}] ')
+        except ValueError as e:
+            self._finish(definition.id, STATUS_INVALID, error=str(e))
+            return
+        if isinstance(mon, AsyncMonitor):
+            mon.hub = hub_
+            run = mon.run()
+        else:
+            run = mon.run(client_)
+        try:
+            await run
+        except Exception as e:
+            logger.exception('%sMonitor failed', mon.log_prefix)
+            self._finish(definition.id, STATUS_FAILED, error=repr(e))
+            return
+        # AsyncMonitor also stops on its own when tickets are there from the start
+        found = found or isinstance(mon, AsyncMonitor) and mon.available
+        self._finish(definition.id, STATUS_FOUND if found else STATUS_FAILED)
+
+    async def run(self, definitions: typing.Iterable[typing.Tuple[str, typing.Union[MonitorDefinition, Exception]]]):
+        """Run all definitions until they find tickets, fail or time out. Returns the exit code."""
+        # Imported here: only the batch mode needs the hub
+        from app import hub
+
+        async with client.RZDClient(caller=tracing.CALLER_MONITOR, concurrency=self.concurrency) as client_:
+            hub_ = hub.MonitorHub(client_=client_)
+            tasks = {}
+            for default_id, definition in definitions:
+                if isinstance(definition, Exception):
+                    self._finish(default_id, STATUS_INVALID, error=str(definition))
+                    continue
+                if definition.id in tasks:
+                    self._finish(default_id, STATUS_INVALID, error=f'Duplicate id {definition.id!r}')
+                    continue
+                tasks[definition.id] = asyncio.create_task(
+                    self._run_one(definition, client_, hub_), name=f'batch-monitor-{definition.id}',
+                )
+            try:
+                if tasks:
+                    _, pending = await asyncio.wait(tasks.values(), timeout=self.timeout)
+                    for monitor_id, task in tasks.items():
+                        if task in pending:
+                            task.cancel()
+                            self._finish(monitor_id, STATUS_TIMEOUT)
+                    await asyncio.gather(*pending, return_exceptions=True)
+            finally:
+                await hub_.close()
+        return self.exit_code()
+
+    def exit_code(self) -> int:
+        statuses = set(self.statuses.values())
+        if statuses & {STATUS_FAILED, STATUS_INVALID}:
+            return EXIT_FAILED
+        if STATUS_TIMEOUT in statuses:
+            return EXIT_TIMEOUT
+        return EXIT_OK
@@ -1,20 +1,56 @@
+import typing
+
 from aiogram import Bot, Dispatcher
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 
 from .configs import bot as config
 from .configs import messages
+from . import availability
+from . import hub
+from . import outbound
+from . import registry
 from . import routes
+from . import storage as storages
+
+# Created by setup(), importing the module has no side effects
+bot: typing.Optional[Bot] = None
+storage: typing.Optional[MemoryStorage] = None
+monitor_store: typing.Optional[storages.MonitorStore] = None
+dispatcher: typing.Optional[Dispatcher] = None
+outbox: typing.Optional[outbound.Outbox] = None
+monitors: typing.Optional[registry.MonitorRegistry] = None
+availability_service: typing.Optional[availability.AvailabilityService] = None
+monitor_hub: typing.Optional[hub.MonitorHub] = None
+
 
-if not config.API_TOKEN:
-    msg = messages.SPECIFY_TOKEN_TEMPLATE.format(
-        config.API_TOKEN_ENV,
-    )
-    raise RuntimeError(msg)
+def setup(
+        bot_: typing.Optional[Bot] = None,
+        storage_path: typing.Optional[str] = config.STORAGE_PATH,
+        **outbox_options,
+) -> Dispatcher:
+    """
+    Create the bot, its storages and services, and register handlers.
+    ``bot_`` replaces the Telegram bot, e.g. with a fake one in load tests.
+    """
+    global bot, storage, monitor_store, dispatcher, outbox, monitors, availability_service, monitor_hub
+    if dispatcher is not None:
+        return dispatcher
 
-bot = Bot(token=config.API_TOKEN, proxy=config.PROXY_URL)
+    if bot_ is None:
+        if not config.API_TOKEN:
+            msg = messages.SPECIFY_TOKEN_TEMPLATE.format(
+                config.API_TOKEN_ENV,
+            )
+            raise RuntimeError(msg)
+        bot_ = Bot(token=config.API_TOKEN, proxy=config.PROXY_URL)
+    bot = bot_
 
-storage = MemoryStorage()
-dispatcher = Dispatcher(bot, storage=storage)
-messengers = {}
+    storage, monitor_store = storages.create_storages(storage_path)
+    dispatcher = Dispatcher(bot, storage=storage)
+    outbox = outbound.Outbox(bot, **outbox_options)
+    monitors = registry.MonitorRegistry()
+    availability_service = availability.AvailabilityService()
+    monitor_hub = hub.MonitorHub(availability=availability_service)
 
-routes.apply_routes(dispatcher)
+    routes.apply_routes(dispatcher)
+    return dispatcher
@@ -12,6 +12,17 @@ PROXY_URL_ENV = 'RZD_TICKETS_MONITOR_BOT_PROXY'
 API_TOKEN = os.getenv(API_TOKEN_ENV)
 PROXY_URL = os.getenv(PROXY_URL_ENV)
 LOGS_CHANNEL = os.getenv('RZD_TICKETS_MONITOR_BOT_LOGS_CHANNEL')
+
+# Webhook mode is used when the port is set; URL is the public one registered in Telegram
+WEBHOOK_HOST = os.getenv('RZD_TICKETS_MONITOR_BOT_WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('RZD_TICKETS_MONITOR_BOT_WEBHOOK_PORT', 0)) or None
+WEBHOOK_URL = os.getenv('RZD_TICKETS_MONITOR_BOT_WEBHOOK_URL')
+WEBHOOK_PATH = os.getenv('RZD_TICKETS_MONITOR_BOT_WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('RZD_TICKETS_MONITOR_BOT_WEBHOOK_SECRET')
+WEBHOOK_SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+WEBHOOK_CONCURRENCY = int(os.getenv('RZD_TICKETS_MONITOR_BOT_WEBHOOK_CONCURRENCY', 16))
+WEBHOOK_QUEUE_SIZE = 1000
+WEBHOOK_DRAIN_TIMEOUT = 10
 MAX_TRAINS_PER_MESSAGE = 15
 
 COMMAND_SYMBOL = '@'
@@ -22,6 +33,29 @@ DATES_INTERVAL = 121
 MIN_SUGGESTS_SIMILARITY = 70
 SUGGESTS_LIMIT = 5
 
+OUTBOX_GLOBAL_RATE = 25
+OUTBOX_GLOBAL_BURST = 30
+OUTBOX_CHAT_RATE = 1
+OUTBOX_CHAT_BURST = 3
+# Replies in a conversation have a bucket of their own, notifications never delay them
+OUTBOX_INTERACTIVE_CHAT_RATE = 1
+OUTBOX_INTERACTIVE_CHAT_BURST = 10
+OUTBOX_WORKERS = 4
+OUTBOX_COALESCE_WINDOW = 1.5
+OUTBOX_MAX_RETRIES = 5
+MAX_MESSAGE_LENGTH = 4096
+
+# SQLite file for FSM state and active monitors; in-memory when unset
+STORAGE_PATH = os.getenv('RZD_TICKETS_MONITOR_BOT_STORAGE')
+# Restored monitors start at random moments within this window, seconds
+RESTORE_STAGGER_WINDOW = float(os.getenv('RZD_TICKETS_MONITOR_BOT_RESTORE_WINDOW', 60))
+
+# Telegram user IDs allowed to use /profile and /tasks, comma separated
+ADMIN_IDS = {int(i) for i in os.getenv('RZD_TICKETS_MONITOR_BOT_ADMIN_IDS', '').split(',') if i.strip()}
+
+MAX_MONITORS_PER_USER = int(os.getenv('RZD_TICKETS_MONITOR_MAX_MONITORS_PER_USER', 5))
+CANCEL_ALL_ARG = 'all'
+
 __all__ = [
     'API_TOKEN',
     'API_TOKEN_ENV',
@@ -35,4 +69,9 @@ __all__ = [
     'DATE_FORMAT',
     'MIN_SUGGESTS_SIMILARITY',
     'SUGGESTS_LIMIT',
+    'MAX_MONITORS_PER_USER',
+    'CANCEL_ALL_ARG',
+    'STORAGE_PATH',
+    'RESTORE_STAGGER_WINDOW',
+    'ADMIN_IDS',
 ]
@@ -41,8 +41,11 @@ DATE_ERROR_TEMPLATE = (
     'Invalid date! The date must be between {} and {}!'
 )
 
-ANOTHER_MONITOR_IS_RUN = 'Another monitor is running. Cancel it first: /cancel'
+MONITORS_QUOTA_EXCEEDED_TEMPLATE = (
+    'You already have {} active monitors. Cancel one first: /cancel <id>'
+)
 MONITOR_IS_SHUT_DOWN = 'Monitor is shut *down*.'
+MONITOR_PREFIX_TEMPLATE = 'Monitor #{}: '
 
 HELP_STRING = (
     'Hi!\n'
@@ -52,12 +55,23 @@ HELP_STRING = (
     'Source code:\n'
     'https://github.com/ojgenbar/RZDTicketsMonitor\n\n'
     'Type /set to set new monitor\n'
-    'Type /cancel to cancel current monitor\n'
+    'Type /status to list your monitors\n'
+    'Type /cancel <id> to cancel a monitor, /cancel all to cancel every one\n'
     'Type /help to show this help\n'
 )
 
 CANCELLING_MONITOR = "I'm cancelling current monitor, wait..."
 CANCELLED = 'Cancelled.'
 NOTHING_TO_CANCEL = 'Nothing to cancel.'
+CHOOSE_MONITOR_TO_CANCEL_TEMPLATE = (
+    'Several monitors are running: {}. Use /cancel <id> or /cancel all.'
+)
+MONITOR_NOT_FOUND_TEMPLATE = 'No active monitor with ID {}.'
+STATUS_DOWN = 'Status: RZD Monitor is *down*.'
+STATUS_ACTIVE_TEMPLATE = 'Status: *{}* RZD Monitor(s) *active*.'
+MONITORS_RESTORED_TEMPLATE = 'Bot restarted, {} monitor(s) restored.'
+PROFILING_TEMPLATE = 'Profiling for {:g} sec...'
+PROFILER_BUSY = 'Profiler is already running.'
+PROFILE_SECONDS_ERROR = 'Usage: /profile [seconds]'
 
 SEATS_COUNT_GT_COUPE_SIZE = 'Seats count is greater than coupe size!'
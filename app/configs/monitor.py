@@ -1,4 +1,14 @@
+import os
+
 BASIC_DELAY_BASE = 10
 LAST_COUPE_SEAT = 36
 MAX_FAILS = 20
 SLEEP_AFTER_FAIL_BASE = 30
+
+RANGE_CONCURRENCY = 4
+RANGE_MIN_INTERVAL = 15
+RANGE_MAX_INTERVAL = 600
+
+# Overviews are read from the collector database when it is configured
+COLLECTOR_DB_ENABLED = bool(os.getenv('DB_CONNECTION_STRING'))
+SNAPSHOT_MAX_AGE = int(os.getenv('RZD_TICKETS_MONITOR_SNAPSHOT_MAX_AGE', 60))
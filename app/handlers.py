@@ -1,7 +1,9 @@
+import asyncio
 import datetime
 import functools
 import itertools
 import logging
+import random
 import traceback
 
 import aiogram.utils.markdown as md
@@ -14,44 +16,60 @@ from app import forms
 from app import helpers
 from app import markups
 from app import monitor
+from app import outbound
+from app import registry
+from app import storage
 from app import suggests
 from app.configs import bot as config
 from app.configs import messages
 from rzd_client import common
 from rzd_client import models
+from shared import config as shared_config
+from shared import profiling
 
 logger = logging.getLogger(__name__)
 
 
 async def cmd_help(message: types.Message):
     msg = messages.HELP_STRING
-    await message.reply(msg, reply_markup=markups.DEFAULT_MARKUP)
+    await bot.outbox.reply(message, msg, reply_markup=markups.DEFAULT_MARKUP)
+
+
+def _format_monitor_status(monitor_id, messenger):
+    if messenger.last_time:
+        seconds = (
+            datetime.datetime.now() - messenger.last_time
+        ).total_seconds()
+        last_message = md.text(
+            f'Last attempt:',
+            f'*{seconds:.1f}*',
+            f'seconds ago. {messenger.last_message}',
+        )
+    else:
+        last_message = ''
+    return md.text(
+        f'*#{monitor_id}* Params:',
+        f'`{helpers.dump_to_json(messenger.args.as_rzd_args())}`',
+        last_message,
+        sep='\n',
+    )
 
 
 async def cmd_status(message: types.Message, state: dispatcher.FSMContext):
-    if state.user in bot.messengers and not bot.messengers[state.user].stop:
-        messenger = bot.messengers[state.user]
-        if messenger.last_time:
-            seconds = (
-                datetime.datetime.now() - messenger.last_time
-            ).total_seconds()
-            last_message = md.text(
-                f'Last attempt:',
-                f'*{seconds:.1f}*',
-                f'seconds ago. {messenger.last_message}',
-            )
-        else:
-            last_message = ''
+    active = bot.monitors.active(state.user)
+    if active:
         msg = md.text(
-            'Status: RZD Monitor is *active*.',
-            'Params:',
-            f'`{helpers.dump_to_json(messenger.args.as_rzd_args())}`',
-            last_message,
-            sep='\n',
+            messages.STATUS_ACTIVE_TEMPLATE.format(len(active)),
+            *(
+                _format_monitor_status(monitor_id, messenger)
+                for monitor_id, messenger in sorted(active.items())
+            ),
+            sep='\n\n',
         )
     else:
-        msg = 'Status: RZD Monitor is *down*.'
-    await message.reply(
+        msg = messages.STATUS_DOWN
+    await bot.outbox.reply(
+        message,
         msg,
         reply_markup=markups.DEFAULT_MARKUP,
         parse_mode=ParseMode.MARKDOWN,
@@ -62,9 +80,11 @@ async def cmd_set(message: types.Message, state: dispatcher.FSMContext):
     """
     Setting Monitor entry point
     """
-    if state.user in bot.messengers and not bot.messengers[state.user].stop:
-        msg = messages.ANOTHER_MONITOR_IS_RUN
-        await message.reply(msg, reply_markup=markups.DEFAULT_MARKUP)
+    if bot.monitors.is_full(state.user):
+        msg = messages.MONITORS_QUOTA_EXCEEDED_TEMPLATE.format(
+            bot.monitors.max_per_user,
+        )
+        await bot.outbox.reply(message, msg, reply_markup=markups.DEFAULT_MARKUP)
         return
 
     # Set state
@@ -73,30 +93,74 @@ async def cmd_set(message: types.Message, state: dispatcher.FSMContext):
     days = helpers.nearest_days_string()
     text = messages.QUESTION_DATE_TEMPLATE.format(days[0])
     markup = markups.build_from_list(days)
-    await message.reply(text, reply_markup=markup)
+    await bot.outbox.reply(message, text, reply_markup=markup)
+
+
+def _cancel_monitors(user_id, arg):
+    active = bot.monitors.active(user_id)
+    if arg == config.CANCEL_ALL_ARG:
+        to_cancel = list(active.values())
+    elif arg:
+        try:
+            monitor_id = int(arg.lstrip('#'))
+        except ValueError:
+            return messages.MONITOR_NOT_FOUND_TEMPLATE.format(arg)
+        if monitor_id not in active:
+            return messages.MONITOR_NOT_FOUND_TEMPLATE.format(monitor_id)
+        to_cancel = [active[monitor_id]]
+    elif len(active) > 1:
+        ids = ', '.join(f'#{monitor_id}' for monitor_id in sorted(active))
+        return messages.CHOOSE_MONITOR_TO_CANCEL_TEMPLATE.format(ids)
+    else:
+        to_cancel = list(active.values())
+
+    if not to_cancel:
+        return messages.NOTHING_TO_CANCEL
+    for messenger in to_cancel:
+        messenger.stop = True
+    return messages.CANCELLING_MONITOR
 
 
 async def cmd_cancel(message: types.Message, state: dispatcher.FSMContext):
     """
-    Allow user to cancel any action
+    Allow user to cancel any action or running monitors
     """
+    arg = (message.get_args() or '').strip().lower()
     current_state = await state.get_state()
-    if current_state is None:
-        await message.reply(
-            messages.NOTHING_TO_CANCEL, reply_markup=markups.DEFAULT_MARKUP,
-        )
+    if current_state is not None and not arg:
+        logger.info('Cancelling state %r', current_state)
+        await state.finish()
+        text = messages.CANCELLED
+    else:
+        text = _cancel_monitors(state.user, arg)
+    await bot.outbox.reply(message, text, reply_markup=markups.DEFAULT_MARKUP)
+
+
+async def cmd_profile(message: types.Message):
+    """
+    Admin only: sample stacks of the bot for N seconds, reply with collapsed stacks
+    """
+    arg = (message.get_args() or '').strip()
+    try:
+        seconds = float(arg) if arg else shared_config.PROFILE_SECONDS
+    except ValueError:
+        await bot.outbox.reply(message, messages.PROFILE_SECONDS_ERROR)
+        return
+    seconds = min(seconds, shared_config.PROFILE_MAX_SECONDS)
+    await bot.outbox.reply(message, messages.PROFILING_TEMPLATE.format(seconds))
+    try:
+        path = await profiling.profile(seconds)
+    except profiling.ProfilerBusyError:
+        await bot.outbox.reply(message, messages.PROFILER_BUSY)
         return
+    await bot.outbox.send_document(message.chat.id, types.InputFile(path))
 
-    logger.info('Cancelling state %r', current_state)
-    async with state.proxy():
-        messenger = bot.messengers.get(state.user, None)
-        if messenger:
-            messenger.stop = True
-            text = messages.CANCELLING_MONITOR
-        else:
-            text = messages.CANCELLED
-    await state.finish()
-    await message.reply(text, reply_markup=markups.DEFAULT_MARKUP)
+
+async def cmd_tasks(message: types.Message):
+    """
+    Admin only: reply with loop lag and live asyncio tasks
+    """
+    await bot.outbox.send_document(message.chat.id, types.InputFile(profiling.dump_tasks()))
 
 
 async def process_date(message: types.Message, state: dispatcher.FSMContext):
@@ -105,13 +169,14 @@ async def process_date(message: types.Message, state: dispatcher.FSMContext):
         try:
             date = helpers.parse_and_validate_date(string)
         except ValueError as exc:
-            await message.reply(str(exc).capitalize())
+            await bot.outbox.reply(message, str(exc).capitalize())
             return
-        data['date'] = date
+        # FSM data is kept JSON serializable for persistent storages
+        data['date'] = date.isoformat()
 
     await forms.MonitorParameters.next()
     msg = messages.QUESTION_DEPARTURE_STATION
-    await message.reply(msg, reply_markup=markups.DIRECTIONS_MARKUP)
+    await bot.outbox.reply(message, msg, reply_markup=markups.DIRECTIONS_MARKUP)
 
 
 async def process_departure(
@@ -125,11 +190,11 @@ async def process_departure(
             msg = messages.CANNOT_FIND_EXACT_MATCH
             markup = markups.build_from_list(suggester.suggestions.keys())
         else:
-            data['departure'] = models.Station(suggester.match_id)
+            data['departure'] = suggester.match_id
             await forms.MonitorParameters.next()
             msg = messages.QUESTION_DESTINATION_STATION
             markup = markups.DIRECTIONS_MARKUP
-    await message.reply(msg, reply_markup=markup)
+    await bot.outbox.reply(message, msg, reply_markup=markup)
 
 
 async def _send_trains(send_func, pre_message, trains):
@@ -159,20 +224,23 @@ async def process_destination(
             msg = messages.CANNOT_FIND_EXACT_MATCH
             markup = markups.build_from_list(suggester.suggestions.keys())
         else:
-            await bot.bot.send_message(state.user, messages.WAIT_TRAINS_SEARCH)
-            data['destination'] = models.Station(suggester.match_id)
+            await bot.outbox.send_message(state.user, messages.WAIT_TRAINS_SEARCH)
+            data['destination'] = suggester.match_id
             trains = await suggests.trains(
                 models.TrainsOverviewRequestArgs(
-                    data['departure'], data['destination'], data['date'],
-                )
+                    models.Station(data['departure']),
+                    models.Station(data['destination']),
+                    datetime.date.fromisoformat(data['date']),
+                ),
+                bot.availability_service,
             )
             if not trains:
-                await bot.bot.send_message(state.user, messages.NO_TRAINS)
+                await bot.outbox.send_message(state.user, messages.NO_TRAINS)
                 await cmd_cancel(message, state)
                 return
             await forms.MonitorParameters.next()
             send_function = functools.partial(
-                message.reply, parse_mode=ParseMode.MARKDOWN,
+                bot.outbox.reply, message, parse_mode=ParseMode.MARKDOWN,
             )
             await _send_trains(
                 send_function, messages.AVAILABLE_TRAINS_HEADER, trains,
@@ -183,7 +251,8 @@ async def process_destination(
             markup = markups.build_from_list(
                 number for number in sorted(trains)
             )
-    await message.reply(
+    await bot.outbox.reply(
+        message,
         msg, reply_markup=markup, parse_mode=ParseMode.MARKDOWN,
     )
 
@@ -194,7 +263,8 @@ async def process_train(message: types.Message, state: dispatcher.FSMContext):
 
     await forms.MonitorParameters.next()
     markup = markups.build_from_list(config.SUGGEST_TYPES)
-    await message.reply(
+    await bot.outbox.reply(
+        message,
         messages.QUESTION_CAR_TYPE,
         reply_markup=markup,
         parse_mode=ParseMode.MARKDOWN,
@@ -209,7 +279,8 @@ async def process_car_type(
 
     markup = markups.build_from_list(config.SUGGEST_COUNT)
     await forms.MonitorParameters.next()
-    await message.reply(
+    await bot.outbox.reply(
+        message,
         messages.QUESTION_TICKETS_QUANTITY, reply_markup=markup,
     )
 
@@ -220,24 +291,21 @@ async def process_count(message: types.Message, state: dispatcher.FSMContext):
         try:
             params = helpers.get_params_from_count(string)
         except ValueError as exc:
-            await message.reply(str(exc).capitalize())
+            await bot.outbox.reply(message, str(exc).capitalize())
             return
         data['count'] = params
 
-    await message.reply(messages.STARTING, reply_markup=markups.DEFAULT_MARKUP)
+    await bot.outbox.reply(message, messages.STARTING, reply_markup=markups.DEFAULT_MARKUP)
     await start(message, state)
 
 
 async def start(message, state):
-    async def send_message(msg, **kwargs):
-        await bot.bot.send_message(message.chat.id, msg, **kwargs)
-
     async with state.proxy() as data:
         try:
             rzd_args = models.TrainDetailedRequestArgs(
-                data['departure'],
-                data['destination'],
-                data['date'],
+                models.Station(data['departure']),
+                models.Station(data['destination']),
+                datetime.date.fromisoformat(data['date']),
                 data['train'],
             )
             params = data['count']
@@ -245,47 +313,137 @@ async def start(message, state):
         except Exception:
             traceback.print_exc()
             return
+    await state.finish()
+
+    if bot.monitors.is_full(state.user):
+        msg = messages.MONITORS_QUOTA_EXCEEDED_TEMPLATE.format(
+            bot.monitors.max_per_user,
+        )
+        await bot.outbox.send_message(
+            message.chat.id, msg, reply_markup=markups.DEFAULT_MARKUP,
+        )
+        return
+
+    definition = storage.MonitorDefinition(
+        user_id=state.user,
+        monitor_id=bot.monitors.next_id(state.user),
+        chat_id=message.chat.id,
+        rzd_args=rzd_args.as_rzd_args(),
+        params=params,
+        car_type=car_type.code,
+        prefix=f'@{message.from_user.username} {message.from_user.id} ',
+    )
+    await launch_monitor(definition)
 
-    prefix = f'@{message.from_user.username} {message.from_user.id} '
+
+async def launch_monitor(definition: storage.MonitorDefinition, delay: float = 0):
+    """Register and run a monitor. Restored ones start after ``delay`` seconds."""
+    chat_id = definition.chat_id
+    prefix = definition.prefix
+    rzd_args = models.TrainDetailedRequestArgs.from_rzd_args(definition.rzd_args)
+    car_type = models.ServiceCategory(definition.car_type)
+    params = definition.params
 
     mon = monitor.AsyncMonitor(
         args=rzd_args,
         cars_type=car_type,
-        callback=send_message,
         prefix=prefix,
+        hub=bot.monitor_hub,
+        resumed=bool(delay),
         **params,
     )
-    bot.messengers[state.user] = mon
+    try:
+        monitor_id = bot.monitors.add(
+            definition.user_id, mon, definition.monitor_id,
+        )
+    except registry.QuotaExceededError:
+        msg = messages.MONITORS_QUOTA_EXCEEDED_TEMPLATE.format(
+            bot.monitors.max_per_user,
+        )
+        await bot.outbox.send_message(
+            chat_id, msg, reply_markup=markups.DEFAULT_MARKUP,
+        )
+        return
+    await bot.monitor_store.save(definition)
 
-    msg = md.text(
-        f'`{helpers.dump_to_json(rzd_args.as_rzd_args())}`',
-        f'`{helpers.dump_to_json(params)}`',
-        f'Count: {params["requested_count"]}, car type: {car_type.char_code}',
-        sep='\n',
+    monitor_prefix = messages.MONITOR_PREFIX_TEMPLATE.format(monitor_id)
+
+    async def send_monitor_message(msg, **kwargs):
+        # Notifications are queued, not awaited, so a slow chat never stalls polling
+        bot.outbox.notify(chat_id, f'{monitor_prefix}{msg}', **kwargs)
+
+    mon.callback = send_monitor_message
+    mon.log_prefix = f'{prefix}#{monitor_id} '
+
+    if not delay:
+        msg = md.text(
+            f'*#{monitor_id}*',
+            f'`{helpers.dump_to_json(rzd_args.as_rzd_args())}`',
+            f'`{helpers.dump_to_json(params)}`',
+            f'Count: {params["requested_count"]}, car type: {car_type.char_code}',
+            sep='\n',
+        )
+        logger.info('%s%s', prefix, msg)
+        await bot.outbox.send_message(chat_id, msg, parse_mode=ParseMode.MARKDOWN)
+        await send_message_to_logs(f'{prefix}\n{msg}')
+    bot.monitors.spawn(
+        _run_monitor(
+            mon, definition.user_id, monitor_id, send_monitor_message, prefix, delay,
+        ),
+        name=f'monitor-{definition.user_id}-{monitor_id}',
     )
-    logger.info(f'{prefix}{msg}')
-    await send_message(msg, parse_mode=ParseMode.MARKDOWN)
-    await send_message_to_logs(f'{prefix}\n{msg}')
+
+
+async def _run_monitor(mon, user_id, monitor_id, send_message, prefix, delay=0):
+    if delay:
+        try:
+            # Cancelling during the delay still goes through the normal shutdown
+            await asyncio.wait_for(mon.wait_stopped(), delay)
+        except asyncio.TimeoutError:
+            pass
     try:
-        await mon.run()
+        if not mon.stop:
+            await mon.run()
         await send_message(
             messages.MONITOR_IS_SHUT_DOWN, parse_mode=ParseMode.MARKDOWN,
         )
     except common.RZDNegativeResponse as e:
         msg = messages.FAILED_TO_START_TEMPLATE.format(str(e))
         await send_message(msg)
+    finally:
+        bot.monitors.remove(user_id, monitor_id)
+    # Not reached on shutdown (cancellation), so the monitor is restored on start
+    await bot.monitor_store.delete(user_id, monitor_id)
 
-    await state.finish()
-    bot.messengers.pop(state.user, None)
     await send_message(messages.CANCELLED, reply_markup=markups.DEFAULT_MARKUP)
-    await send_message_to_logs(f'{prefix}\n{messages.CANCELLED}')
+    await send_message_to_logs(f'{prefix}#{monitor_id}\n{messages.CANCELLED}')
+
+
+async def restore_monitors(window: float = config.RESTORE_STAGGER_WINDOW):
+    """
+    Start monitors saved before restart, spread over ``window`` seconds
+    so that a redeploy does not hit RZD with all of them at once
+    """
+    definitions = await bot.monitor_store.load_all()
+    today = datetime.date.today()
+    restored = 0
+    for definition in definitions:
+        args = models.TrainDetailedRequestArgs.from_rzd_args(definition.rzd_args)
+        if args.departure_date < today:
+            await bot.monitor_store.delete(definition.user_id, definition.monitor_id)
+            continue
+        delay = max(window * random.random(), 0.1)
+        await launch_monitor(definition, delay=delay)
+        restored += 1
+    logger.info('Restored %d monitors', restored)
+    await send_message_to_logs(messages.MONITORS_RESTORED_TEMPLATE.format(restored))
 
 
 async def unexpected_text(message: types.Message):
-    await message.reply(messages.UNEXPECTED_TEXT)
+    await bot.outbox.reply(message, messages.UNEXPECTED_TEXT)
 
 
-async def send_message_to_logs(*args, **kwargs):
+async def send_message_to_logs(text, **kwargs):
     if not config.LOGS_CHANNEL:
         return
-    await bot.bot.send_message(config.LOGS_CHANNEL, *args, **kwargs)
+    bot.outbox.notify(config.LOGS_CHANNEL, text, priority=outbound.LOGS, **kwargs)
@@ -0,0 +1,235 @@
+import asyncio
+import collections
+import logging
+import random
+import typing
+
+from app import monitor
+from app.configs import monitor as config
+from rzd_client import client
+from rzd_client import models
+from rzd_client import resilience
+from rzd_client import tracing
+from shared import metrics
+
+logger = logging.getLogger(__name__)
+
+UNIQUE_ROUTES = metrics.Gauge('bot_hub_routes', 'Unique route/date overviews polled by MonitorHub.')
+UNIQUE_TRAINS = metrics.Gauge('bot_hub_trains', 'Unique trains polled by MonitorHub.')
+DETAILED_DECISIONS = metrics.Counter(
+    'bot_hub_detailed_decisions_total', 'Whether the overview triggered a seat map fetch.', ('decision',),
+)
+
+
+async def _dispatch(coros):
+    results = await asyncio.gather(*coros, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning('Monitor callback failed: %r', result)
+
+
+class _TrainPoller:
+    """Holds all subscribers of one train and fetches its seat map on demand."""
+
+    def __init__(self, hub: 'MonitorHub', args: models.TrainDetailedRequestArgs):
+        self._hub = hub
+        self.args = args
+        # Monitors grouped by filter: evaluation cost depends on unique filters only
+        self.groups: typing.Dict[monitor.SeatsFilter, typing.Set[monitor.AsyncMonitor]] = (
+            collections.defaultdict(set)
+        )
+
+    def __len__(self):
+        return sum(len(monitors) for monitors in self.groups.values())
+
+    def add(self, monitor_: monitor.AsyncMonitor):
+        self.groups[monitor_.seats_filter].add(monitor_)
+
+    def remove(self, monitor_: monitor.AsyncMonitor):
+        monitors = self.groups.get(monitor_.seats_filter)
+        if monitors is None:
+            return
+        monitors.discard(monitor_)
+        if not monitors:
+            del self.groups[monitor_.seats_filter]
+
+    def all_monitors(self) -> typing.List[monitor.AsyncMonitor]:
+        return [m for monitors in self.groups.values() for m in monitors]
+
+    @staticmethod
+    def _free_seats(overview: models.TrainOverview) -> typing.Dict[int, int]:
+        return {c.category.code: c.free_seats for c in overview.service_categories}
+
+    def is_triggered(self, overview: models.TrainOverview) -> bool:
+        free_seats = self._free_seats(overview)
+        return any(
+            free_seats.get(filter_.cars_type_code, 0) >= filter_.requested_count
+            for filter_ in self.groups
+        )
+
+    async def skip(self, overview: models.TrainOverview):
+        free_seats = self._free_seats(overview)
+        await _dispatch(
+            m.process_overview(free_seats.get(filter_.cars_type_code, 0))
+            for filter_, monitors in list(self.groups.items())
+            for m in list(monitors)
+        )
+
+    async def _evaluate(self, train: models.TrainDetailed):
+        cars_by_category = collections.defaultdict(list)
+        for car in train.cars:
+            cars_by_category[car.category.code].append(car)
+
+        coros = []
+        for filter_, monitors in list(self.groups.items()):
+            seats = filter_.matching_seats(cars_by_category.get(filter_.cars_type_code, ()))
+            tickets = sum(map(len, seats.values()))
+            coros.extend(m.process_train(train, tickets, seats) for m in list(monitors))
+        await _dispatch(coros)
+
+    async def poll_detailed(self):
+        try:
+            client_ = await self._hub.get_client()
+            train = await client_.fetch_train_detailed(args=self.args)
+        except resilience.CircuitOpenError as e:
+            # RZD is down for everybody, not a failure of these monitors
+            logger.info('Skip train %s: %s', self.args, e)
+            return
+        except Exception:
+            logger.warning('Cannot fetch train %s', self.args, exc_info=True)
+            await _dispatch(m.process_error() for m in self.all_monitors())
+            return
+        await self._evaluate(train)
+
+
+class _RoutePoller:
+    """Polls the cheap overview of one route/date and fetches seat maps only when needed."""
+
+    def __init__(self, hub: 'MonitorHub', args: models.TrainsOverviewRequestArgs):
+        self._hub = hub
+        self.args = args
+        self.trains: typing.Dict[models.TrainDetailedRequestArgs, _TrainPoller] = {}
+        self._fails_count = 0
+        self._task: typing.Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return sum(len(poller) for poller in self.trains.values())
+
+    def add(self, monitor_: monitor.AsyncMonitor):
+        poller = self.trains.get(monitor_.args)
+        if poller is None:
+            poller = self.trains[monitor_.args] = _TrainPoller(self._hub, monitor_.args)
+        poller.add(monitor_)
+        # The loop ends when it finds the route empty, e.g. between remove() and add()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name=f'hub-route-{self.args.departure_date}')
+
+    def remove(self, monitor_: monitor.AsyncMonitor):
+        poller = self.trains.get(monitor_.args)
+        if poller is None:
+            return
+        poller.remove(monitor_)
+        if not len(poller):
+            del self.trains[monitor_.args]
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def poll_once(self) -> float:
+        """Run one polling round. Returns an extra delay after failures."""
+        try:
+            overview = await self._hub.fetch_trains_overview(self.args)
+        except resilience.CircuitOpenError as e:
+            logger.info('Skip overview %s: %s', self.args, e)
+            return e.retry_in
+        except Exception:
+            logger.warning('Cannot fetch overview %s', self.args, exc_info=True)
+            delay = self._fails_count * config.SLEEP_AFTER_FAIL_BASE
+            self._fails_count += 1
+            await _dispatch(m.process_error() for p in list(self.trains.values()) for m in p.all_monitors())
+            return delay
+        self._fails_count = 0
+
+        overview_by_number = {train.number: train for train in overview}
+        coros = []
+        for poller in list(self.trains.values()):
+            train = overview_by_number.get(poller.args.train_number)
+            if train is not None and not poller.is_triggered(train):
+                DETAILED_DECISIONS.inc('skipped')
+                coros.append(poller.skip(train))
+            else:
+                # Enough seats, or the train is missing in the overview: check the seat map
+                DETAILED_DECISIONS.inc('fetched')
+                coros.append(poller.poll_detailed())
+        await asyncio.gather(*coros)
+        return 0
+
+    async def _run(self):
+        while len(self):
+            delay = await self.poll_once()
+            await asyncio.sleep(delay + 5 + self._hub.delay_base * random.random())
+
+
+class MonitorHub:
+    """Multiplexes monitors of all users onto shared overview and seat map fetches."""
+
+    def __init__(self, delay_base=config.BASIC_DELAY_BASE, availability=None, client_=None):
+        self.delay_base = delay_base
+        self.availability = availability
+        self._routes: typing.Dict[models.TrainsOverviewRequestArgs, _RoutePoller] = {}
+        # A given client is shared with others and is not closed by the hub
+        self._client: typing.Optional[client.RZDClient] = client_
+        self._owns_client = client_ is None
+        self._client_lock = asyncio.Lock()
+
+    def __len__(self):
+        return sum(len(route) for route in self._routes.values())
+
+    def _update_gauges(self):
+        UNIQUE_ROUTES.set(len(self._routes))
+        UNIQUE_TRAINS.set(sum(len(route.trains) for route in self._routes.values()))
+
+    async def get_client(self) -> client.RZDClient:
+        async with self._client_lock:
+            if self._client is None:
+                self._client = await client.RZDClient(caller=tracing.CALLER_MONITOR).__aenter__()
+        return self._client
+
+    async def fetch_trains_overview(
+            self, args: models.TrainsOverviewRequestArgs,
+    ) -> typing.List[models.TrainOverview]:
+        client_ = await self.get_client()
+        if self.availability is None:
+            return await client_.fetch_trains_overview(args)
+        return await self.availability.fetch_trains_overview(args, client_)
+
+    def subscribe(self, monitor_: monitor.AsyncMonitor):
+        route_args = monitor_.args.as_overview_args()
+        route = self._routes.get(route_args)
+        if route is None:
+            route = self._routes[route_args] = _RoutePoller(self, route_args)
+            if self.availability is not None:
+                self.availability.register_demand(route_args)
+        route.add(monitor_)
+        self._update_gauges()
+
+    def unsubscribe(self, monitor_: monitor.AsyncMonitor):
+        route_args = monitor_.args.as_overview_args()
+        route = self._routes.get(route_args)
+        if route is None:
+            return
+        route.remove(monitor_)
+        if not len(route):
+            route.cancel()
+            del self._routes[route_args]
+        self._update_gauges()
+
+    async def close(self):
+        for route in self._routes.values():
+            route.cancel()
+        self._routes.clear()
+        self._update_gauges()
+        if self._client is not None and self._owns_client:
+            await self._client.__aexit__(None, None, None)
+            self._client = None
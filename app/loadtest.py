@@ -0,0 +1,333 @@
+"""
+Load test of the bot: simulated users go through the /set conversation via
+the real dispatcher and handlers, Telegram and RZD are local fakes.
+"""
+import asyncio
+import collections
+import dataclasses
+import datetime
+import gc
+import itertools
+import logging
+import os
+import random
+import resource
+import time
+import typing
+
+from aiogram import Bot, Dispatcher
+from aiogram import types
+from aiohttp import web
+
+from app import bot
+from app.configs import bot as bot_config
+from rzd_client import config as rzd_config
+from rzd_client import scheduler
+from rzd_client import tracing
+
+logger = logging.getLogger(__name__)
+
+FAKE_TOKEN = '123456:ABCDEFabcdef'
+STATIONS = {
+    'МОСКВА': 2000000,
+    'САНКТ-ПЕТЕРБУРГ': 2004000,
+    'ЧЕРЕПОВЕЦ 1': 2010290,
+    'ТВЕРЬ': 2004600,
+    'ЯРОСЛАВЛЬ': 2010000,
+    'НИЖНИЙ НОВГОРОД': 2060001,
+    'КАЗАНЬ': 2060500,
+    'ВОЛОГДА 1': 2010250,
+}
+STEPS = ('set', 'date', 'departure', 'destination', 'train', 'car_type', 'count')
+
+
+@dataclasses.dataclass
+class Options:
+    users: int = 1000
+    ramp_up: float = 10
+    think_time: float = 1
+    hold: float = 30
+    trains_per_route: int = 10
+    dates: int = 30
+    availability: float = 0.05
+    telegram_latency: float = 0.05
+    rzd_latency: float = 0.2
+    rzd_rate: float = 1000
+    outbox_workers: int = bot_config.OUTBOX_WORKERS
+    outbox_rate: float = bot_config.OUTBOX_GLOBAL_RATE
+
+
+def percentiles(values: typing.Sequence[float], points=(0.5, 0.9, 0.99)) -> typing.Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    res = {f'p{round(p * 100)}': ordered[min(int(p * len(ordered)), len(ordered) - 1)] for p in points}
+    res['max'] = ordered[-1]
+    return res
+
+
+def rss_bytes() -> int:
+    """Current resident memory; peak resident memory where /proc is absent."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class FakeTelegram(Bot):
+    """Answers Bot API calls locally after ``latency`` seconds."""
+
+    def __init__(self, latency: float):
+        super().__init__(token=FAKE_TOKEN)
+        self.latency = latency
+        self.calls: typing.Counter[str] = collections.Counter()
+        self._message_ids = itertools.count(1)
+
+    async def request(self, method, data=None, *args, **kwargs):
+        self.calls[method] += 1
+        await asyncio.sleep(self.latency)
+        if method != 'sendMessage':
+            return True
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': int(data['chat_id']), 'type': 'private'},
+            'text': data.get('text'),
+        }
+
+
+class FakeRZD:
+    """RZD endpoints with generated trains, served on a local port."""
+
+    def __init__(self, options: Options):
+        self.options = options
+        self.requests: typing.Counter[str] = collections.Counter()
+        self._runner: typing.Optional[web.AppRunner] = None
+
+    @staticmethod
+    def train_numbers(count: int) -> typing.List[str]:
+        return [f'{i:03d}А' for i in range(1, count + 1)]
+
+    def _train(self, number, code0, code1, date, free_seats):
+        return {
+            'number': number,
+            'code0': code0,
+            'code1': code1,
+            'station0': 'A',
+            'station1': 'B',
+            'route0': 'A',
+            'route1': 'B',
+            'timeInWay': '10:00',
+            'date0': date,
+            'time0': '10:00',
+            'date1': date,
+            'time1': '20:00',
+            'serviceCategories': [
+                {'typeCarNumCode': code, 'freeSeats': free_seats, 'price': 1000}
+                for code in (1, 2, 3)
+            ],
+        }
+
+    def _free_seats(self) -> int:
+        return random.randint(1, 8) if random.random() < self.options.availability else 0
+
+    async def _delay(self, endpoint):
+        self.requests[endpoint] += 1
+        await asyncio.sleep(self.options.rzd_latency * random.uniform(0.5, 1.5))
+
+    async def handle_suggests(self, request: web.Request) -> web.Response:
+        await self._delay(tracing.ENDPOINT_SUGGESTS)
+        part = request.query['stationNamePart']
+        return web.json_response([{'n': name, 'c': code} for name, code in STATIONS.items() if name.startswith(part)])
+
+    async def handle_overview(self, request: web.Request) -> web.Response:
+        await self._delay(tracing.ENDPOINT_OVERVIEW)
+        data = await request.post()
+        trains = [
+            self._train(number, data['code0'], data['code1'], data['dt0'], self._free_seats())
+            for number in self.train_numbers(self.options.trains_per_route)
+        ]
+        return web.json_response({'result': 'OK', 'tp': [{'list': trains}]})
+
+    async def handle_detailed(self, request: web.Request) -> web.Response:
+        await self._delay(tracing.ENDPOINT_DETAILED)
+        data = await request.post()
+        train = self._train(data['tnum0'], data['code0'], data['code1'], data['dt0'], 0)
+        seats = self._free_seats()
+        train['cars'] = [
+            {'ctypei': code, 'cnumber': f'0{code}', 'places': f'001-{seats:03d}'}
+            for code in (1, 2, 3)
+        ] if seats else []
+        return web.json_response({'result': 'OK', 'lst': [train]})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/suggests', self.handle_suggests)
+        app.router.add_post('/overview', self.handle_overview)
+        app.router.add_post('/detailed', self.handle_detailed)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '127.0.0.1', 0).start()
+        host, port = self._runner.addresses[0][:2]
+        base = f'http://{host}:{port}'
+        rzd_config.SUGGESTS_BASE_URL = f'{base}/suggests'
+        rzd_config.SUGGEST_TRAINS_URL = f'{base}/overview'
+        rzd_config.BASE_URL = f'{base}/detailed'
+
+    async def close(self):
+        await self._runner.cleanup()
+
+
+class LoopLagSampler:
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: typing.List[float] = []
+        self._task: typing.Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(time.monotonic() - started - self.interval, 0.0))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name='loadtest-loop-lag')
+
+    def stop(self):
+        self._task.cancel()
+
+
+class LoadTest:
+    def __init__(self, options: Options):
+        self.options = options
+        self.latencies: typing.Dict[str, typing.List[float]] = {step: [] for step in STEPS}
+        self.errors = 0
+        self.completed = 0
+        self._update_ids = itertools.count(1)
+        self._dispatcher: typing.Optional[Dispatcher] = None
+
+    def _update(self, user_id: int, text: str) -> types.Update:
+        update_id = next(self._update_ids)
+        user = {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'}
+        return types.Update.to_object({
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': user,
+                'text': text,
+            },
+        })
+
+    async def _send(self, user_id: int, step: str, text: str):
+        started = time.monotonic()
+        try:
+            # Like polling: every update is handled in its own task and context
+            await self._dispatcher.process_updates([self._update(user_id, text)])
+        except Exception:
+            self.errors += 1
+            logger.exception('Update of user %s failed at %s', user_id, step)
+        finally:
+            self.latencies[step].append(time.monotonic() - started)
+
+    def _conversation(self) -> typing.List[typing.Tuple[str, str]]:
+        departure, destination = random.sample(list(STATIONS), 2)
+        date = datetime.date.today() + datetime.timedelta(days=random.randint(1, self.options.dates))
+        return list(zip(STEPS, (
+            '/set',
+            date.strftime(bot_config.DATE_FORMAT),
+            departure,
+            destination,
+            random.choice(FakeRZD.train_numbers(self.options.trains_per_route)),
+            random.choice(bot_config.SUGGEST_TYPES),
+            '1',
+        )))
+
+    async def _user(self, user_id: int, delay: float):
+        await asyncio.sleep(delay)
+        for step, text in self._conversation():
+            await self._send(user_id, step, text)
+            await asyncio.sleep(random.uniform(0, self.options.think_time))
+        self.completed += 1
+
+    async def run(self) -> dict:
+        options = self.options
+        telegram = FakeTelegram(options.telegram_latency)
+        rzd = FakeRZD(options)
+        await rzd.start()
+        # Real RZD limits are not the subject here
+        scheduler.SCHEDULER = scheduler.RequestScheduler(rate=options.rzd_rate, burst=options.rzd_rate)
+        self._dispatcher = bot.setup(
+            telegram,
+            storage_path=None,
+            workers=options.outbox_workers,
+            global_rate=options.outbox_rate,
+            global_burst=max(options.outbox_rate, bot_config.OUTBOX_GLOBAL_BURST),
+        )
+        Bot.set_current(telegram)
+        Dispatcher.set_current(self._dispatcher)
+
+        lag = LoopLagSampler()
+        lag.start()
+        gc.collect()
+        rss_before = rss_bytes()
+        started = time.monotonic()
+        await asyncio.gather(*(
+            self._user(user_id, options.ramp_up * user_id / options.users)
+            for user_id in range(1, options.users + 1)
+        ))
+        conversations_time = time.monotonic() - started
+        await asyncio.sleep(options.hold)
+        gc.collect()
+        rss_after = rss_bytes()
+        active = len(bot.monitor_hub)
+        lag.stop()
+
+        await self._shutdown()
+        await rzd.close()
+
+        all_latencies = [value for values in self.latencies.values() for value in values]
+        return {
+            'users': options.users,
+            'completed_conversations': self.completed,
+            'conversations_seconds': conversations_time,
+            'handler_errors': self.errors,
+            'handler_latency': percentiles(all_latencies),
+            'handler_latency_by_step': {step: percentiles(values) for step, values in self.latencies.items()},
+            'active_monitors': active,
+            'rss_growth_bytes': rss_after - rss_before,
+            'bytes_per_monitor': (rss_after - rss_before) / active if active else None,
+            'loop_lag': percentiles(lag.samples),
+            'telegram_calls': dict(telegram.calls),
+            'rzd_requests': dict(rzd.requests),
+        }
+
+    @staticmethod
+    async def _shutdown():
+        await bot.monitors.stop_all()
+        await bot.monitor_hub.close()
+        await bot.outbox.close()
+
+
+def format_report(report: dict) -> str:
+    def ms(stats):
+        return ', '.join(f'{name} {value * 1000:.1f} ms' for name, value in stats.items()) or 'no data'
+
+    lines = [
+        f"Users: {report['users']}, conversations completed: {report['completed_conversations']} "
+        f"in {report['conversations_seconds']:.1f} s, handler errors: {report['handler_errors']}",
+        f"Handler latency: {ms(report['handler_latency'])}",
+    ]
+    for step, stats in report['handler_latency_by_step'].items():
+        lines.append(f'  {step:<12} {ms(stats)}')
+    per_monitor = report['bytes_per_monitor']
+    lines.append(
+        f"Active monitors: {report['active_monitors']}, RSS growth {report['rss_growth_bytes'] / 2 ** 20:.1f} MiB"
+        + (f', {per_monitor / 1024:.1f} KiB per monitor' if per_monitor is not None else '')
+    )
+    lines.append(f"Loop lag: {ms(report['loop_lag'])}")
+    lines.append(f"Telegram calls: {report['telegram_calls']}")
+    lines.append(f"RZD requests: {report['rzd_requests']}")
+    return '\n'.join(lines)
@@ -1,17 +1,102 @@
 import asyncio
+import dataclasses
 import datetime
 import itertools
 import logging
-import random
-import traceback
+import typing
 
 from app.configs import monitor as config
-from rzd_client import client
 from rzd_client import models
 from rzd_client import common
+from shared import metrics
 
 logger = logging.getLogger(__name__)
 
+ACTIVE_MONITORS = metrics.Gauge('bot_active_monitors', 'Running AsyncMonitor instances.')
+
+# car number -> numbers of matching free seats
+SeatsState = typing.Dict[str, typing.Tuple[int, ...]]
+
+
+@dataclasses.dataclass(frozen=True)
+class SeatsFilter:
+    """Hashable seat filter, so monitors with equal filters can share evaluation."""
+    cars_type_code: int
+    requested_count: int = 1
+    mask: typing.Optional[typing.Tuple[bool, ...]] = None
+    same_coupe: bool = False
+    coupe_size: int = 4
+
+    def matching_seats_in_car(self, car: models.Car) -> typing.Tuple[int, ...]:
+        """Numbers of free seats that pass the mask and coupe rules."""
+        if self.mask:
+            projected = [i1 and i2 for i1, i2 in zip(self.mask, car.seats)]
+            projected.extend(car.seats[len(self.mask):])
+        else:
+            projected = car.seats
+
+        if not (self.same_coupe and self.requested_count > 1):
+            return tuple(i + 1 for i, free in enumerate(projected) if free)
+
+        res = []
+        coupe_part = itertools.islice(projected, config.LAST_COUPE_SEAT)
+        for n, coupe in enumerate(common.grouper_it(self.coupe_size, coupe_part)):
+            first_seat = n * self.coupe_size + 1
+            coupe_seats = [first_seat + i for i, free in enumerate(coupe) if free]
+            if len(coupe_seats) >= self.requested_count:
+                res.extend(coupe_seats)
+        return tuple(res)
+
+    def seats_count_in_car(self, car: models.Car) -> int:
+        return len(self.matching_seats_in_car(car))
+
+    def matching_seats(self, cars: typing.Iterable[models.Car]) -> SeatsState:
+        """Matching seats by car number, for cars already known to be of the wanted category."""
+        res = {}
+        for car in cars:
+            seats = self.matching_seats_in_car(car)
+            if seats:
+                res[car.number] = res.get(car.number, ()) + seats
+        return res
+
+    def count_tickets_in_cars(self, cars: typing.Iterable[models.Car]) -> int:
+        """Count tickets in cars already known to be of the wanted category."""
+        return sum(self.seats_count_in_car(car) for car in cars)
+
+    def count_tickets(self, train: models.TrainDetailed) -> int:
+        return self.count_tickets_in_cars(self.wanted_cars(train))
+
+    def wanted_cars(self, train: models.TrainDetailed) -> typing.List[models.Car]:
+        return [car for car in train.cars if car.category.code == self.cars_type_code]
+
+
+def _format_seats(seats: typing.Iterable[int]) -> str:
+    """``[13, 14, 20]`` -> ``'seats 13–14, 20'``"""
+    seats = sorted(seats)
+    ranges = []
+    for seat in seats:
+        if ranges and ranges[-1][1] == seat - 1:
+            ranges[-1][1] = seat
+        else:
+            ranges.append([seat, seat])
+    parts = (str(a) if a == b else f'{a}–{b}' for a, b in ranges)
+    return ('seats ' if len(seats) > 1 else 'seat ') + ', '.join(parts)
+
+
+def diff_seats(old: SeatsState, new: SeatsState) -> typing.List[str]:
+    """Short description of what changed, e.g. ``'+2 in car 07, seats 13–14'``."""
+    lines = []
+    for car in sorted(set(old) | set(new)):
+        old_seats = set(old.get(car, ()))
+        new_seats = set(new.get(car, ()))
+        added = new_seats - old_seats
+        removed = old_seats - new_seats
+        if added:
+            lines.append(f'+{len(added)} in car {car}, {_format_seats(added)}')
+        if removed:
+            lines.append(f'-{len(removed)} in car {car}, {_format_seats(removed)}')
+    return lines
+
 
 class AsyncMonitor:
     def __init__(
@@ -26,6 +111,8 @@ class AsyncMonitor:
             delay_base=config.BASIC_DELAY_BASE,
             callback=None,
             prefix='',
+            hub=None,
+            resumed=False,
     ):
         self.args = args
         self.requested_count = requested_count
@@ -36,72 +123,122 @@ class AsyncMonitor:
         self.delay_base = delay_base
         self.callback = callback or self.default_callback
         self.log_prefix = prefix
+        self.hub = hub
 
-        self.stop = False
+        self.seats_filter = SeatsFilter(
+            cars_type_code=cars_type.code,
+            requested_count=requested_count,
+            mask=tuple(mask) if mask else None,
+            same_coupe=same_coupe,
+            coupe_size=coupe_size,
+        )
+
+        self._stopped = asyncio.Event()
         self.last_message = None
         self.last_time = None
+        self.fails_count = 0
+        # A restored monitor is not new: available tickets are notified, not a reason to stop
+        self._first_request = not resumed
+        # Last evaluated matching seats; None until the first seat map
+        self.last_seats: typing.Optional[SeatsState] = None
+
+    @property
+    def stop(self) -> bool:
+        return self._stopped.is_set()
+
+    @stop.setter
+    def stop(self, value: bool):
+        if value:
+            self._stopped.set()
+
+    @property
+    def available(self) -> bool:
+        """Enough matching seats in the last seat map."""
+        return self._is_available(self.last_seats)
+
+    async def wait_stopped(self):
+        await self._stopped.wait()
 
     @staticmethod
     async def default_callback(string):
         logger.info(string)
 
     def _get_seats_count_in_car(self, car: models.Car):
+        return self.seats_filter.seats_count_in_car(car)
 
-        if self.mask:
-            projected = [i1 and i2 for i1, i2 in zip(self.mask, car.seats)]
-            projected.extend(car.seats[len(self.mask):])
-        else:
-            projected = car.seats
+    def _count_tickets_filtered(self, train: models.TrainDetailed) -> int:
+        return self.seats_filter.count_tickets(train)
 
-        count = sum(projected)
-        if self.same_coupe and self.requested_count > 1:
-            if count < self.requested_count:
-                return 0
-            count = 0
-            coupe_part = itertools.islice(projected, config.LAST_COUPE_SEAT)
-            for coupe in common.grouper_it(self.coupe_size, coupe_part):
-                coupe_seats = sum(coupe)
-                if coupe_seats >= self.requested_count:
-                    count += coupe_seats
-        return count
+    def _is_available(self, seats: typing.Optional[SeatsState]) -> bool:
+        return seats is not None and sum(map(len, seats.values())) >= self.requested_count
 
-    def _count_tickets_filtered(self, train: models.TrainDetailed) -> int:
-        total = sum(
-            self._get_seats_count_in_car(car)
-            for car in train.cars
-            if car.category.code == self.cars_type.code
-        )
-        return total
+    async def _update_seats(self, seats: SeatsState, msg: str):
+        """Notify only when availability crosses the threshold or matching seats change."""
+        previous, self.last_seats = self.last_seats, seats
+        was_available = self._is_available(previous)
+        if self._is_available(seats):
+            if not was_available:
+                lines = diff_seats({}, seats)
+            else:
+                lines = diff_seats(previous, seats)
+                if not lines:
+                    return
+            await self.callback('\n'.join((msg, *lines)))
+        elif was_available:
+            await self.callback(f'{msg}, not enough anymore')
+
+    async def process_train(
+            self,
+            train: models.TrainDetailed,
+            tickets: typing.Optional[int] = None,
+            seats: typing.Optional[SeatsState] = None,
+    ):
+        """Handle one fetched train. ``tickets`` and ``seats`` may be precomputed by the caller."""
+        if seats is None:
+            seats = self.seats_filter.matching_seats(self.seats_filter.wanted_cars(train))
+        if tickets is None:
+            tickets = sum(map(len, seats.values()))
+        msg = f'Total: {tickets} tickets'
+        self.last_message = msg
+        self.last_time = datetime.datetime.now()
+        self.fails_count = 0
+        logger.info('%s%s', self.log_prefix, msg)
+
+        first_request, self._first_request = self._first_request, False
+        await self._update_seats(seats, msg)
+        if first_request and self._is_available(seats):
+            self.stop = True
+
+    async def process_overview(self, free_seats: int):
+        """Handle a round where the overview shows too few seats to bother with the seat map."""
+        msg = f'Overview: {free_seats} free seats'
+        self.last_message = msg
+        self.last_time = datetime.datetime.now()
+        self.fails_count = 0
+        self._first_request = False
+        logger.info('%s%s', self.log_prefix, msg)
+        if self.last_seats is not None:
+            await self._update_seats({}, msg)
+
+    async def process_error(self):
+        self.fails_count += 1
+        if self.fails_count >= config.MAX_FAILS:
+            msg = 'Exceeded max fails count. Stopping...'
+            logger.warning('%s%s', self.log_prefix, msg)
+            await self.callback(msg)
+            self.stop = True
 
     async def run(self):
-        first_request = True
-        fails_count = 0
-        async with client.RZDClient() as client_:
-            while not self.stop:
-                if fails_count >= config.MAX_FAILS:
-                    msg = 'Exceeded max fails count. Stopping...'
-                    logger.warning(msg)
-                    await self.callback(msg)
-                    return
-                try:
-                    train = await client_.fetch_train_detailed(args=self.args)
-                    tickets = self._count_tickets_filtered(train)
-                    msg = f'Total: {tickets} tickets'
-                    self.last_message = msg
-                    self.last_time = datetime.datetime.now()
-                    logger.info(f'{self.log_prefix}{msg}')
-                    if tickets >= self.requested_count:
-                        await self.callback(msg)
-                        if first_request:
-                            return
-                        await asyncio.sleep(120 + self.delay_base * random.random())
-                    first_request = False
-                    fails_count = 0
-                except Exception:
-                    logger.warning(traceback.format_exc())
-                    delay = fails_count * config.SLEEP_AFTER_FAIL_BASE
-                    logger.info(f'Sleeping {delay} seconds...')
-                    await asyncio.sleep(delay)
-                    fails_count += 1
-                finally:
-                    await asyncio.sleep(5 + self.delay_base * random.random())
+        # Imported here: the hub module depends on this one
+        from app import hub
+
+        hub_ = self.hub if self.hub is not None else hub.MonitorHub(delay_base=self.delay_base)
+        ACTIVE_MONITORS.inc()
+        hub_.subscribe(self)
+        try:
+            await self._stopped.wait()
+        finally:
+            hub_.unsubscribe(self)
+            ACTIVE_MONITORS.dec()
+            if self.hub is None:
+                await hub_.close()
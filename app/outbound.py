@@ -0,0 +1,268 @@
+import asyncio
+import bisect
+import dataclasses
+import itertools
+import logging
+import time
+import typing
+
+from aiogram.utils import exceptions
+
+from app.configs import bot as config
+from shared import metrics
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+NOTIFICATION = 1
+LOGS = 2
+_PRIORITY_NAMES = {INTERACTIVE: 'interactive', NOTIFICATION: 'notification', LOGS: 'logs'}
+
+QUEUE_SIZE = metrics.Gauge('bot_outbox_queue_size', 'Messages waiting in the outbox.')
+SENT = metrics.Counter('bot_outbox_sent_total', 'Messages sent by priority and result.', ('priority', 'result'))
+COALESCED = metrics.Counter('bot_outbox_coalesced_total', 'Notifications merged into a pending message.')
+RETRY_AFTER = metrics.Counter('bot_outbox_retry_after_total', 'RetryAfter responses from Telegram.')
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, until: float):
+        self.blocked_until = max(self.blocked_until, until)
+
+
+@dataclasses.dataclass
+class _Message:
+    priority: int
+    seq: int
+    chat_id: typing.Union[int, str]
+    text: str
+    kwargs: dict
+    future: asyncio.Future
+    not_before: float = 0.0
+    attempts: int = 0
+    coalesce_key: typing.Optional[tuple] = None
+    # Bot method, ``text`` is its second argument (the document for send_document)
+    method: str = 'send_message'
+
+    def sort_key(self):
+        return self.priority, self.seq
+
+
+def _log_failure(future: asyncio.Future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning('Cannot send notification: %r', future.exception())
+
+
+class Outbox:
+    """Rate limited, prioritized queue for everything the bot sends."""
+
+    def __init__(
+            self,
+            bot,
+            *,
+            workers: int = config.OUTBOX_WORKERS,
+            global_rate: float = config.OUTBOX_GLOBAL_RATE,
+            global_burst: float = config.OUTBOX_GLOBAL_BURST,
+            chat_rate: float = config.OUTBOX_CHAT_RATE,
+            chat_burst: float = config.OUTBOX_CHAT_BURST,
+            interactive_chat_rate: float = config.OUTBOX_INTERACTIVE_CHAT_RATE,
+            interactive_chat_burst: float = config.OUTBOX_INTERACTIVE_CHAT_BURST,
+            coalesce_window: float = config.OUTBOX_COALESCE_WINDOW,
+    ):
+        self._bot = bot
+        self._workers_count = workers
+        self._chat_limits = {
+            True: (interactive_chat_rate, interactive_chat_burst),
+            False: (chat_rate, chat_burst),
+        }
+        self._coalesce_window = coalesce_window
+
+        self._queue: typing.List[_Message] = []
+        self._coalescing: typing.Dict[tuple, _Message] = {}
+        self._global = TokenBucket(global_rate, global_burst)
+        # (chat, is interactive) -> bucket
+        self._chats: typing.Dict[typing.Tuple[typing.Union[int, str], bool], TokenBucket] = {}
+        self._in_flight: typing.Set[typing.Union[int, str]] = set()
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._workers: typing.List[asyncio.Task] = []
+
+    def __len__(self):
+        return len(self._queue)
+
+    def _chat_bucket(self, chat_id, priority: int) -> TokenBucket:
+        key = (chat_id, priority == INTERACTIVE)
+        bucket = self._chats.get(key)
+        if bucket is None:
+            bucket = self._chats[key] = TokenBucket(*self._chat_limits[key[1]])
+        return bucket
+
+    def _ensure_workers(self):
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._worker(), name=f'outbox-worker-{i}')
+                for i in range(self._workers_count)
+            ]
+
+    def _push(self, message: _Message):
+        bisect.insort(self._queue, message, key=_Message.sort_key)
+        QUEUE_SIZE.set(len(self._queue))
+        self._wakeup.set()
+
+    def enqueue(
+            self,
+            chat_id,
+            text: str,
+            *,
+            priority: int = INTERACTIVE,
+            coalesce: bool = False,
+            method: str = 'send_message',
+            **kwargs,
+    ) -> asyncio.Future:
+        self._ensure_workers()
+        key = None
+        if coalesce and method == 'send_message' and set(kwargs) <= {'parse_mode'}:
+            key = (chat_id, priority, kwargs.get('parse_mode'))
+            pending = self._coalescing.get(key)
+            if pending is not None and len(pending.text) + len(text) + 2 <= config.MAX_MESSAGE_LENGTH:
+                pending.text = f'{pending.text}\n\n{text}'
+                COALESCED.inc()
+                return pending.future
+
+        message = _Message(
+            priority=priority,
+            seq=next(self._seq),
+            chat_id=chat_id,
+            text=text,
+            kwargs=kwargs,
+            future=asyncio.get_running_loop().create_future(),
+            method=method,
+        )
+        if key is not None:
+            # Hold the message a little so that a burst ends up in one message
+            message.coalesce_key = key
+            message.not_before = time.monotonic() + self._coalesce_window
+            self._coalescing[key] = message
+        else:
+            # Keep order with held messages of the same chat
+            message.not_before = max(
+                (m.not_before for k, m in self._coalescing.items() if k[:2] == (chat_id, priority)),
+                default=0.0,
+            )
+        if coalesce:
+            # Notifications are not awaited by anybody
+            message.future.add_done_callback(_log_failure)
+        self._push(message)
+        return message.future
+
+    async def send_message(self, chat_id, text: str, *, priority: int = INTERACTIVE, **kwargs):
+        return await self.enqueue(chat_id, text, priority=priority, **kwargs)
+
+    async def send_document(self, chat_id, document, *, priority: int = INTERACTIVE, **kwargs):
+        return await self.enqueue(chat_id, document, priority=priority, method='send_document', **kwargs)
+
+    async def reply(self, message, text: str, **kwargs):
+        return await self.send_message(
+            message.chat.id, text, reply_to_message_id=message.message_id, **kwargs,
+        )
+
+    def notify(self, chat_id, text: str, *, priority: int = NOTIFICATION, **kwargs) -> asyncio.Future:
+        """Queue a low priority message without waiting for it to be sent."""
+        return self.enqueue(chat_id, text, priority=priority, coalesce=True, **kwargs)
+
+    def _take_next(self) -> typing.Tuple[typing.Optional[_Message], typing.Optional[float]]:
+        now = time.monotonic()
+        global_wait = self._global.wait_time(now)
+        if global_wait:
+            return None, global_wait
+
+        wait = None
+        for i, message in enumerate(self._queue):
+            if message.chat_id in self._in_flight:
+                continue
+            chat_bucket = self._chat_bucket(message.chat_id, message.priority)
+            delay = max(message.not_before - now, chat_bucket.wait_time(now))
+            if delay <= 0:
+                del self._queue[i]
+                QUEUE_SIZE.set(len(self._queue))
+                if self._coalescing.get(message.coalesce_key) is message:
+                    del self._coalescing[message.coalesce_key]
+                self._global.take(now)
+                chat_bucket.take(now)
+                return message, None
+            wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    async def _next(self) -> _Message:
+        while True:
+            self._wakeup.clear()
+            message, wait = self._take_next()
+            if message is not None:
+                return message
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _send(self, message: _Message):
+        if message.future.done():
+            return
+        priority = _PRIORITY_NAMES.get(message.priority, str(message.priority))
+        try:
+            result = await getattr(self._bot, message.method)(message.chat_id, message.text, **message.kwargs)
+        except exceptions.RetryAfter as e:
+            RETRY_AFTER.inc()
+            message.attempts += 1
+            if message.attempts > config.OUTBOX_MAX_RETRIES:
+                SENT.inc(priority, 'error')
+                message.future.set_exception(e)
+                return
+            logger.info('RetryAfter %s sec for chat %s', e.timeout, message.chat_id)
+            # Telegram limits the chat as a whole
+            until = time.monotonic() + e.timeout
+            for chat_priority in (INTERACTIVE, NOTIFICATION):
+                self._chat_bucket(message.chat_id, chat_priority).block(until)
+            self._push(message)
+        except Exception as e:
+            SENT.inc(priority, 'error')
+            message.future.set_exception(e)
+        else:
+            SENT.inc(priority, 'success')
+            message.future.set_result(result)
+
+    async def _worker(self):
+        while True:
+            message = await self._next()
+            self._in_flight.add(message.chat_id)
+            try:
+                await self._send(message)
+            finally:
+                self._in_flight.discard(message.chat_id)
+                self._wakeup.set()
+
+    async def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
@@ -0,0 +1,161 @@
+import asyncio
+import dataclasses
+import datetime
+import logging
+import random
+import time
+import typing
+
+from app.configs import monitor as config
+from rzd_client import client
+from rzd_client import models
+from rzd_client import tracing
+
+logger = logging.getLogger(__name__)
+
+# train number -> {service category code -> free seats}
+Availability = typing.Dict[str, typing.Dict[int, int]]
+
+
+@dataclasses.dataclass
+class DateState:
+    date: datetime.date
+    availability: typing.Optional[Availability] = None
+    interval: float = config.RANGE_MIN_INTERVAL
+    next_poll_at: float = 0.0
+    changed_at: typing.Optional[float] = None
+    fails_count: int = 0
+
+
+class RangeMonitor:
+    """Watches every train (or a given set) on a route over a range of dates."""
+
+    def __init__(
+            self,
+            departure: models.Station,
+            arrival: models.Station,
+            date_from: datetime.date,
+            date_to: datetime.date,
+            trains: typing.Optional[typing.Iterable[str]] = None,
+            cars_type: typing.Optional[models.ServiceCategory] = None,
+            requested_count: int = 1,
+            *,
+            concurrency: int = config.RANGE_CONCURRENCY,
+            min_interval: float = config.RANGE_MIN_INTERVAL,
+            max_interval: float = config.RANGE_MAX_INTERVAL,
+            callback=None,
+            prefix='',
+    ):
+        if date_to < date_from:
+            raise ValueError(f'Empty date range: {date_from} - {date_to}')
+        self.departure = departure
+        self.arrival = arrival
+        self.trains = set(trains) if trains else None
+        self.cars_type = cars_type
+        self.requested_count = requested_count
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.callback = callback or self.default_callback
+        self.log_prefix = prefix
+
+        self._semaphore = asyncio.Semaphore(concurrency)
+        days = (date_to - date_from).days
+        self.dates = [
+            DateState(date_from + datetime.timedelta(days=i), interval=min_interval)
+            for i in range(days + 1)
+        ]
+        self.stop = False
+        self._last_matches = None
+
+    @staticmethod
+    async def default_callback(string):
+        logger.info(string)
+
+    def _filter_trains(self, trains: typing.List[models.TrainOverview]) -> Availability:
+        return {
+            train.number: {c.category.code: c.free_seats for c in train.service_categories}
+            for train in trains
+            if self.trains is None or train.number in self.trains
+        }
+
+    async def _fetch_date(self, client_: client.RZDClient, state: DateState):
+        args = models.TrainsOverviewRequestArgs(self.departure, self.arrival, state.date)
+        async with self._semaphore:
+            try:
+                trains = await client_.fetch_trains_overview(args)
+            except Exception:
+                logger.warning('%sCannot fetch %s', self.log_prefix, state.date, exc_info=True)
+                state.fails_count += 1
+                state.next_poll_at = time.monotonic() + min(
+                    state.fails_count * config.SLEEP_AFTER_FAIL_BASE, self.max_interval,
+                )
+                return
+
+        now = time.monotonic()
+        availability = self._filter_trains(trains)
+        state.fails_count = 0
+        if availability != state.availability:
+            # Changing dates are re-polled often, quiet ones back off
+            state.availability = availability
+            state.changed_at = now
+            state.interval = self.min_interval
+        else:
+            state.interval = min(state.interval * 2, self.max_interval)
+        state.next_poll_at = now + state.interval * (1 + random.random() / 2)
+
+    async def fetch(self, client_: client.RZDClient, force: bool = False):
+        """Fetch every date that is due (or all of them), concurrently."""
+        now = time.monotonic()
+        due = [state for state in self.dates if force or state.next_poll_at <= now]
+        await asyncio.gather(*(self._fetch_date(client_, state) for state in due))
+        return len(due)
+
+    def merged_view(self) -> typing.Dict[datetime.date, Availability]:
+        return {
+            state.date: state.availability
+            for state in self.dates
+            if state.availability is not None
+        }
+
+    def matches(self) -> typing.List[typing.Tuple[datetime.date, str, int]]:
+        """(date, train, free seats) with enough seats of the wanted category."""
+        res = []
+        for date, availability in self.merged_view().items():
+            for number, categories in sorted(availability.items()):
+                if self.cars_type is None:
+                    free_seats = sum(categories.values())
+                else:
+                    free_seats = categories.get(self.cars_type.code, 0)
+                if free_seats >= self.requested_count:
+                    res.append((date, number, free_seats))
+        return res
+
+    @staticmethod
+    def format_matches(matches) -> str:
+        return '\n'.join(
+            f'{date:%d.%m.%Y} {number}: {free_seats} seats'
+            for date, number, free_seats in matches
+        )
+
+    async def run(self, client_: typing.Optional[client.RZDClient] = None):
+        if client_ is not None:
+            await self._run(client_)
+            return
+        async with client.RZDClient(caller=tracing.CALLER_MONITOR) as client_:
+            await self._run(client_)
+
+    async def _run(self, client_: client.RZDClient):
+        await self.fetch(client_, force=True)
+        while True:
+            matches = self.matches()
+            if matches != self._last_matches:
+                self._last_matches = matches
+                if matches:
+                    await self.callback(self.format_matches(matches))
+                else:
+                    logger.info('%sNo matching trains', self.log_prefix)
+            if self.stop:
+                return
+            next_poll_at = min(state.next_poll_at for state in self.dates)
+            await asyncio.sleep(max(next_poll_at - time.monotonic(), 1))
+            await self.fetch(client_)
@@ -0,0 +1,72 @@
+import asyncio
+import collections
+import typing
+
+from app import monitor
+from app.configs import bot as config
+
+
+class QuotaExceededError(RuntimeError):
+    pass
+
+
+class MonitorRegistry:
+    """Active monitors of every user, addressed by per-user numeric IDs."""
+
+    def __init__(self, max_per_user: int = config.MAX_MONITORS_PER_USER):
+        self.max_per_user = max_per_user
+        self._monitors: typing.Dict[int, typing.Dict[int, monitor.AsyncMonitor]] = (
+            collections.defaultdict(dict)
+        )
+        self._last_ids: typing.Dict[int, int] = collections.defaultdict(int)
+        self._tasks: typing.Set[asyncio.Task] = set()
+
+    def __len__(self):
+        return sum(len(monitors) for monitors in self._monitors.values())
+
+    def active(self, user_id: int) -> typing.Dict[int, monitor.AsyncMonitor]:
+        return {
+            monitor_id: monitor_
+            for monitor_id, monitor_ in self._monitors.get(user_id, {}).items()
+            if not monitor_.stop
+        }
+
+    def is_full(self, user_id: int) -> bool:
+        return len(self.active(user_id)) >= self.max_per_user
+
+    def next_id(self, user_id: int) -> int:
+        return self._last_ids[user_id] + 1
+
+    def add(self, user_id: int, monitor_: monitor.AsyncMonitor, monitor_id: typing.Optional[int] = None) -> int:
+        if self.is_full(user_id):
+            raise QuotaExceededError(user_id)
+        if monitor_id is None:
+            monitor_id = self.next_id(user_id)
+        self._last_ids[user_id] = max(self._last_ids[user_id], monitor_id)
+        self._monitors[user_id][monitor_id] = monitor_
+        return monitor_id
+
+    def get(self, user_id: int, monitor_id: int) -> typing.Optional[monitor.AsyncMonitor]:
+        return self._monitors.get(user_id, {}).get(monitor_id)
+
+    def remove(self, user_id: int, monitor_id: int):
+        monitors = self._monitors.get(user_id)
+        if monitors is None:
+            return
+        monitors.pop(monitor_id, None)
+        if not monitors:
+            del self._monitors[user_id]
+
+    def spawn(self, coro, name: typing.Optional[str] = None) -> asyncio.Task:
+        """Run a monitor coroutine in background, keeping a reference to its task."""
+        task = asyncio.create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def stop_all(self):
+        """Stop every monitor and wait until their tasks finish."""
+        for monitors in self._monitors.values():
+            for monitor_ in monitors.values():
+                monitor_.stop = True
+        await asyncio.gather(*self._tasks, return_exceptions=True)
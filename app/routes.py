@@ -1,5 +1,6 @@
 from app import forms
 from app import handlers
+from app.configs import bot as config
 
 
 def apply_routes(dp):
@@ -11,6 +12,11 @@ def apply_routes(dp):
     _register(handlers.cmd_set, state='*', commands=['set'])
     _register(handlers.cmd_cancel, state='*', commands=['cancel'])
 
+    # Admin
+    if config.ADMIN_IDS:
+        _register(handlers.cmd_profile, state='*', commands=['profile'], user_id=config.ADMIN_IDS)
+        _register(handlers.cmd_tasks, state='*', commands=['tasks'], user_id=config.ADMIN_IDS)
+
     # State dependant
     _parameters = forms.MonitorParameters
     _register(handlers.process_date, state=_parameters.date)
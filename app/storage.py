@@ -0,0 +1,193 @@
+import asyncio
+import concurrent.futures
+import dataclasses
+import json
+import logging
+import os
+import sqlite3
+import typing
+
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+from app.configs import bot as config
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS fsm (
+        chat TEXT NOT NULL,
+        user TEXT NOT NULL,
+        state TEXT,
+        data TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        PRIMARY KEY (chat, user)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS monitors (
+        user_id INTEGER NOT NULL,
+        monitor_id INTEGER NOT NULL,
+        definition TEXT NOT NULL,
+        PRIMARY KEY (user_id, monitor_id)
+    )
+    """,
+)
+
+
+class Database:
+    """SQLite connection used from one background thread, so the event loop never waits on disk."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite')
+        self._closed = False
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        for statement in _SCHEMA:
+            self._connection.execute(statement)
+        self._connection.commit()
+
+    def _execute(self, sql, params=()):
+        with self._connection:
+            return self._connection.execute(sql, params).fetchall()
+
+    def execute_now(self, sql, params=()):
+        """Blocking call, for startup only."""
+        return self._executor.submit(self._execute, sql, params).result()
+
+    async def execute(self, sql, params=()):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._execute, sql, params)
+
+    def close(self):
+        """Blocking call: runs the queued writes, then closes the connection and the thread."""
+        if self._closed:
+            return
+        self._closed = True
+        # The executor runs in order, so the connection is closed after the writes queued before
+        self._executor.submit(self._connection.close)
+        self._executor.shutdown(wait=True)
+
+
+class SQLiteStorage(MemoryStorage):
+    """FSM storage: in-memory reads, write-through to SQLite. Data must be JSON serializable."""
+
+    def __init__(self, database: Database):
+        super().__init__()
+        self._database = database
+        self._closing: typing.Optional[asyncio.Future] = None
+        rows = database.execute_now('SELECT chat, user, state, data, bucket FROM fsm')
+        for chat, user, state, data, bucket in rows:
+            self.data.setdefault(chat, {})[user] = {
+                'state': state, 'data': json.loads(data), 'bucket': json.loads(bucket),
+            }
+
+    async def _persist(self, chat, user):
+        chat, user = map(str, self.check_address(chat=chat, user=user))
+        record = self.data.get(chat, {}).get(user)
+        if record is None:
+            await self._database.execute('DELETE FROM fsm WHERE chat = ? AND user = ?', (chat, user))
+            return
+        await self._database.execute(
+            'INSERT OR REPLACE INTO fsm (chat, user, state, data, bucket) VALUES (?, ?, ?, ?, ?)',
+            (chat, user, record['state'], json.dumps(record['data']), json.dumps(record['bucket'])),
+        )
+
+    async def set_state(self, *, chat=None, user=None, state=None):
+        await super().set_state(chat=chat, user=user, state=state)
+        await self._persist(chat, user)
+
+    async def set_data(self, *, chat=None, user=None, data=None):
+        await super().set_data(chat=chat, user=user, data=data)
+        await self._persist(chat, user)
+
+    async def update_data(self, *, chat=None, user=None, data=None, **kwargs):
+        await super().update_data(chat=chat, user=user, data=data, **kwargs)
+        await self._persist(chat, user)
+
+    async def reset_state(self, *, chat=None, user=None, with_data=True):
+        await super().reset_state(chat=chat, user=user, with_data=with_data)
+        await self._persist(chat, user)
+
+    async def set_bucket(self, *, chat=None, user=None, bucket=None):
+        await super().set_bucket(chat=chat, user=user, bucket=bucket)
+        await self._persist(chat, user)
+
+    async def update_bucket(self, *, chat=None, user=None, bucket=None, **kwargs):
+        await super().update_bucket(chat=chat, user=user, bucket=bucket, **kwargs)
+        await self._persist(chat, user)
+
+    async def close(self):
+        # Unlike MemoryStorage, keep the data: it is persisted
+        if self._closing is None:
+            self._closing = asyncio.get_running_loop().run_in_executor(None, self._database.close)
+
+    async def wait_closed(self):
+        if self._closing is not None:
+            await self._closing
+
+
+@dataclasses.dataclass
+class MonitorDefinition:
+    user_id: int
+    monitor_id: int
+    chat_id: int
+    rzd_args: dict
+    params: dict
+    car_type: int
+    prefix: str = ''
+
+    def to_json(self) -> str:
+        return json.dumps(dataclasses.asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, string: str):
+        return cls(**json.loads(string))
+
+
+class MonitorStore:
+    """Keeps definitions of running monitors. This one forgets them on restart."""
+
+    async def save(self, definition: MonitorDefinition):
+        pass
+
+    async def delete(self, user_id: int, monitor_id: int):
+        pass
+
+    async def load_all(self) -> typing.List[MonitorDefinition]:
+        return []
+
+
+class SQLiteMonitorStore(MonitorStore):
+    def __init__(self, database: Database):
+        self._database = database
+
+    async def save(self, definition: MonitorDefinition):
+        await self._database.execute(
+            'INSERT OR REPLACE INTO monitors (user_id, monitor_id, definition) VALUES (?, ?, ?)',
+            (definition.user_id, definition.monitor_id, definition.to_json()),
+        )
+
+    async def delete(self, user_id: int, monitor_id: int):
+        await self._database.execute(
+            'DELETE FROM monitors WHERE user_id = ? AND monitor_id = ?', (user_id, monitor_id),
+        )
+
+    async def load_all(self) -> typing.List[MonitorDefinition]:
+        rows = await self._database.execute('SELECT definition FROM monitors ORDER BY user_id, monitor_id')
+        res = []
+        for (definition,) in rows:
+            try:
+                res.append(MonitorDefinition.from_json(definition))
+            except (TypeError, ValueError):
+                logger.warning('Skipping broken monitor definition %r', definition)
+        return res
+
+
+def create_storages(path: typing.Optional[str] = config.STORAGE_PATH):
+    """FSM storage and monitor store: persistent when a path is configured."""
+    if not path:
+        return MemoryStorage(), MonitorStore()
+    database = Database(path)
+    return SQLiteStorage(database), SQLiteMonitorStore(database)
@@ -2,13 +2,12 @@ import dataclasses
 import logging
 import typing
 
-from fuzzywuzzy import process
-
 from app.configs import messages
 from app.configs import bot as config
 from rzd_client import client
 from rzd_client import common
 from rzd_client import models
+from rzd_client import tracing
 
 
 class StationSuggester:
@@ -20,7 +19,7 @@ class StationSuggester:
         self.match_id = None
 
     async def _fetch_suggests_dict(self) -> dict:
-        async with client.RZDClient() as client_:
+        async with client.RZDClient(caller=tracing.CALLER_SUGGESTER) as client_:
             suggests = await client_.fetch_station_suggests(lang=self.lang, string=self.string)
             return suggests
 
@@ -40,8 +39,11 @@ class StationSuggester:
 
         self.is_exact_match = False
         corpus = suggests_dict.keys()
+        # Imported on first use, it pulls in the Levenshtein extension
+        from fuzzywuzzy import process
+
         result = process.extract(string, corpus, limit=config.SUGGESTS_LIMIT)
-        logging.info(f'filtered similarity request result: {repr(result)}')
+        logging.info('filtered similarity request result: %r', result)
         filtered_result = [
             n[0] for n in result if n[1] > config.MIN_SUGGESTS_SIMILARITY
         ]
@@ -88,9 +90,14 @@ class TrainSuggest:
         return instance
 
 
-async def trains(args: models.TrainsOverviewRequestArgs):
-    async with client.RZDClient() as client_:
-        trains_list = await client_.fetch_trains_overview(args)
+async def trains(args: models.TrainsOverviewRequestArgs, availability_service=None):
+    if availability_service is not None:
+        trains_list = await availability_service.fetch_trains_overview(
+            args, caller=tracing.CALLER_SUGGESTER,
+        )
+    else:
+        async with client.RZDClient(caller=tracing.CALLER_SUGGESTER) as client_:
+            trains_list = await client_.fetch_trains_overview(args)
 
     trains_suggests_dict = {}
     for train in trains_list:
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import typing
+
+from aiogram import Bot, Dispatcher
+from aiogram import types
+from aiohttp import web
+
+from app.configs import bot as config
+from shared import metrics
+
+logger = logging.getLogger(__name__)
+
+UPDATES = metrics.Counter('bot_webhook_updates_total', 'Updates received through the webhook.', ('result',))
+UPDATES_QUEUE = metrics.Gauge('bot_webhook_queue_size', 'Updates waiting for a handler.')
+HANDLER_LATENCY = metrics.Histogram('bot_update_handler_seconds', 'Time spent processing one update.')
+
+
+class WebhookServer:
+    """Receives updates over HTTP and processes them with bounded concurrency."""
+
+    def __init__(
+            self,
+            dispatcher: Dispatcher,
+            *,
+            path: str = config.WEBHOOK_PATH,
+            concurrency: int = config.WEBHOOK_CONCURRENCY,
+            queue_size: int = config.WEBHOOK_QUEUE_SIZE,
+            secret: typing.Optional[str] = config.WEBHOOK_SECRET,
+            on_startup: typing.Optional[typing.Callable[[], typing.Awaitable]] = None,
+    ):
+        self.dispatcher = dispatcher
+        self.path = path
+        self.concurrency = concurrency
+        self.secret = secret
+        self.on_startup = on_startup
+        self.ready = False
+        self._queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self._workers: typing.List[asyncio.Task] = []
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get('/healthz', self.handle_health)
+        app.router.add_get('/readyz', self.handle_ready)
+        metrics.setup_routes(app)
+        app.on_startup.append(self._on_startup)
+        app.on_shutdown.append(self._on_shutdown)
+        return app
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if self.secret and request.headers.get(config.WEBHOOK_SECRET_HEADER) != self.secret:
+            UPDATES.inc('forbidden')
+            raise web.HTTPForbidden()
+        try:
+            update = types.Update(**await request.json())
+        except (ValueError, TypeError):
+            UPDATES.inc('malformed')
+            raise web.HTTPBadRequest()
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram redelivers the update later
+            UPDATES.inc('rejected')
+            raise web.HTTPServiceUnavailable()
+        UPDATES.inc('accepted')
+        UPDATES_QUEUE.set(self._queue.qsize())
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.Response(text='ok')
+
+    async def handle_ready(self, request: web.Request) -> web.Response:
+        workers_alive = sum(not worker.done() for worker in self._workers)
+        if not self.ready or not workers_alive or self._queue.full():
+            raise web.HTTPServiceUnavailable(text='not ready')
+        return web.Response(text='ready')
+
+    async def _process(self, update: types.Update):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            await self.dispatcher.process_update(update)
+        except Exception:
+            logger.exception('Cannot process update %s', update.update_id)
+        finally:
+            HANDLER_LATENCY.observe(loop.time() - started)
+
+    async def _worker(self):
+        Bot.set_current(self.dispatcher.bot)
+        Dispatcher.set_current(self.dispatcher)
+        while True:
+            update = await self._queue.get()
+            UPDATES_QUEUE.set(self._queue.qsize())
+            try:
+                # Own task, so own context: aiogram caches the FSM state of an update in a ContextVar
+                await asyncio.create_task(self._process(update), name=f'update-{update.update_id}')
+            finally:
+                self._queue.task_done()
+
+    async def _on_startup(self, app: web.Application):
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f'webhook-worker-{i}')
+            for i in range(self.concurrency)
+        ]
+        app['loop_lag_task'] = metrics.ensure_loop_lag_monitor()
+        if config.WEBHOOK_URL:
+            await self.dispatcher.bot.set_webhook(
+                config.WEBHOOK_URL.rstrip('/') + self.path, secret_token=self.secret,
+            )
+            logger.info('Webhook is set')
+        if self.on_startup is not None:
+            await self.on_startup()
+        self.ready = True
+
+    async def _on_shutdown(self, app: web.Application):
+        self.ready = False
+        # The webhook stays registered: Telegram keeps updates until we are back
+        try:
+            await asyncio.wait_for(self._queue.join(), config.WEBHOOK_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning('%d updates left unprocessed', self._queue.qsize())
+        for task in (*self._workers, app['loop_lag_task']):
+            task.cancel()
+        await self.dispatcher.storage.close()
+        await self.dispatcher.storage.wait_closed()
+        session = await self.dispatcher.bot.get_session()
+        await session.close()
+
+
+def run(
+        dispatcher: Dispatcher,
+        host: str = config.WEBHOOK_HOST,
+        port: int = config.WEBHOOK_PORT,
+        on_startup: typing.Optional[typing.Callable[[], typing.Awaitable]] = None,
+):
+    server = WebhookServer(dispatcher, on_startup=on_startup)
+    web.run_app(server.create_app(), host=host, port=port, access_log=None)
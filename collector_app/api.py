@@ -0,0 +1,91 @@
+import datetime
+import logging
+import typing
+
+from aiohttp import web
+
+from collector_app import snapshots
+from collector_app.configs import collector as config
+
+logger = logging.getLogger(__name__)
+
+INDEX_KEY = 'snapshot_index'
+
+
+def _etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def _json_or_not_modified(request: web.Request, data, version: int) -> web.Response:
+    etag = _etag(version)
+    if etag in request.headers.get('If-None-Match', ''):
+        return web.Response(status=304, headers={'ETag': etag})
+    return web.json_response(data, headers={'ETag': etag})
+
+
+def _int_param(request: web.Request, name: str) -> typing.Optional[int]:
+    value = request.query.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise web.HTTPBadRequest(text=f'{name} must be an integer')
+
+
+async def handle_snapshots(request: web.Request) -> web.Response:
+    """Latest snapshots, optionally filtered by ``date`` (ISO), ``from`` and ``to`` station codes."""
+    index: snapshots.SnapshotIndex = request.app[INDEX_KEY]
+    date = request.query.get('date')
+    try:
+        departure_date = datetime.date.fromisoformat(date) if date else None
+    except ValueError:
+        raise web.HTTPBadRequest(text='date must be YYYY-MM-DD')
+    data = index.find(departure_date, _int_param(request, 'from'), _int_param(request, 'to'))
+    return _json_or_not_modified(request, {'version': index.version, 'configs': data}, index.version)
+
+
+async def handle_snapshot(request: web.Request) -> web.Response:
+    index: snapshots.SnapshotIndex = request.app[INDEX_KEY]
+    try:
+        config_id = int(request.match_info['config_id'])
+    except ValueError:
+        raise web.HTTPNotFound()
+    version = index.config_version(config_id)
+    if version is None:
+        raise web.HTTPNotFound()
+    return _json_or_not_modified(request, index.view(config_id), version)
+
+
+async def handle_changes(request: web.Request) -> web.Response:
+    """Long poll: returns configs changed after ``since`` as soon as there are any."""
+    index: snapshots.SnapshotIndex = request.app[INDEX_KEY]
+    since = _int_param(request, 'since') or 0
+    timeout = _int_param(request, 'timeout')
+    timeout = min(config.LONG_POLL_TIMEOUT if timeout is None else timeout, config.LONG_POLL_MAX_TIMEOUT)
+    await index.wait_changed(since, timeout)
+    return web.json_response({'version': index.version, 'configs': index.changed_since(since)})
+
+
+def setup_routes(app: web.Application, index: snapshots.SnapshotIndex):
+    app[INDEX_KEY] = index
+    app.router.add_get('/snapshots', handle_snapshots)
+    app.router.add_get('/snapshots/{config_id}', handle_snapshot)
+    app.router.add_get('/changes', handle_changes)
+
+
+async def start_server(
+        index: snapshots.SnapshotIndex,
+        host: str = config.API_HOST,
+        port: typing.Optional[int] = config.API_PORT,
+) -> typing.Optional[web.AppRunner]:
+    """Serve the snapshot index. No-op without a port."""
+    if not port:
+        return None
+    app = web.Application()
+    setup_routes(app, index)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info('Serving snapshots API on %s:%s', host, port)
+    return runner
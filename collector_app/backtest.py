@@ -0,0 +1,221 @@
+"""
+Replays collected_data_raw in time order through a polling schedule and a
+notification policy, without touching RZD.
+
+Recorded snapshots are the ground truth: availability appears at the first
+snapshot where the policy sees enough seats on a train. A simulated poller
+requests the route when the schedule says so and sees the latest snapshot
+recorded by then. An appearance is caught by the first poll after it and
+missed when the seats are gone before that poll. Truth is only as fine as
+the recording cadence, so schedules denser than the collector's cannot win.
+"""
+import dataclasses
+import datetime
+import logging
+import typing
+
+import pytz
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from collector_app import orm
+from collector_app import task
+from collector_app.configs import collector as config
+
+logger = logging.getLogger(__name__)
+
+MSK = pytz.timezone('Europe/Moscow')
+
+# train number -> service category code -> free seats
+FreeSeats = typing.Dict[str, typing.Dict[int, int]]
+# (departure date, poll time) -> seconds until the next poll
+SchedulingPolicy = typing.Callable[[datetime.date, datetime.datetime], float]
+# free seats by category code of one train -> whether the users are to be notified
+NotificationPolicy = typing.Callable[[typing.Dict[int, int]], bool]
+
+
+@dataclasses.dataclass
+class Snapshot:
+    config_id: int
+    departure_date: datetime.date
+    collected_at: datetime.datetime
+    trains: FreeSeats
+
+    @classmethod
+    def from_row(cls, row) -> 'Snapshot':
+        trains = {}
+        for train in row.raw_data:
+            seats = trains.setdefault(train['number'], {})
+            for category in train.get('serviceCategories', ()):
+                code = category['typeCarNumCode']
+                seats[code] = max(seats.get(code, 0), category['freeSeats'])
+        return cls(row.config_id, row.departure_date, row.collected_at, trains)
+
+
+def default_schedule(departure_date: datetime.date, now: datetime.datetime) -> float:
+    """The collector's own cadence, see Task._calculate_delay."""
+    days = max((departure_date - now.astimezone(MSK).date()).days, 0)
+    return task.calculate_delay(days)
+
+
+def scaled_schedule(schedule: SchedulingPolicy, factor: float) -> SchedulingPolicy:
+    def policy(departure_date, now):
+        return schedule(departure_date, now) * factor
+    return policy
+
+
+def fixed_schedule(seconds: float) -> SchedulingPolicy:
+    def policy(departure_date, now):
+        return seconds
+    return policy
+
+
+@dataclasses.dataclass(frozen=True)
+class FreeSeatsPolicy:
+    """Notify when the overview shows ``requested_count`` seats of a wanted category, like MonitorHub."""
+    cars_type_codes: typing.Optional[typing.FrozenSet[int]] = None
+    requested_count: int = 1
+
+    def __call__(self, free_seats: typing.Dict[int, int]) -> bool:
+        return any(
+            count >= self.requested_count
+            for code, count in free_seats.items()
+            if self.cars_type_codes is None or code in self.cars_type_codes
+        )
+
+
+@dataclasses.dataclass
+class Report:
+    configs: int = 0
+    snapshots: int = 0
+    appearances: int = 0
+    caught: int = 0
+    missed: int = 0
+    # Still available at the end of the recording and not polled since
+    pending: int = 0
+    requests: int = 0
+    delays: typing.List[float] = dataclasses.field(default_factory=list, repr=False)
+
+    @property
+    def catch_rate(self) -> typing.Optional[float]:
+        resolved = self.caught + self.missed
+        return self.caught / resolved if resolved else None
+
+    def delay_percentiles(self, points=(0.5, 0.9, 0.99)) -> typing.Dict[str, float]:
+        if not self.delays:
+            return {}
+        ordered = sorted(self.delays)
+        res = {f'p{round(p * 100)}': ordered[min(int(p * len(ordered)), len(ordered) - 1)] for p in points}
+        res['max'] = ordered[-1]
+        return res
+
+    def as_dict(self) -> dict:
+        res = dataclasses.asdict(self)
+        del res['delays']
+        res['catch_rate'] = self.catch_rate
+        res['delay_seconds'] = self.delay_percentiles()
+        res['requests_per_caught'] = self.requests / self.caught if self.caught else None
+        return res
+
+
+class _ConfigState:
+    def __init__(self, first: Snapshot):
+        self.departure_date = first.departure_date
+        self.next_poll = first.collected_at
+        self.available: typing.Dict[str, bool] = {}
+        # Appearances not seen by a poll yet: train number -> time
+        self.unseen: typing.Dict[str, datetime.datetime] = {}
+
+
+class Backtest:
+    def __init__(
+            self,
+            schedule: SchedulingPolicy = default_schedule,
+            notify: NotificationPolicy = FreeSeatsPolicy(),
+    ):
+        self.schedule = schedule
+        self.notify = notify
+        self.report = Report()
+        self._states: typing.Dict[int, _ConfigState] = {}
+
+    def _poll_until(self, state: _ConfigState, until: datetime.datetime, inclusive: bool):
+        while state.next_poll < until or inclusive and state.next_poll == until:
+            self.report.requests += 1
+            # The poll sees everything recorded so far
+            for appeared_at in state.unseen.values():
+                self.report.caught += 1
+                self.report.delays.append((state.next_poll - appeared_at).total_seconds())
+            state.unseen.clear()
+            delay = self.schedule(state.departure_date, state.next_poll)
+            if delay <= 0:
+                # It would never move the poller forward
+                raise ValueError(f'Scheduling policy returned a non-positive delay: {delay}')
+            state.next_poll += datetime.timedelta(seconds=delay)
+
+    def feed(self, snapshot: Snapshot):
+        """Snapshots must come in ``collected_at`` order."""
+        self.report.snapshots += 1
+        state = self._states.get(snapshot.config_id)
+        if state is None:
+            state = self._states[snapshot.config_id] = _ConfigState(snapshot)
+            self.report.configs += 1
+        self._poll_until(state, snapshot.collected_at, inclusive=False)
+
+        for number in set(state.available) | set(snapshot.trains):
+            available = self.notify(snapshot.trains.get(number, {}))
+            was_available = state.available.get(number, False)
+            if available and not was_available:
+                self.report.appearances += 1
+                state.unseen[number] = snapshot.collected_at
+            elif was_available and not available and number in state.unseen:
+                self.report.missed += 1
+                del state.unseen[number]
+            state.available[number] = available
+
+        self._poll_until(state, snapshot.collected_at, inclusive=True)
+
+    def finish(self) -> Report:
+        self.report.pending = sum(len(state.unseen) for state in self._states.values())
+        return self.report
+
+    def run(self, snapshots: typing.Iterable[Snapshot]) -> Report:
+        for snapshot in snapshots:
+            self.feed(snapshot)
+        return self.finish()
+
+
+def _query(config_ids=None, since=None, until=None):
+    query = (
+        select(
+            orm.CollectedDataRaw.config_id,
+            orm.CollectedDataRaw.collected_at,
+            orm.CollectedDataRaw.raw_data,
+            orm.Config.departure_date,
+        )
+        .join(orm.Config)
+        .order_by(orm.CollectedDataRaw.collected_at, orm.CollectedDataRaw.id)
+    )
+    if config_ids:
+        query = query.where(orm.CollectedDataRaw.config_id.in_(config_ids))
+    if since is not None:
+        query = query.where(orm.CollectedDataRaw.collected_at >= since)
+    if until is not None:
+        query = query.where(orm.CollectedDataRaw.collected_at < until)
+    return query
+
+
+def load_snapshots(
+        config_ids: typing.Optional[typing.Collection[int]] = None,
+        since: typing.Optional[datetime.datetime] = None,
+        until: typing.Optional[datetime.datetime] = None,
+        batch_size: int = config.BACKTEST_BATCH_SIZE,
+) -> typing.Iterator[Snapshot]:
+    """Recorded snapshots in time order, streamed with a server side cursor."""
+    logger.info('Replaying snapshots of configs %s from %s to %s', config_ids or 'all', since, until)
+    with Session(orm.get_engine()) as session:
+        result = session.execute(
+            _query(config_ids, since, until),
+            execution_options={'yield_per': batch_size},
+        )
+        for row in result:
+            yield Snapshot.from_row(row)
@@ -0,0 +1,84 @@
+"""
+Packed encoding of ticket categories of one train.
+
+A version byte followed by fixed width little-endian records:
+category code, free seats, price_from and price_to in kopecks, bonus
+points in hundredths. MISSING marks no upper price and no bonus points.
+Version 1 stored both as 0 and is still decoded.
+"""
+import decimal
+import struct
+import typing
+
+from rzd_client import models
+
+VERSION = 2
+_LEGACY_VERSION = 1
+_HEADER = bytes((VERSION,))
+_RECORD = struct.Struct('<HHIII')
+MISSING = 0xFFFFFFFF
+_HUNDRED = decimal.Decimal(100)
+
+
+class DecodeError(RuntimeError):
+    pass
+
+
+def to_kopecks(value: typing.Union[decimal.Decimal, str, None]) -> typing.Optional[int]:
+    if value is None:
+        return None
+    return int((decimal.Decimal(value) * _HUNDRED).to_integral_value(decimal.ROUND_HALF_UP))
+
+
+def _optional(value: typing.Optional[int]) -> int:
+    return MISSING if value is None else value
+
+
+def encode(categories: typing.Iterable[models.AvailableServiceCategory]) -> bytes:
+    pack = _RECORD.pack
+    return _HEADER + b''.join(
+        pack(
+            c.category.code,
+            c.free_seats,
+            to_kopecks(c.price_from),
+            _optional(to_kopecks(c.price_to)),
+            _optional(to_kopecks(c.rzd_bonus_points)),
+        )
+        for c in categories
+    )
+
+
+def iter_records(
+        data: bytes,
+) -> typing.Iterator[typing.Tuple[int, int, int, typing.Optional[int], typing.Optional[int]]]:
+    """(code, free seats, price_from, price_to, bonus) with prices in kopecks."""
+    if not data or data[0] not in (VERSION, _LEGACY_VERSION):
+        raise DecodeError(f'Unsupported packed tickets version: {data[:1]!r}')
+    if (len(data) - 1) % _RECORD.size:
+        raise DecodeError(f'Truncated packed tickets: {len(data)} bytes')
+    records = _RECORD.iter_unpack(memoryview(data)[1:])
+    if data[0] == _LEGACY_VERSION:
+        # Missing values were stored as 0: a missing bonus cannot be told from no bonus
+        for code, free_seats, price_from, price_to, bonus in records:
+            yield code, free_seats, price_from, price_to or None, bonus
+        return
+    for code, free_seats, price_from, price_to, bonus in records:
+        yield (
+            code,
+            free_seats,
+            price_from,
+            None if price_to == MISSING else price_to,
+            None if bonus == MISSING else bonus,
+        )
+
+def decode(data: bytes) -> typing.List[models.AvailableServiceCategory]:
+    return [
+        models.AvailableServiceCategory(
+            category=models.ServiceCategory(code),
+            free_seats=free_seats,
+            price_from=decimal.Decimal(price_from) / _HUNDRED,
+            price_to=None if price_to is None else decimal.Decimal(price_to) / _HUNDRED,
+            rzd_bonus_points=None if bonus is None else decimal.Decimal(bonus) / _HUNDRED,
+        )
+        for code, free_seats, price_from, price_to, bonus in iter_records(data)
+    ]
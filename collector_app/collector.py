@@ -1,13 +1,16 @@
 import asyncio
 import logging
+import time
 
 from sqlalchemy.orm import Session
 
 from collector_app import orm
+from collector_app import snapshots
 from collector_app import task
 from collector_app import worker_queue
 from collector_app.configs import collector as config
 from rzd_client import models
+from shared import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -16,12 +19,16 @@ class Collector:
     _active_tasks: dict
     _worker: worker_queue.WorkerQueue
 
+    def __init__(self):
+        self.index = snapshots.SnapshotIndex()
+
     async def _fetch_configs_from_db(self):
-        with Session(orm.engine) as session:
+        with Session(orm.get_engine()) as session:
             all_configs = session.query(orm.Config).order_by(orm.Config.departure_date).all()
         for conf in all_configs:
             if not conf.enabled and conf.id in self._active_tasks:
                 self._active_tasks.pop(conf.id)[1].stop()
+                self.index.remove(conf.id)
                 continue
             if conf.enabled and conf.id not in self._active_tasks:
                 args = models.TrainsOverviewRequestArgs(
@@ -29,7 +36,7 @@ class Collector:
                     departure_station=models.Station(conf.departure_station_id),
                     arrival_station=models.Station(conf.arrival_station_id),
                 )
-                t = task.Task(args, worker=self._worker, config=conf)
+                t = task.Task(args, worker=self._worker, config=conf, index=self.index)
                 await t.schedule_next()
                 self._active_tasks[conf.id] = (conf, t)
 
@@ -42,9 +49,21 @@ class Collector:
     async def _start_worker_loop(self):
         await self._worker.run()
 
+    def _collect_metrics(self):
+        now = time.time()
+        yield '# HELP collector_active_tasks Enabled configs being collected.'
+        yield '# TYPE collector_active_tasks gauge'
+        yield f'collector_active_tasks {len(self._active_tasks)}'
+        yield '# HELP collector_config_last_success_age_seconds Seconds since last successful collection.'
+        yield '# TYPE collector_config_last_success_age_seconds gauge'
+        for conf_id, (_, t) in list(self._active_tasks.items()):
+            if t.last_success is not None:
+                yield f'collector_config_last_success_age_seconds{{config_id="{conf_id}"}} {now - t.last_success:.3f}'
+
     async def run(self):
         logger.info('Starting collector process.')
         self._worker = worker_queue.WorkerQueue()
         self._active_tasks = {}
+        metrics.register_collector(self._collect_metrics)
         await asyncio.gather(self._sync_tasks_from_db(), self._start_worker_loop())
         logger.info('Stopped collector process.')
@@ -1,3 +1,5 @@
+import os
+
 WAIT_SYNC_ITERATION = 60
 SLEEP_AFTER_REQUEST_RANGE = (1, 2)
 MAX_QUEUE_SIZE = 100
@@ -5,3 +7,16 @@ SLEEP_FOR_QUEUE = 0.1
 SLEEP_CONFIG_FETCH = 60
 MAX_DELAY_FOR_DATE = 3 * 3600
 MIN_DELAY_FOR_DATE = 10
+SLEEP_AFTER_FAIL_BASE = 30
+DB_BATCH_SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250)
+
+# Read API over the in-memory snapshot index; disabled when the port is not set
+API_HOST = os.getenv('COLLECTOR_API_HOST', '127.0.0.1')
+API_PORT = int(os.getenv('COLLECTOR_API_PORT', 0)) or None
+LONG_POLL_TIMEOUT = 30
+LONG_POLL_MAX_TIMEOUT = 120
+
+EXPORT_BATCH_SIZE = 50000
+EXPORT_WATERMARK_FILENAME = '_watermark.json'
+
+BACKTEST_BATCH_SIZE = 1000
@@ -0,0 +1,162 @@
+import dataclasses
+import datetime
+import json
+import logging
+import os
+import typing
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from collector_app import codec
+from collector_app import orm
+from collector_app.configs import collector as config
+
+logger = logging.getLogger(__name__)
+
+FORMAT_PARQUET = 'parquet'
+FORMAT_ARROW = 'arrow'
+FORMATS = (FORMAT_PARQUET, FORMAT_ARROW)
+
+
+@dataclasses.dataclass
+class Watermark:
+    """Last exported collected_data.id, kept next to the exported files."""
+    path: str
+    last_id: int = 0
+
+    @classmethod
+    def load(cls, directory: str):
+        path = os.path.join(directory, config.EXPORT_WATERMARK_FILENAME)
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path) as f:
+            return cls(path, json.load(f)['last_id'])
+
+    def save(self, last_id: int):
+        self.last_id = last_id
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'last_id': last_id}, f)
+        os.replace(tmp_path, self.path)
+
+
+def _schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ('id', pa.int64()),
+        ('config_id', pa.int32()),
+        ('departure_date', pa.date32()),
+        ('departure_station', pa.int32()),
+        ('arrival_station', pa.int32()),
+        ('train_number', pa.string()),
+        ('category_code', pa.int16()),
+        ('free_seats', pa.int32()),
+        ('price_from', pa.int64()),
+        ('price_to', pa.int64()),
+        ('collected_at', pa.timestamp('us', tz='UTC')),
+    ])
+
+
+def _tickets(row) -> typing.Iterator[typing.Tuple[int, int, int, typing.Optional[int]]]:
+    """(code, free seats, price_from, price_to) from packed or legacy JSON tickets."""
+    if row.tickets_packed is not None:
+        for code, free_seats, price_from, price_to, _ in codec.iter_records(row.tickets_packed):
+            yield code, free_seats, price_from, price_to
+        return
+    for ticket in row.tickets_json or ():
+        yield (
+            ticket['category']['code'],
+            ticket['free_seats'],
+            codec.to_kopecks(ticket['price_from']),
+            codec.to_kopecks(ticket['price_to']),
+        )
+
+
+def flatten(row) -> typing.Iterator[dict]:
+    """One output row per ticket category of a collected_data row."""
+    for code, free_seats, price_from, price_to in _tickets(row):
+        yield {
+            'id': row.id,
+            'config_id': row.config_id,
+            'departure_date': row.departure_date,
+            'departure_station': row.departure_station_id,
+            'arrival_station': row.arrival_station_id,
+            'train_number': row.train_number,
+            'category_code': code,
+            'free_seats': free_seats,
+            'price_from': price_from,
+            'price_to': price_to,
+            'collected_at': row.collected_at,
+        }
+
+
+def _query(after_id: int):
+    return (
+        select(
+            orm.CollectedData.id,
+            orm.CollectedData.config_id,
+            orm.CollectedData.train_number,
+            orm.CollectedData.tickets_json,
+            orm.CollectedData.tickets_packed,
+            orm.CollectedData.collected_at,
+            orm.Config.departure_date,
+            orm.Config.departure_station_id,
+            orm.Config.arrival_station_id,
+        )
+        .join(orm.Config)
+        .where(orm.CollectedData.id > after_id)
+        .order_by(orm.CollectedData.id)
+    )
+
+
+def _write_partition(directory: str, date: datetime.date, rows: typing.List[dict], fmt: str):
+    import pyarrow as pa
+
+    partition = os.path.join(directory, f'collected_date={date.isoformat()}')
+    os.makedirs(partition, exist_ok=True)
+    # IDs make names unique, so a rerun after a crash overwrites instead of duplicating
+    filename = f'part-{rows[0]["id"]}-{rows[-1]["id"]}.{fmt}'
+    table = pa.Table.from_pylist(rows, schema=_schema())
+    if fmt == FORMAT_PARQUET:
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, os.path.join(partition, filename))
+    else:
+        import pyarrow.feather as feather
+
+        feather.write_feather(table, os.path.join(partition, filename))
+
+
+def export(
+        directory: str,
+        fmt: str = FORMAT_PARQUET,
+        batch_size: int = config.EXPORT_BATCH_SIZE,
+) -> int:
+    """Export rows collected after the saved watermark. Returns the number of output rows."""
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format {fmt!r}')
+    os.makedirs(directory, exist_ok=True)
+    watermark = Watermark.load(directory)
+    logger.info('Exporting collected data after id %s to %s', watermark.last_id, directory)
+
+    exported = 0
+    with Session(orm.get_engine()) as session:
+        # Server side cursor: memory is bounded by the batch size, not by the table
+        result = session.execute(
+            _query(watermark.last_id),
+            execution_options={'yield_per': batch_size},
+        )
+        for batch in result.partitions():
+            partitions: typing.Dict[datetime.date, typing.List[dict]] = {}
+            for row in batch:
+                date = row.collected_at.astimezone(datetime.timezone.utc).date()
+                partitions.setdefault(date, []).extend(flatten(row))
+            for date, rows in partitions.items():
+                if rows:
+                    _write_partition(directory, date, rows, fmt)
+                    exported += len(rows)
+            watermark.save(batch[-1].id)
+            logger.info('Exported up to id %s, %d rows so far', watermark.last_id, exported)
+    return exported
@@ -1,5 +1,6 @@
 import logging
 import time
+import typing
 
 from sqlalchemy import Boolean
 from sqlalchemy import Column
@@ -7,8 +8,11 @@ from sqlalchemy import Date
 from sqlalchemy import DateTime
 from sqlalchemy import ForeignKey
 from sqlalchemy import Integer
+from sqlalchemy import LargeBinary
 from sqlalchemy import String
 from sqlalchemy import create_engine
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import relationship
@@ -18,11 +22,18 @@ from collector_app.configs import database as config
 
 Base = declarative_base()
 
-assert config.DB_CONNECTION_STRING, 'Connection string is empty'
-engine = create_engine(config.DB_CONNECTION_STRING, echo=config.DB_ECHO, future=True)
+_engine: typing.Optional[Engine] = None
 
 logger = logging.getLogger(__name__)
 
+# Idempotent changes of tables created by older versions
+_MIGRATIONS = (
+    'ALTER TABLE collected_data ADD COLUMN IF NOT EXISTS tickets_packed BYTEA',
+    'ALTER TABLE collected_data ALTER COLUMN tickets_json DROP NOT NULL',
+    # Rows briefly stored as whole overview responses get back to the train list
+    "UPDATE collected_data_raw SET raw_data = raw_data #> '{tp,0,list}' WHERE jsonb_typeof(raw_data) = 'object'",
+)
+
 
 class Config(Base):
     __tablename__ = "config"
@@ -43,7 +54,9 @@ class CollectedData(Base):
     __tablename__ = "collected_data"
     id = Column(Integer, primary_key=True)
     train_number = Column(String, nullable=False)
-    tickets_json = Column(JSONB, nullable=False)
+    # Legacy rows only, new ones are written to tickets_packed (see codec)
+    tickets_json = Column(JSONB, nullable=True)
+    tickets_packed = Column(LargeBinary, nullable=True)
     collected_at = Column(DateTime(timezone=True), nullable=False, server_default=functions.now())
     config_id = Column(Integer, ForeignKey("config.id"), nullable=False)
 
@@ -66,8 +79,19 @@ class CollectedDataRaw(Base):
         return f"CollectedDataRaw(id={self.id!r})"
 
 
+def get_engine() -> Engine:
+    """The engine is created on first use, importing the models needs no database."""
+    global _engine
+    if _engine is None:
+        if not config.DB_CONNECTION_STRING:
+            raise RuntimeError('Connection string is empty')
+        _engine = create_engine(config.DB_CONNECTION_STRING, echo=config.DB_ECHO, future=True)
+    return _engine
+
+
 def create_all(force_recreate=False):
     print('Start creating all...')
+    engine = get_engine()
     if force_recreate:
         print('[WARNING] About to DROP and then create all tables...')
         for i in range(5, 0, -1):
@@ -76,6 +100,9 @@ def create_all(force_recreate=False):
 
         Base.metadata.drop_all(engine)
     Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for statement in _MIGRATIONS:
+            connection.execute(text(statement))
     print('Done!')
 
 
@@ -84,7 +111,7 @@ if __name__ == "__main__":
     from sqlalchemy.orm import Session
 
     create_all()
-    with Session(engine) as session:
+    with Session(get_engine()) as session:
         session.add_all([
             Config(
                 departure_date=datetime.date.today(),
@@ -0,0 +1,126 @@
+import asyncio
+import datetime
+import typing
+
+from collector_app import orm
+from rzd_client import models
+
+# train number -> service category code -> entry
+ConfigSnapshot = typing.Dict[str, typing.Dict[int, dict]]
+
+
+def _entry(category: models.AvailableServiceCategory, collected_at: str) -> dict:
+    return {
+        'category': category.category.code,
+        'char_code': category.category.char_code,
+        'free_seats': category.free_seats,
+        'price_from': str(category.price_from),
+        'price_to': str(category.price_to) if category.price_to else None,
+        'collected_at': collected_at,
+    }
+
+
+def _same(a: dict, b: dict) -> bool:
+    # Collection time alone is not a change
+    return {**a, 'collected_at': None} == {**b, 'collected_at': None}
+
+
+class SnapshotIndex:
+    """Latest availability per (config, train, category), with a version bumped on every change."""
+
+    def __init__(self):
+        self.version = 0
+        self._routes: typing.Dict[int, dict] = {}
+        self._snapshots: typing.Dict[int, ConfigSnapshot] = {}
+        self._versions: typing.Dict[int, int] = {}
+        self._changed = asyncio.Event()
+
+    def _bump(self, config_id: int):
+        self.version += 1
+        self._versions[config_id] = self.version
+        # Wake up every long poll waiting for the current event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def update(self, config: orm.Config, trains: typing.List[models.TrainOverview]):
+        collected_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        snapshot = {
+            train.number: {
+                category.category.code: _entry(category, collected_at)
+                for category in train.service_categories
+            }
+            for train in trains
+        }
+        self._routes[config.id] = {
+            'config_id': config.id,
+            'departure_date': config.departure_date.isoformat(),
+            'departure_station': config.departure_station_id,
+            'arrival_station': config.arrival_station_id,
+        }
+        old = self._snapshots.get(config.id)
+        changed = old is None or old.keys() != snapshot.keys() or any(
+            old[number].keys() != categories.keys()
+            or not all(_same(old[number][code], entry) for code, entry in categories.items())
+            for number, categories in snapshot.items()
+        )
+        self._snapshots[config.id] = snapshot
+        if changed:
+            self._bump(config.id)
+
+    def remove(self, config_id: int):
+        if self._snapshots.pop(config_id, None) is not None:
+            del self._routes[config_id]
+            # The version stays as a tombstone, so that long polls see the removal
+            self._bump(config_id)
+
+    def config_version(self, config_id: int) -> typing.Optional[int]:
+        if config_id not in self._snapshots:
+            return None
+        return self._versions[config_id]
+
+    def view(self, config_id: int) -> typing.Optional[dict]:
+        snapshot = self._snapshots.get(config_id)
+        if snapshot is None:
+            return None
+        return {
+            **self._routes[config_id],
+            'version': self._versions[config_id],
+            'trains': {
+                number: list(categories.values())
+                for number, categories in sorted(snapshot.items())
+            },
+        }
+
+    def find(
+            self,
+            departure_date: typing.Optional[datetime.date] = None,
+            departure_station: typing.Optional[int] = None,
+            arrival_station: typing.Optional[int] = None,
+    ) -> typing.List[dict]:
+        res = []
+        for config_id, route in sorted(self._routes.items()):
+            if departure_date is not None and route['departure_date'] != departure_date.isoformat():
+                continue
+            if departure_station is not None and route['departure_station'] != departure_station:
+                continue
+            if arrival_station is not None and route['arrival_station'] != arrival_station:
+                continue
+            res.append(self.view(config_id))
+        return res
+
+    def changed_since(self, version: int) -> typing.List[dict]:
+        return [
+            self.view(config_id) or {'config_id': config_id, 'version': config_version, 'removed': True}
+            for config_id, config_version in sorted(self._versions.items())
+            if config_version > version
+        ]
+
+    async def wait_changed(self, version: int, timeout: float) -> bool:
+        """Wait until the index is newer than ``version``. False on timeout."""
+        if self.version > version:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
@@ -1,38 +1,54 @@
 import asyncio
-import dataclasses
 import datetime
 import logging
+import time
 import typing
 
 import pytz
+from sqlalchemy import Text
+from sqlalchemy import cast
+from sqlalchemy import literal
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Session
 
+from collector_app import codec
 from collector_app import orm
+from collector_app import snapshots
 from collector_app import worker_queue
 from collector_app.configs import collector as config
 from rzd_client import models
+from shared import metrics
 
 logger = logging.getLogger(__name__)
 
+DB_WRITE_LATENCY = metrics.Histogram('collector_db_write_seconds', 'Latency of statistics writes.')
+DB_WRITE_BATCH = metrics.Histogram(
+    'collector_db_write_batch_rows', 'Rows per statistics write.', buckets=config.DB_BATCH_SIZE_BUCKETS,
+)
+
 
 class Task:
     def __init__(
             self,
             args: models.TrainsOverviewRequestArgs,
             config: orm.Config,
-            worker: worker_queue.WorkerQueue
+            worker: worker_queue.WorkerQueue,
+            index: typing.Optional[snapshots.SnapshotIndex] = None,
     ):
         self._args = args
         self._config = config
         self._worker = worker
+        self._index = index
 
         self._id = config.id
         self._stop = False
+        self._fails_count = 0
+        self.last_success: typing.Optional[float] = None
 
     def _check_can_process(self) -> bool:
         today = today_msk()
         if today > self._args.departure_date:
-            logger.info(f'ID: {self._id}. Departure date at past. Stop.')
+            logger.info('ID: %s. Departure date at past. Stop.', self._id)
             return False
         return not self._stop
 
@@ -40,61 +56,67 @@ class Task:
         days = (self._args.departure_date - today_msk()).days
         days = max(days, 0)
         delay = calculate_delay(days)
-        logger.info(f'ID: {self._id}. Delay: {delay} sec.')
+        logger.info('ID: %s. Delay: %s sec.', self._id, delay)
         return delay
 
-    async def callback(self, is_success: bool, trains: typing.List[models.TrainOverview]):
+    async def callback(
+            self,
+            is_success: bool,
+            trains: typing.List[models.TrainOverview],
+            raw: typing.Optional[str] = None,
+            retry_in: float = 0.0,
+    ):
         if not is_success:
-            logger.warning(f'ID: {self._id}. Cannot fetch trains. Schedule next.')
+            delay = max(retry_in, min(self._fails_count * config.SLEEP_AFTER_FAIL_BASE, config.MAX_DELAY_FOR_DATE))
+            self._fails_count += 1
+            logger.warning('ID: %s. Cannot fetch trains. Retry in %.1f sec.', self._id, delay)
+            await asyncio.sleep(delay)
             await self.schedule_next()
             return
-        logger.info(f'ID: {self._id}. Fetched {len(trains)} trains.')
-        await self._write_statistics(trains)
+        self._fails_count = 0
+        logger.info('ID: %s. Fetched %d trains.', self._id, len(trains))
+        await self._write_statistics(trains, raw)
+        if self._index is not None:
+            self._index.update(self._config, trains)
+        self.last_success = time.time()
         await asyncio.sleep(self._calculate_delay())
         await self.schedule_next()
 
     def stop(self):
         self._stop = True
 
-    async def _write_statistics(self, trains):
-        data_objs, data_raw_obj = extract_statistics(trains, self._config)
-        with Session(orm.engine) as session:
+    async def _write_statistics(self, trains, raw=None):
+        data_objs, data_raw_obj = extract_statistics(trains, self._config, raw)
+        started = time.monotonic()
+        # The rows pull self._config into the session: expiring it would leave it detached and unloaded
+        with Session(orm.get_engine(), expire_on_commit=False) as session:
             session.add_all([data_raw_obj, *data_objs])
             session.commit()
+        DB_WRITE_LATENCY.observe(time.monotonic() - started)
+        DB_WRITE_BATCH.observe(len(data_objs) + 1)
 
     async def schedule_next(self):
         if not self._check_can_process():
-            logger.info(f'Task stopped, id: {self._id}')
+            logger.info('Task stopped, id: %s', self._id)
             return
         await self._worker.schedule_query(self._args, self.callback)
 
 
-def _tickets_from_service_categories(
-        service_categories: typing.List[models.AvailableServiceCategory]
-) -> typing.List[dict]:
-    res = []
-    for category in service_categories:
-        data = dataclasses.asdict(category)
-        data['category']['char_code'] = category.category.char_code
-        data['price_from'] = str(category.price_from)
-        data['price_to'] = str(category.price_to) if category.price_to else None
-        data['rzd_bonus_points'] = str(category.rzd_bonus_points) if category.rzd_bonus_points else None
-        res.append(data)
-    return res
-
-
-def extract_statistics(trains: typing.List[models.TrainOverview], config):
+def extract_statistics(trains: typing.List[models.TrainOverview], config, raw: typing.Optional[str] = None):
+    """``raw`` is the response text: the database parses it into JSONB and keeps the train list."""
     data_objs = []
-    raw_data = []
     for train in trains:
         data_objs.append(
             orm.CollectedData(
                 train_number=train.number,
-                tickets_json=_tickets_from_service_categories(train.service_categories),
+                tickets_packed=codec.encode(train.service_categories),
                 config=config,
             )
         )
-        raw_data.append(train.show_raw_data())
+    if raw is not None:
+        raw_data = cast(literal(raw, Text), JSONB)['tp'][0]['list']
+    else:
+        raw_data = [train.show_raw_data() for train in trains]
     data_raw_obj = orm.CollectedDataRaw(raw_data=raw_data, config=config)
     return data_objs, data_raw_obj
 
@@ -8,9 +8,16 @@ import typing
 from collector_app.configs import collector as config
 from rzd_client import client
 from rzd_client import models
+from rzd_client import resilience
+from rzd_client import tracing
+from shared import metrics
 
 logger = logging.getLogger(__name__)
 
+QUEUE_DEPTH = metrics.Gauge('collector_queue_depth', 'Requests waiting in WorkerQueue.')
+QUEUE_WAIT = metrics.Histogram('collector_queue_wait_seconds', 'Time spent by requests in WorkerQueue.')
+CALLBACKS_PENDING = metrics.Gauge('collector_callbacks_pending', 'Task callbacks waiting to be processed.')
+
 
 class WorkerQueue:
     _client: client.RZDClient
@@ -18,6 +25,7 @@ class WorkerQueue:
     def __init__(self):
         self._request_queue = collections.deque()
         self._tasks_queue = asyncio.Queue()
+        self._worker_task: typing.Optional[asyncio.Task] = None
 
     @staticmethod
     def _generate_delay():
@@ -25,33 +33,45 @@ class WorkerQueue:
 
     async def schedule_query(self, args: models.TrainsOverviewRequestArgs, callback: typing.Callable):
         if len(self._request_queue) >= config.MAX_QUEUE_SIZE:
-            logger.warning(f'Queue exceeded max size! Current size: {len(self._request_queue)}.')
+            logger.warning('Queue exceeded max size! Current size: %d.', len(self._request_queue))
         while len(self._request_queue) >= config.MAX_QUEUE_SIZE:
             await asyncio.sleep(config.MAX_QUEUE_SIZE)
         self._request_queue.append((args, callback, time.time()))
+        QUEUE_DEPTH.set(len(self._request_queue))
 
     async def _process_one_task(self):
         args, callback, start = self._request_queue.popleft()
+        QUEUE_DEPTH.set(len(self._request_queue))
+        QUEUE_WAIT.observe(time.time() - start)
+        retry_in = 0.0
         try:
-            trains = await self._client.fetch_trains_overview(args)
+            trains, raw = await self._client.fetch_trains_overview_raw(args)
+        except resilience.CircuitOpenError as e:
+            # Failed fast: the task waits for the breaker instead of cycling through the queue
+            logger.info('Skip overview %s: %s', args, e)
+            is_success = False
+            trains, raw, retry_in = [], None, e.retry_in
         except Exception:
             is_success = False
-            trains = []
+            trains, raw = [], None
         else:
             logger.info('Successfully fetched trains. Spent in queue: %.3f sec.', time.time() - start)
             is_success = True
 
-        self._tasks_queue.put_nowait(asyncio.create_task(callback(is_success, trains)))
+        name = f'collector-callback-{args.departure_date}-{args.departure_station.code}-{args.arrival_station.code}'
+        self._tasks_queue.put_nowait(asyncio.create_task(callback(is_success, trains, raw, retry_in), name=name))
+        CALLBACKS_PENDING.set(self._tasks_queue.qsize())
 
     async def _tasks_worker(self):
         while True:
             task = await self._tasks_queue.get()
             await task
             self._tasks_queue.task_done()
+            CALLBACKS_PENDING.set(self._tasks_queue.qsize())
 
     async def run(self):
-        asyncio.create_task(self._tasks_worker())
-        async with client.RZDClient() as self._client:
+        self._worker_task = asyncio.create_task(self._tasks_worker(), name='collector-callbacks-worker')
+        async with client.RZDClient(caller=tracing.CALLER_COLLECTOR) as self._client:
             while True:
                 if self._request_queue:
                     await self._process_one_task()
@@ -0,0 +1,94 @@
+import argparse
+import datetime
+import json
+
+from collector_app import backtest
+from collector_app import configs
+from rzd_client import config as rzd_config
+from shared import logs
+
+CATEGORY_CODE_BY_CHAR_CODE = {v: k for k, v in rzd_config.CHAR_CODE_BY_SERVICE_CATEGORY_MAPPER.items()}
+
+
+def _datetime(value: str) -> datetime.datetime:
+    res = datetime.datetime.fromisoformat(value)
+    return res if res.tzinfo else backtest.MSK.localize(res)
+
+
+def _positive(value: str) -> float:
+    res = float(value)
+    if res <= 0:
+        raise argparse.ArgumentTypeError(f'must be positive, got {value}')
+    return res
+
+
+def format_report(report: dict) -> str:
+    def seconds(stats):
+        return ', '.join(f'{name} {value:.0f} s' for name, value in stats.items()) or 'no data'
+
+    catch_rate = report['catch_rate']
+    per_caught = report['requests_per_caught']
+    return '\n'.join((
+        f"Configs: {report['configs']}, snapshots replayed: {report['snapshots']}",
+        f"Availability appearances: {report['appearances']}, caught {report['caught']}, "
+        f"missed {report['missed']}, pending {report['pending']}"
+        + (f', catch rate {catch_rate:.1%}' if catch_rate is not None else ''),
+        f"Notification delay: {seconds(report['delay_seconds'])}",
+        f"Requests: {report['requests']}"
+        + (f', {per_caught:.1f} per caught appearance' if per_caught is not None else ''),
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Replay collected snapshots through a polling schedule and a notification policy.',
+    )
+    parser.add_argument(
+        '--config-id',
+        dest='config_ids',
+        type=int,
+        action='append',
+        help='Replay only this config, may be repeated. Default is all',
+    )
+    parser.add_argument('--since', type=_datetime, help='ISO date/time, Moscow time unless given')
+    parser.add_argument('--until', type=_datetime, help='ISO date/time, Moscow time unless given')
+    schedule = parser.add_mutually_exclusive_group()
+    schedule.add_argument(
+        '--delay',
+        type=_positive,
+        help='Fixed delay between polls, seconds. Default is the collector schedule',
+    )
+    schedule.add_argument(
+        '--delay-scale',
+        type=_positive,
+        help='Multiply the collector schedule by this factor',
+    )
+    parser.add_argument(
+        '--type',
+        dest='types',
+        choices=CATEGORY_CODE_BY_CHAR_CODE,
+        action='append',
+        help='Car type to watch, may be repeated. Default is any',
+    )
+    parser.add_argument('--count', type=int, default=1, help='Requested seats count. Default is 1')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+    logs.setup_logging(configs.LOG_FILENAME)
+
+    if args.delay is not None:
+        schedule_policy = backtest.fixed_schedule(args.delay)
+    elif args.delay_scale is not None:
+        schedule_policy = backtest.scaled_schedule(backtest.default_schedule, args.delay_scale)
+    else:
+        schedule_policy = backtest.default_schedule
+    notify_policy = backtest.FreeSeatsPolicy(
+        cars_type_codes=frozenset(CATEGORY_CODE_BY_CHAR_CODE[t] for t in args.types) if args.types else None,
+        requested_count=args.count,
+    )
+    engine = backtest.Backtest(schedule_policy, notify_policy)
+    report = engine.run(backtest.load_snapshots(args.config_ids, args.since, args.until)).as_dict()
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,33 @@
 from app import bot
+from app import configs
+from app import handlers
+from app import webhook
+from app.configs import bot as config
 from aiogram import executor
 
+from shared import logs
+from shared import metrics
+from shared import profiling
+
+
+async def on_startup(dispatcher):
+    profiling.install()
+    await metrics.start_server()
+    await handlers.restore_monitors()
+
+
+async def on_webhook_startup():
+    profiling.install()
+    await handlers.restore_monitors()
+
 
 def main():
-    executor.start_polling(bot.dispatcher, skip_updates=True)
+    logs.setup_logging(configs.LOG_FILENAME)
+    dispatcher = bot.setup()
+    if config.WEBHOOK_PORT:
+        webhook.run(dispatcher, on_startup=on_webhook_startup)
+    else:
+        executor.start_polling(dispatcher, skip_updates=True, on_startup=on_startup)
 
 
 if __name__ == '__main__':
@@ -1,12 +1,30 @@
 import asyncio
 
 from collector_app import collector
+from collector_app import configs
 from collector_app import orm
+from collector_app.configs import collector as config
+from shared import logs
+from shared import metrics
+from shared import profiling
+
+
+async def _run():
+    profiling.install()
+    await metrics.start_server()
+    collector_ = collector.Collector()
+    if config.API_PORT:
+        # aiohttp.web is loaded only when the read API is served
+        from collector_app import api
+
+        await api.start_server(collector_.index)
+    await collector_.run()
 
 
 def main():
+    logs.setup_logging(configs.LOG_FILENAME)
     orm.create_all()
-    asyncio.run(collector.Collector().run())
+    asyncio.run(_run())
 
 
 if __name__ == '__main__':
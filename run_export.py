@@ -0,0 +1,39 @@
+import argparse
+
+from collector_app import configs
+from collector_app import export
+from collector_app.configs import collector as config
+from shared import logs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Export collected tickets history to partitioned columnar files.',
+    )
+    parser.add_argument(
+        dest='directory',
+        type=str,
+        help='Output directory. Export continues from the watermark saved there',
+    )
+    parser.add_argument(
+        '--format',
+        dest='fmt',
+        choices=export.FORMATS,
+        default=export.FORMAT_PARQUET,
+        help='Output files format. Default is parquet',
+    )
+    parser.add_argument(
+        '--batch-size',
+        dest='batch_size',
+        type=int,
+        default=config.EXPORT_BATCH_SIZE,
+        help='Rows fetched from the database at once',
+    )
+    args = parser.parse_args()
+    logs.setup_logging(configs.LOG_FILENAME)
+    rows = export.export(args.directory, args.fmt, args.batch_size)
+    print(f'Exported {rows} rows')
+
+
+if __name__ == '__main__':
+    main()
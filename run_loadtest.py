@@ -0,0 +1,39 @@
+import argparse
+import asyncio
+import dataclasses
+import json
+
+from app import configs
+from app import loadtest
+from shared import logs
+
+
+def main():
+    defaults = loadtest.Options()
+    parser = argparse.ArgumentParser(
+        description='Load test of the bot with simulated users, fake Telegram and fake RZD.',
+    )
+    for field in dataclasses.fields(loadtest.Options):
+        parser.add_argument(
+            '--' + field.name.replace('_', '-'),
+            dest=field.name,
+            type=field.type,
+            default=getattr(defaults, field.name),
+            help=f'Default is {getattr(defaults, field.name)}',
+        )
+    parser.add_argument(
+        '--json',
+        dest='json',
+        action='store_true',
+        help='Print the report as JSON',
+    )
+    args = vars(parser.parse_args())
+    as_json = args.pop('json')
+    logs.setup_logging(configs.LOG_FILENAME)
+
+    report = asyncio.run(loadtest.LoadTest(loadtest.Options(**args)).run())
+    print(json.dumps(report, indent=4) if as_json else loadtest.format_report(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,11 @@
 import asyncio
+import sys
 from pprint import pprint
 
+from app import batch
+from app import configs
 from app.monitor import AsyncMonitor
-from rzd_client import models
+from shared import logs
 
 
 def main():
@@ -14,26 +17,35 @@ def main():
     parser.add_argument(
         dest='departure',
         type=str,
+        nargs='?',
         help='Departure station ID (e.g. "2010290")',
     )
     parser.add_argument(
         dest='destination',
         type=str,
+        nargs='?',
         help='Destination station ID (e.g. "2004000")',
     )
     parser.add_argument(
-        dest='train', type=str, help='Train number (e.g. "617Я")',
+        dest='train',
+        type=str,
+        nargs='?',
+        help=(
+            'Train number (e.g. "617Я"), comma separated numbers '
+            f'or "{batch.ANY_TRAIN}" for any train'
+        ),
     )
     parser.add_argument(
         dest='date',
         type=str,
+        nargs='?',
         help='Desired date. Follow this pattern: 05.05.2019',
     )
     parser.add_argument(
         '--type',
         dest='car_type',
         choices=['Плац', 'Люкс', 'Купе', 'Сид', 'Мягкий'],
-        default='Плац',
+        default=batch.DEFAULT_CAR_TYPE,
         help='Defines car type. default=\'Плац\'',
     )
     parser.add_argument(
@@ -43,21 +55,57 @@ def main():
         default=1,
         help='Quantity of tickets. Default is 1',
     )
+    parser.add_argument(
+        '--date-to',
+        dest='date_to',
+        type=str,
+        help='Watch every date up to this one (e.g. 10.05.2019)',
+    )
+    parser.add_argument(
+        '--batch',
+        dest='batch',
+        type=str,
+        help=(
+            'JSONL or CSV file of monitors (fields: id, departure, destination, '
+            'train, date, type, count, date_to). Results are JSON lines on stdout'
+        ),
+    )
+    parser.add_argument(
+        '--concurrency',
+        dest='concurrency',
+        type=int,
+        default=4,
+        help='Batch mode: RZD fetches in flight at once. Default is 4',
+    )
+    parser.add_argument(
+        '--timeout',
+        dest='timeout',
+        type=float,
+        help='Batch mode: stop monitors still running after this many seconds',
+    )
 
     args = parser.parse_args()
+    if not args.batch and None in (args.departure, args.destination, args.train, args.date):
+        parser.error('departure, destination, train and date are required without --batch')
+    logs.setup_logging(configs.LOG_FILENAME)
 
-    rzd_args = models.TrainDetailedRequestArgs.from_rzd_args(
-        {
-            'code0': args.departure,
-            'code1': args.destination,
-            'dt0': args.date,
-            'tnum0': args.train,
-        }
-    )
-
-    pprint(rzd_args.as_rzd_args())
+    if args.batch:
+        runner = batch.BatchRunner(args.concurrency, args.timeout)
+        sys.exit(asyncio.run(runner.run(batch.read_definitions(args.batch))))
 
-    mon = AsyncMonitor(rzd_args, args.count, args.car_type)
+    definition = batch.MonitorDefinition(
+        id='1',
+        departure=args.departure,
+        destination=args.destination,
+        train=args.train,
+        date=args.date,
+        type=args.car_type,
+        count=args.count,
+        date_to=args.date_to,
+    )
+    mon = batch.build_monitor(definition)
+    if isinstance(mon, AsyncMonitor):
+        pprint(mon.args.as_rzd_args())
     asyncio.run(mon.run())
 
 
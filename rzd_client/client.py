@@ -1,5 +1,7 @@
+import asyncio
 import json
 import logging
+import time
 import typing
 
 import aiohttp
@@ -9,30 +11,102 @@ import aiohttp_socks
 from . import config
 from . import common
 from . import models
+from . import resilience
+from . import scheduler
+from . import tracing
 
 
 logger = logging.getLogger(config.LOGGER_NAME)
 
 
 class RZDClient:
-    def __init__(self):
+    def __init__(
+            self,
+            caller: str = tracing.CALLER_UNKNOWN,
+            breakers: typing.Optional[typing.Dict[str, resilience.CircuitBreaker]] = None,
+            retry_budget: typing.Optional[resilience.RetryBudget] = None,
+            hedge: bool = config.HEDGE_ENABLED,
+            priority: typing.Optional[str] = None,
+            concurrency: typing.Optional[int] = None,
+    ):
         self._session: typing.Optional[aiohttp.ClientSession] = None
+        self._hedge_session: typing.Optional[aiohttp.ClientSession] = None
+        self._caller = caller
+        self._hedge = hedge
+        # Requests of interactive callers go first, see scheduler
+        self._priority = priority or scheduler.PRIORITY_BY_CALLER.get(caller, scheduler.PRIORITY_MONITOR)
+        # Shared by default: RZD health is the same for every client in the process
+        self._breakers = resilience.BREAKERS if breakers is None else breakers
+        self._retry_budget = resilience.RETRY_BUDGET if retry_budget is None else retry_budget
+        # Bounds fetches in flight when many monitors share the client
+        self._semaphore = asyncio.Semaphore(concurrency) if concurrency else None
 
     @staticmethod
-    def _socks5_proxy_connector_or_none():
-        if not config.SOCKS5_PROXY_STRING:
+    def _socks5_proxy_connector_or_none(proxy_string=config.SOCKS5_PROXY_STRING):
+        if not proxy_string:
             return None
-        return aiohttp_socks.ProxyConnector.from_url(config.SOCKS5_PROXY_STRING)
+        return aiohttp_socks.ProxyConnector.from_url(proxy_string)
 
-    async def __aenter__(self):
-        self._session = aiohttp.ClientSession(
+    @classmethod
+    def _create_session(cls, proxy_string=config.SOCKS5_PROXY_STRING) -> aiohttp.ClientSession:
+        return aiohttp.ClientSession(
             headers=config.HEADERS,
-            connector=self._socks5_proxy_connector_or_none(),
+            connector=cls._socks5_proxy_connector_or_none(proxy_string),
+            trace_configs=[tracing.trace_config()],
         )
+
+    async def __aenter__(self):
+        self._session = self._create_session()
+        if self._hedge:
+            # Own connection pool, so a hedge never queues behind the stuck connection
+            self._hedge_session = self._create_session(config.HEDGE_PROXY_STRING or config.SOCKS5_PROXY_STRING)
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self._session.close()
+        if self._hedge_session is not None:
+            await self._hedge_session.close()
+
+    async def _fetch(self, endpoint: str, attempt: typing.Callable[[aiohttp.ClientSession], typing.Awaitable]):
+        """Run ``attempt`` with the main session, hedged through the second one when it is slow."""
+        token = scheduler.set_priority(self._priority)
+        try:
+            if self._semaphore is None:
+                return await self._fetch_hedged(endpoint, attempt)
+            async with self._semaphore:
+                return await self._fetch_hedged(endpoint, attempt)
+        finally:
+            scheduler.reset_priority(token)
+
+    async def _fetch_hedged(self, endpoint: str, attempt: typing.Callable[[aiohttp.ClientSession], typing.Awaitable]):
+        latencies = resilience.LATENCIES[endpoint]
+        delay = latencies.percentile(config.HEDGE_PERCENTILE) if self._hedge_session else None
+        started = time.monotonic()
+        if delay is None:
+            result = await attempt(self._session)
+            latencies.observe(time.monotonic() - started)
+            return result
+
+        hedge_started = None
+
+        async def second():
+            nonlocal hedge_started
+            hedge_started = time.monotonic()
+            latencies.hedged += 1
+            return await attempt(self._hedge_session)
+
+        result, second_won = await resilience.hedge(
+            lambda: attempt(self._session),
+            second,
+            max(delay, config.HEDGE_MIN_DELAY),
+            self._retry_budget,
+        )
+        if second_won:
+            latencies.hedge_wins += 1
+            latencies.observe(time.monotonic() - hedge_started)
+        else:
+            latencies.observe(time.monotonic() - started)
+        return result
 
     async def fetch_station_suggests(self, string: str, lang: str = 'ru') -> dict:
         if len(string) < 2:
@@ -42,14 +116,19 @@ class RZDClient:
             )
             raise ValueError(message)
         string = string.strip()[:2].upper()
-        return await self._fetch_station_suggests_raw(string, lang)
+        with tracing.trace(tracing.ENDPOINT_SUGGESTS, self._caller), self._breakers[tracing.ENDPOINT_SUGGESTS]:
+            return await self._fetch(
+                tracing.ENDPOINT_SUGGESTS,
+                lambda session: self._fetch_station_suggests_raw(session, string, lang),
+            )
 
-    async def _fetch_station_suggests_raw(self, string: str, lang: str) -> dict:
+    async def _fetch_station_suggests_raw(self, session: aiohttp.ClientSession, string: str, lang: str) -> dict:
         params = {'stationNamePart': string, 'lang': lang}
         data = await common.rzd_request(
-            self._session,
+            session,
             hdrs.METH_GET,
             url=config.SUGGESTS_BASE_URL,
+            retry_budget=self._retry_budget,
             params=params
         )
         if not data:
@@ -58,31 +137,44 @@ class RZDClient:
         suggests_dict = {}
         for doc in data:
             suggests_dict[doc['n']] = doc['c']
-        logger.debug(
-            'Suggests data: {}'.format(
-                json.dumps(suggests_dict, ensure_ascii=False),
-            ),
-        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Suggests data: %s', json.dumps(suggests_dict, ensure_ascii=False))
         return suggests_dict
 
+    def _rid_attempt(self, url: str, args: dict, parse: typing.Callable, with_body: bool = False):
+        def attempt(session: aiohttp.ClientSession):
+            return common.rzd_rid_request(
+                session=session,
+                url=url,
+                args=args,
+                retry_budget=self._retry_budget,
+                parse=parse,
+                with_body=with_body,
+            )
+        return attempt
+
     async def fetch_train_detailed(self, args: models.TrainDetailedRequestArgs) -> models.TrainOverview:
-        data = await common.rzd_rid_request(
-            session=self._session,
-            url=config.BASE_URL,
-            args=args.as_rzd_args()
-        )
-        train = models.TrainDetailed.from_rzd_json(data['lst'][0])
-        return train
+        with tracing.trace(tracing.ENDPOINT_DETAILED, self._caller), self._breakers[tracing.ENDPOINT_DETAILED]:
+            return await self._fetch(
+                tracing.ENDPOINT_DETAILED,
+                self._rid_attempt(config.BASE_URL, args.as_rzd_args(), models.parse_train_detailed),
+            )
 
     async def fetch_trains_overview(self, args: models.TrainsOverviewRequestArgs) -> typing.List[models.TrainOverview]:
-        data = await common.rzd_rid_request(
-            session=self._session,
-            url=config.SUGGEST_TRAINS_URL,
-            args=args.as_rzd_args()
-        )
+        with tracing.trace(tracing.ENDPOINT_OVERVIEW, self._caller), self._breakers[tracing.ENDPOINT_OVERVIEW]:
+            return await self._fetch(
+                tracing.ENDPOINT_OVERVIEW,
+                self._rid_attempt(config.SUGGEST_TRAINS_URL, args.as_rzd_args(), models.parse_trains_overview),
+            )
 
-        trains = [
-            models.TrainOverview.from_rzd_json(raw)
-            for raw in data['tp'][0]['list']
-        ]
-        return trains
+    async def fetch_trains_overview_raw(
+            self, args: models.TrainsOverviewRequestArgs,
+    ) -> typing.Tuple[typing.List[models.TrainOverview], str]:
+        """Trains and the response text as it came, to be stored without encoding it again."""
+        with tracing.trace(tracing.ENDPOINT_OVERVIEW, self._caller), self._breakers[tracing.ENDPOINT_OVERVIEW]:
+            return await self._fetch(
+                tracing.ENDPOINT_OVERVIEW,
+                self._rid_attempt(
+                    config.SUGGEST_TRAINS_URL, args.as_rzd_args(), models.parse_trains_overview, with_body=True,
+                ),
+            )
@@ -1,8 +1,8 @@
 import asyncio
-import datetime
+import functools
 import itertools
 import logging
-import traceback
+import time
 import typing
 
 import aiohttp
@@ -10,6 +10,14 @@ from aiohttp import hdrs
 import python_socks
 
 from . import config
+from . import decoding
+# Date helpers live apart so that models can be imported without aiohttp
+from .dates import format_rzd_date  # noqa: F401
+from .dates import format_rzd_time  # noqa: F401
+from .dates import parse_rzd_date  # noqa: F401
+from .dates import parse_rzd_date_time  # noqa: F401
+from . import scheduler
+from . import tracing
 
 logger = logging.getLogger(config.LOGGER_NAME)
 
@@ -22,21 +30,38 @@ class RZDNegativeResponse(RuntimeError):
     pass
 
 
-async def rzd_request(session: aiohttp.ClientSession, method: str, url: str, **kwargs: typing.Dict):
+async def rzd_request(
+        session: aiohttp.ClientSession,
+        method: str,
+        url: str,
+        retry_budget=None,
+        parse: typing.Optional[typing.Callable] = None,
+        with_body: bool = False,
+        **kwargs: typing.Dict,
+):
+    """
+    ``retry_budget`` (see resilience.RetryBudget) limits retries after connection errors.
+    ``parse`` turns decoded JSON into the result, possibly in an executor (see decoding).
+    With ``with_body`` returns the result and ``(body bytes, encoding)`` as they came.
+    """
+    trace = tracing.current()
     for i in range(config.REQUEST_ATTEMPTS):
+        if i and retry_budget is not None and not retry_budget.try_spend():
+            raise RZDAPIProblem(config.RETRY_BUDGET_EXHAUSTED)
+        await scheduler.SCHEDULER.acquire()
         try:
-            async with session.request(method, url=url, **kwargs) as response:
-                logger.info(
-                    f'Response status={response.status}, '
-                    f'url={response.url}',
-                )
+            trace.http_requests += 1
+            async with session.request(method, url=url, trace_request_ctx=trace, **kwargs) as response:
+                logger.info('Response status=%s, url=%s', response.status, response.url)
                 if not (200 <= response.status <= 299):
                     raise RZDNegativeResponse(
                         f'Status: {response.status}, '
                         f'text: {await response.text()}'
                     )
-                data = await response.json(content_type=None)
-                return data
+                started = time.monotonic()
+                body = await response.read()
+                trace.body_read += time.monotonic() - started
+                encoding = response.get_encoding()
         except (aiohttp.ClientConnectionError, python_socks.ProxyError) as e:
             max_delay = config.SLEEP_AFTER_UNSUCCESSFUL_REQUEST * (config.REQUEST_ATTEMPTS/2)
             sleep = min(
@@ -44,51 +69,100 @@ async def rzd_request(session: aiohttp.ClientSession, method: str, url: str, **k
                 max_delay,
             )
             logger.warning(
-                f'Cannot fetch data ({repr(e)}). Current attempt is {i + 1}. '
-                f'Sleep: {sleep:.1f} sec.',
+                'Cannot fetch data (%r). Current attempt is %d. Sleep: %.1f sec.',
+                e, i + 1, sleep,
             )
             await asyncio.sleep(sleep)
+            continue
+
+        # The connection is released already, decoding may take a while
+        started = time.monotonic()
+        data = await decoding.decode_and_parse_async(body, encoding, parse)
+        trace.json_decode += time.monotonic() - started
+        if retry_budget is not None:
+            retry_budget.record_success()
+        if with_body:
+            return data, (body, encoding)
+        return data
     raise RZDAPIProblem(config.CANNOT_FETCH_RESULT_FROM_RZD)
 
 
-async def rzd_post_search_request(session, url, args):
+_PARSED_KEY = '_parsed'
+
+
+def _parse_if_ok(parse, data):
+    """Build models together with decoding, but only from the final RID response."""
+    if not isinstance(data, dict) or data.get('result') != 'OK':
+        return data
+    return {'result': 'OK', _PARSED_KEY: parse(data)}
+
+
+def _rid_result(data):
+    return data[_PARSED_KEY] if _PARSED_KEY in data else data
+
+
+async def rzd_post_search_request(session, url, args, retry_budget=None, parse=None, with_body=False):
     log_extra = {'args_': args, 'url': url}
-    logger.info('request: {!r}'.format(log_extra))
-    result_json = await rzd_request(session, hdrs.METH_POST, url, data=args)
+    logger.info('request: %r', log_extra)
+    result_json = await rzd_request(
+        session, hdrs.METH_POST, url, retry_budget=retry_budget, parse=parse, with_body=with_body, data=args,
+    )
     logger.debug('Data: %s', result_json)
     return result_json
 
 
-async def rzd_rid_request(session, url, args):
+async def rzd_rid_request(session, url, args, retry_budget=None, parse=None, with_body=False):
+    """
+    Returns the final JSON, or ``parse(final JSON)`` when ``parse`` is given.
+    With ``with_body`` returns it together with the final response text, only that one is decoded.
+    """
     args_copy = args.copy()
+    if parse is not None:
+        parse = functools.partial(_parse_if_ok, parse)
+
+    async def post():
+        res = await rzd_post_search_request(session, url, args_copy, retry_budget, parse, with_body)
+        return res if with_body else (res, None)
+
+    def done(data, body):
+        result = _rid_result(data)
+        if not with_body:
+            return result
+        content, encoding = body
+        return result, content.decode(encoding)
+
     rid_sleep = config.SLEEP_AFTER_RID_REQUEST
+    trace = tracing.current()
 
     for attempt in range(5):
-        rid_data = await rzd_post_search_request(session, url, args_copy)
+        if attempt and retry_budget is not None and not retry_budget.try_spend():
+            raise RZDAPIProblem(config.RETRY_BUDGET_EXHAUSTED)
+        rid_data, body = await post()
         if rid_data['result'] == 'OK':
-            return rid_data
+            return done(rid_data, body)
 
         await asyncio.sleep(rid_sleep)
 
         if 'RID' not in rid_data:
-            logger.warning(f'Unexpected result. Data: {repr(rid_data)}')
+            logger.warning('Unexpected result. Data: %r', rid_data)
 
         rid = str(rid_data['RID'])
         args_copy['rid'] = rid
 
         for i in range(5):
-            data = await rzd_post_search_request(session, url, args_copy)
+            trace.rid_rounds += 1
+            data, body = await post()
             result = data['result']
             if result == 'RID':
-                logger.info(f'Unexpected RID result. Data: {repr(data)}')
+                logger.info('Unexpected RID result. Data: %r', data)
             elif result == 'OK':
-                return data
+                return done(data, body)
             elif result == 'FAIL':
-                logger.warning(f'FAIL result. Data: {repr(data)}')
+                logger.warning('FAIL result. Data: %r', data)
                 break
             await asyncio.sleep(rid_sleep)
 
-        logger.warning(f'Attempt is not successful.')
+        logger.warning('Attempt is not successful.')
         await asyncio.sleep(rid_sleep)
 
     raise RZDAPIProblem(config.CANNOT_FETCH_RESULT_FROM_RZD)
@@ -104,19 +178,3 @@ def grouper_it(n, iterable):
             return
         yield itertools.chain((first_el,), chunk_it)
 
-
-def parse_rzd_date_time(date_string, time_string) -> datetime.datetime:
-    dt_string = ' '.join((date_string, time_string))
-    return datetime.datetime.strptime(dt_string, config.DATETIME_PARSE_FORMAT)
-
-
-def format_rzd_date(date) -> str:
-    return date.strftime(config.DATE_FORMAT)
-
-
-def parse_rzd_date(date_string: str) -> datetime.date:
-    return datetime.datetime.strptime(date_string, config.DATE_FORMAT).date()
-
-
-def format_rzd_time(time) -> str:
-    return time.strftime(config.TIME_FORMAT)
@@ -35,6 +35,10 @@ CANNOT_FETCH_RESULT_FROM_RZD = 'Cannot fetch result from RZD site.'
 
 LOGGER_NAME = 'rzd_client'
 
+# Tracing
+TRACE_LOG = bool(os.getenv('RZD_TRACE_LOG'))
+TRACE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
 
 CHAR_CODE_BY_SERVICE_CATEGORY_MAPPER = {
     1: 'Плац',
@@ -44,3 +48,36 @@ CHAR_CODE_BY_SERVICE_CATEGORY_MAPPER = {
     6: 'Люкс',
 }
 UNKNOWN_STR = 'Unknown'
+
+# Resilience: breakers open after consecutive failures of a logical fetch,
+# retries are allowed up to a ratio of successful requests
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('RZD_BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_RECOVERY_TIMEOUT = float(os.getenv('RZD_BREAKER_RECOVERY_TIMEOUT', 60))
+BREAKER_HALF_OPEN_CALLS = 1
+RETRY_BUDGET_RATIO = float(os.getenv('RZD_RETRY_BUDGET_RATIO', 0.2))
+RETRY_BUDGET_MIN_PER_SECOND = 0.5
+RETRY_BUDGET_CAPACITY = 50
+CIRCUIT_IS_OPEN_TEMPLATE = 'RZD {} endpoint is unavailable, retry in {:.0f} sec.'
+RETRY_BUDGET_EXHAUSTED = 'RZD retry budget is exhausted.'
+
+# Hedging: a slow fetch gets a second attempt through another connection
+# (or HEDGE_PROXY_STRING) once it is slower than this percentile of recent fetches
+HEDGE_ENABLED = bool(os.getenv('RZD_HEDGE'))
+HEDGE_PROXY_STRING = os.getenv('RZD_HEDGE_PROXY_STRING')
+HEDGE_PERCENTILE = float(os.getenv('RZD_HEDGE_PERCENTILE', 0.9))
+HEDGE_MIN_DELAY = 1
+HEDGE_MIN_SAMPLES = 20
+HEDGE_HISTORY_SIZE = 200
+
+# Scheduling of HTTP requests to RZD in one process: interactive requests first,
+# then monitors and background collection share the rate by weight
+REQUEST_RATE = float(os.getenv('RZD_REQUEST_RATE', 5))
+REQUEST_BURST = float(os.getenv('RZD_REQUEST_BURST', 10))
+PRIORITY_WEIGHTS = {'monitor': 3, 'background': 1}
+
+# Decoding: 'auto' uses orjson when it is installed. Bodies larger than the
+# threshold are decoded and turned into models in a 'thread' or 'process' pool
+JSON_DECODER = os.getenv('RZD_JSON_DECODER', 'auto')
+PARSE_EXECUTOR = os.getenv('RZD_PARSE_EXECUTOR')
+PARSE_WORKERS = int(os.getenv('RZD_PARSE_WORKERS', 2))
+PARSE_OFFLOAD_THRESHOLD = int(os.getenv('RZD_PARSE_OFFLOAD_THRESHOLD', 64 * 2 ** 10))
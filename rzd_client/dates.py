@@ -0,0 +1,20 @@
+import datetime
+
+from . import config
+
+
+def parse_rzd_date_time(date_string, time_string) -> datetime.datetime:
+    dt_string = ' '.join((date_string, time_string))
+    return datetime.datetime.strptime(dt_string, config.DATETIME_PARSE_FORMAT)
+
+
+def format_rzd_date(date) -> str:
+    return date.strftime(config.DATE_FORMAT)
+
+
+def parse_rzd_date(date_string: str) -> datetime.date:
+    return datetime.datetime.strptime(date_string, config.DATE_FORMAT).date()
+
+
+def format_rzd_time(time) -> str:
+    return time.strftime(config.TIME_FORMAT)
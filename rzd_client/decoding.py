@@ -0,0 +1,71 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import typing
+
+from . import config
+
+logger = logging.getLogger(config.LOGGER_NAME)
+
+DECODER_AUTO = 'auto'
+DECODER_JSON = 'json'
+DECODER_ORJSON = 'orjson'
+EXECUTOR_THREAD = 'thread'
+EXECUTOR_PROCESS = 'process'
+
+
+def _select_loads(name: str) -> typing.Callable[[typing.Union[bytes, str]], typing.Any]:
+    if name in (DECODER_AUTO, DECODER_ORJSON):
+        try:
+            import orjson
+        except ImportError:
+            if name == DECODER_ORJSON:
+                raise
+        else:
+            return orjson.loads
+    return json.loads
+
+
+loads = _select_loads(config.JSON_DECODER)
+
+
+def decode(body: bytes, encoding: str):
+    if encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+        body = body.decode(encoding)
+    if not body.strip():
+        return None
+    return loads(body)
+
+
+def decode_and_parse(body: bytes, encoding: str, parse: typing.Optional[typing.Callable] = None):
+    """Runs in a worker when offloaded, so ``parse`` must be picklable for process pools."""
+    data = decode(body, encoding)
+    if parse is None or data is None:
+        return data
+    return parse(data)
+
+
+_executor: typing.Optional[concurrent.futures.Executor] = None
+
+
+def _get_executor() -> typing.Optional[concurrent.futures.Executor]:
+    global _executor
+    if _executor is None and config.PARSE_EXECUTOR:
+        if config.PARSE_EXECUTOR == EXECUTOR_PROCESS:
+            _executor = concurrent.futures.ProcessPoolExecutor(config.PARSE_WORKERS)
+        elif config.PARSE_EXECUTOR == EXECUTOR_THREAD:
+            _executor = concurrent.futures.ThreadPoolExecutor(config.PARSE_WORKERS, thread_name_prefix='rzd-parse')
+        else:
+            raise ValueError(f'Unknown parse executor {config.PARSE_EXECUTOR!r}')
+        logger.info('Decoding bodies over %d bytes in a %s pool', config.PARSE_OFFLOAD_THRESHOLD, config.PARSE_EXECUTOR)
+    return _executor
+
+
+async def decode_and_parse_async(body: bytes, encoding: str, parse: typing.Optional[typing.Callable] = None):
+    """Small bodies are decoded in place, large ones in the configured executor."""
+    executor = _get_executor()
+    if executor is None or len(body) < config.PARSE_OFFLOAD_THRESHOLD:
+        return decode_and_parse(body, encoding, parse)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, decode_and_parse, body, encoding, parse)
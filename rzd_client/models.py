@@ -4,10 +4,10 @@ import decimal
 import typing
 
 from . import config
-from . import common
+from . import dates
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class Station:
     code: int
     name: typing.Optional[str] = None
@@ -156,8 +156,8 @@ class TrainOverview:
             service_categories=service_categories,
             departure_station=departure_station,
             arrival_station=arrival_station,
-            departure_datetime=common.parse_rzd_date_time(data['date0'], data['time0']),
-            arrival_datetime=common.parse_rzd_date_time(data['date1'], data['time1']),
+            departure_datetime=dates.parse_rzd_date_time(data['date0'], data['time0']),
+            arrival_datetime=dates.parse_rzd_date_time(data['date1'], data['time1']),
             time_in_way_string=data.get('timeInWay'),
             _raw_data=data
         )
@@ -196,8 +196,8 @@ class TrainDetailed:
             route=TrainRoute.from_rzd_json(data),
             departure_station=departure_station,
             arrival_station=arrival_station,
-            departure_datetime=common.parse_rzd_date_time(data['date0'], data['time0']),
-            arrival_datetime=common.parse_rzd_date_time(data['date1'], data['time1']),
+            departure_datetime=dates.parse_rzd_date_time(data['date0'], data['time0']),
+            arrival_datetime=dates.parse_rzd_date_time(data['date1'], data['time1']),
             time_in_way_string=data.get('timeInWay'),
             cars=cars,
             _raw_data=data
@@ -205,7 +205,15 @@ class TrainDetailed:
         return instance
 
 
-@dataclasses.dataclass
+def parse_trains_overview(data: dict) -> typing.List[TrainOverview]:
+    return [TrainOverview.from_rzd_json(raw) for raw in data['tp'][0]['list']]
+
+
+def parse_train_detailed(data: dict) -> TrainDetailed:
+    return TrainDetailed.from_rzd_json(data['lst'][0])
+
+
+@dataclasses.dataclass(frozen=True)
 class TrainDetailedRequestArgs:
     departure_station: Station
     arrival_station: Station
@@ -218,23 +226,30 @@ class TrainDetailedRequestArgs:
             'code0': self.departure_station.code,
             'code1': self.arrival_station.code,
             'dir': '0',
-            'dt0': common.format_rzd_date(self.departure_date),
+            'dt0': dates.format_rzd_date(self.departure_date),
             'tnum0': self.train_number,
         }
         return args
 
+    def as_overview_args(self) -> 'TrainsOverviewRequestArgs':
+        return TrainsOverviewRequestArgs(
+            departure_station=self.departure_station,
+            arrival_station=self.arrival_station,
+            departure_date=self.departure_date,
+        )
+
     @classmethod
     def from_rzd_args(cls, args: dict):
         instance = cls(
             departure_station=Station(code=args['code0']),
             arrival_station=Station(code=args['code1']),
-            departure_date=common.parse_rzd_date(args['dt0']),
+            departure_date=dates.parse_rzd_date(args['dt0']),
             train_number=args.get('tnum0'),
         )
         return instance
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class TrainsOverviewRequestArgs:
     departure_station: Station
     arrival_station: Station
@@ -246,7 +261,7 @@ class TrainsOverviewRequestArgs:
             'tfl': '3',
             'code0': self.departure_station.code,
             'code1': self.arrival_station.code,
-            'dt0': common.format_rzd_date(self.departure_date),
+            'dt0': dates.format_rzd_date(self.departure_date),
             'checkSeats': '0',
             'withoutSeats': 'y',
             'version': '2',
@@ -259,6 +274,6 @@ class TrainsOverviewRequestArgs:
         instance = cls(
             departure_station=Station(code=args['code0']),
             arrival_station=Station(code=args['code1']),
-            departure_date=common.parse_rzd_date(args['dt0']),
+            departure_date=dates.parse_rzd_date(args['dt0']),
         )
         return instance
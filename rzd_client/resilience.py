@@ -0,0 +1,200 @@
+import asyncio
+import collections
+import logging
+import time
+import typing
+
+from . import common
+from . import config
+from . import tracing
+
+logger = logging.getLogger(config.LOGGER_NAME)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+STATES = (STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN)
+
+
+class CircuitOpenError(common.RZDAPIProblem):
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(config.CIRCUIT_IS_OPEN_TEMPLATE.format(endpoint, retry_in))
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Fails fast after ``failure_threshold`` consecutive failures. After
+    ``recovery_timeout`` a few probe calls go through: success closes it,
+    failure opens it again.
+
+    Usage::
+
+        with breaker:
+            await fetch()
+    """
+
+    def __init__(
+            self,
+            name: str,
+            failure_threshold: int = config.BREAKER_FAILURE_THRESHOLD,
+            recovery_timeout: float = config.BREAKER_RECOVERY_TIMEOUT,
+            half_open_calls: int = config.BREAKER_HALF_OPEN_CALLS,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_calls = half_open_calls
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.transitions: typing.Dict[str, int] = {state: 0 for state in STATES}
+        self._probes = 0
+
+    def _set_state(self, state: str):
+        if state == self.state:
+            return
+        logger.warning('Circuit %s: %s -> %s', self.name, self.state, state)
+        self.state = state
+        self.transitions[state] += 1
+        if state == STATE_OPEN:
+            self.opened_at = time.monotonic()
+        self._probes = 0
+
+    def retry_in(self) -> float:
+        return max(self.opened_at + self.recovery_timeout - time.monotonic(), 0.0)
+
+    def before_call(self):
+        if self.state == STATE_OPEN and not self.retry_in():
+            self._set_state(STATE_HALF_OPEN)
+        if self.state == STATE_OPEN or (
+                self.state == STATE_HALF_OPEN and self._probes >= self.half_open_calls
+        ):
+            self.rejected += 1
+            raise CircuitOpenError(self.name, self.retry_in())
+        if self.state == STATE_HALF_OPEN:
+            self._probes += 1
+
+    def record_success(self):
+        self.failures = 0
+        self._set_state(STATE_CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == STATE_HALF_OPEN or self.failures >= self.failure_threshold:
+            self._set_state(STATE_OPEN)
+
+    def __enter__(self):
+        self.before_call()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.record_success()
+        elif issubclass(exc_type, Exception):
+            self.record_failure()
+        elif self.state == STATE_HALF_OPEN:
+            # Cancelled probe: let another one through
+            self._probes -= 1
+        return False
+
+
+class RetryBudget:
+    """
+    Retries are paid from tokens: every successful request adds ``ratio``,
+    and ``min_per_second`` more trickle in so that a quiet client can still retry.
+    """
+
+    def __init__(
+            self,
+            ratio: float = config.RETRY_BUDGET_RATIO,
+            min_per_second: float = config.RETRY_BUDGET_MIN_PER_SECOND,
+            capacity: float = config.RETRY_BUDGET_CAPACITY,
+    ):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.spent = 0
+        self.exhausted = 0
+        self._updated = time.monotonic()
+
+    def _refill(self, amount: float):
+        now = time.monotonic()
+        amount += (now - self._updated) * self.min_per_second
+        self._updated = now
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def record_success(self):
+        self._refill(self.ratio)
+
+    def try_spend(self) -> bool:
+        self._refill(0)
+        if self.tokens < 1:
+            self.exhausted += 1
+            return False
+        self.tokens -= 1
+        self.spent += 1
+        return True
+
+
+class LatencyTracker:
+    """Recent latencies of successful fetches of one endpoint."""
+
+    def __init__(self, size: int = config.HEDGE_HISTORY_SIZE, min_samples: int = config.HEDGE_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._latencies: typing.Deque[float] = collections.deque(maxlen=size)
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def observe(self, latency: float):
+        self._latencies.append(latency)
+
+    def percentile(self, q: float) -> typing.Optional[float]:
+        """None until there is enough history."""
+        if len(self._latencies) < self.min_samples:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+
+async def hedge(
+        first: typing.Callable[[], typing.Awaitable],
+        second: typing.Callable[[], typing.Awaitable],
+        delay: float,
+        budget: RetryBudget,
+) -> typing.Tuple[typing.Any, bool]:
+    """
+    Await ``first()``; if it is not done after ``delay`` seconds and the budget
+    allows, also start ``second()``. The first successful result wins and the
+    other attempt is cancelled. Returns the result and whether ``second`` won.
+    """
+    tasks = [asyncio.ensure_future(first())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done or not budget.try_spend():
+            return await tasks[0], False
+
+        tasks.append(asyncio.ensure_future(second()))
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), task is tasks[1]
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+BREAKERS = {
+    endpoint: CircuitBreaker(endpoint)
+    for endpoint in (tracing.ENDPOINT_OVERVIEW, tracing.ENDPOINT_DETAILED, tracing.ENDPOINT_SUGGESTS)
+}
+RETRY_BUDGET = RetryBudget()
+LATENCIES = {endpoint: LatencyTracker() for endpoint in BREAKERS}
@@ -0,0 +1,131 @@
+import asyncio
+import collections
+import contextvars
+import time
+import typing
+
+from . import config
+from . import tracing
+
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_MONITOR = 'monitor'
+PRIORITY_BACKGROUND = 'background'
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_MONITOR, PRIORITY_BACKGROUND)
+
+PRIORITY_BY_CALLER = {
+    tracing.CALLER_SUGGESTER: PRIORITY_INTERACTIVE,
+    tracing.CALLER_MONITOR: PRIORITY_MONITOR,
+    tracing.CALLER_COLLECTOR: PRIORITY_BACKGROUND,
+}
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar('rzd_priority', default=PRIORITY_MONITOR)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+def set_priority(priority: str) -> contextvars.Token:
+    if priority not in PRIORITIES:
+        raise ValueError(f'Unknown priority {priority!r}')
+    return _priority.set(priority)
+
+
+def reset_priority(token: contextvars.Token):
+    _priority.reset(token)
+
+
+class RequestScheduler:
+    """
+    Grants HTTP requests at ``rate`` per second. Interactive requests are
+    always granted first; the rest share the rate by ``weights``.
+    """
+
+    def __init__(
+            self,
+            rate: float = config.REQUEST_RATE,
+            burst: float = config.REQUEST_BURST,
+            weights: typing.Optional[typing.Dict[str, float]] = None,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.weights = dict(config.PRIORITY_WEIGHTS if weights is None else weights)
+        self.tokens = burst
+        self._updated = time.monotonic()
+        self._waiters: typing.Dict[str, typing.Deque[asyncio.Future]] = {
+            priority: collections.deque() for priority in PRIORITIES
+        }
+        # Virtual time of weighted fair queueing: the class that is least ahead goes next
+        self._virtual = {priority: 0.0 for priority in PRIORITIES}
+        self._timer: typing.Optional[asyncio.TimerHandle] = None
+        self._loop: typing.Optional[asyncio.AbstractEventLoop] = None
+        self.granted = {priority: 0 for priority in PRIORITIES}
+        self.wait_seconds = {priority: 0.0 for priority in PRIORITIES}
+
+    def queued(self, priority: str) -> int:
+        return len(self._waiters[priority])
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _pick(self) -> typing.Optional[str]:
+        if self._waiters[PRIORITY_INTERACTIVE]:
+            return PRIORITY_INTERACTIVE
+        candidates = [p for p in PRIORITIES if self._waiters[p]]
+        if not candidates:
+            return None
+        return min(candidates, key=self._virtual.__getitem__)
+
+    def _dispatch(self):
+        self._timer = None
+        self._refill()
+        while self.tokens >= 1:
+            priority = self._pick()
+            if priority is None:
+                return
+            waiter = self._waiters[priority].popleft()
+            if waiter.done():
+                continue
+            self.tokens -= 1
+            self._virtual[priority] += 1 / self.weights.get(priority, 1)
+            waiter.set_result(None)
+        if any(self._waiters.values()):
+            delay = (1 - self.tokens) / self.rate
+            self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _bind(self, loop: asyncio.AbstractEventLoop):
+        """Forget the timer and waiters of a previous loop, e.g. after one asyncio.run() ended."""
+        self._loop = loop
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for waiters in self._waiters.values():
+            alive = [waiter for waiter in waiters if waiter.get_loop() is loop]
+            waiters.clear()
+            waiters.extend(alive)
+
+    async def acquire(self, priority: typing.Optional[str] = None):
+        if not self.rate:
+            return
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._bind(loop)
+        priority = priority or current_priority()
+        started = time.monotonic()
+        waiters = self._waiters[priority]
+        if not waiters:
+            # A class coming back from idle does not get credit for the time it was idle
+            active = [self._virtual[p] for p in PRIORITIES[1:] if self._waiters[p]]
+            self._virtual[priority] = max(self._virtual[priority], min(active, default=0.0))
+        waiter = loop.create_future()
+        waiters.append(waiter)
+        if self._timer is None:
+            self._dispatch()
+        await waiter
+        self.granted[priority] += 1
+        self.wait_seconds[priority] += time.monotonic() - started
+
+
+SCHEDULER = RequestScheduler()
@@ -0,0 +1,219 @@
+import bisect
+import contextlib
+import contextvars
+import dataclasses
+import json
+import logging
+import threading
+import time
+import types
+import typing
+
+import aiohttp
+
+from . import config
+
+logger = logging.getLogger(f'{config.LOGGER_NAME}.trace')
+
+ENDPOINT_OVERVIEW = 'overview'
+ENDPOINT_DETAILED = 'detailed'
+ENDPOINT_SUGGESTS = 'suggests'
+ENDPOINT_UNKNOWN = 'unknown'
+
+CALLER_MONITOR = 'monitor'
+CALLER_SUGGESTER = 'suggester'
+CALLER_COLLECTOR = 'collector'
+CALLER_UNKNOWN = 'unknown'
+
+PHASES = ('dns', 'connect', 'ttfb', 'body_read', 'json_decode', 'total')
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('rzd_trace', default=None)
+
+
+@dataclasses.dataclass
+class RequestTrace:
+    """Timings of one logical fetch (possibly several HTTP requests)."""
+    endpoint: str
+    caller: str
+    started: float = dataclasses.field(default_factory=time.monotonic)
+    dns: float = 0.0
+    connect: float = 0.0
+    ttfb: float = 0.0
+    body_read: float = 0.0
+    json_decode: float = 0.0
+    total: float = 0.0
+    http_requests: int = 0
+    rid_rounds: int = 0
+    success: bool = False
+    error: typing.Optional[str] = None
+
+    def as_dict(self):
+        data = dataclasses.asdict(self)
+        data.pop('started')
+        return data
+
+
+class Histogram:
+    def __init__(self, buckets=config.TRACE_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> typing.List[typing.Tuple[float, int]]:
+        res = []
+        total = 0
+        for bound, count in zip((*self.buckets, float('inf')), self.counts):
+            total += count
+            res.append((bound, total))
+        return res
+
+
+class HistogramSink:
+    """Keeps per (endpoint, caller, phase) histograms in process memory."""
+
+    def __init__(self, buckets=config.TRACE_BUCKETS):
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self.histograms: typing.Dict[typing.Tuple[str, str, str], Histogram] = {}
+        self.rid_rounds: typing.Dict[typing.Tuple[str, str], int] = {}
+        self.results: typing.Dict[typing.Tuple[str, str, bool], int] = {}
+
+    def _histogram(self, key):
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self._buckets)
+        return histogram
+
+    def emit(self, trace: RequestTrace):
+        tags = (trace.endpoint, trace.caller)
+        with self._lock:
+            for phase in PHASES:
+                self._histogram((*tags, phase)).observe(getattr(trace, phase))
+            self.rid_rounds[tags] = self.rid_rounds.get(tags, 0) + trace.rid_rounds
+            result_key = (*tags, trace.success)
+            self.results[result_key] = self.results.get(result_key, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                key: (histogram.cumulative(), histogram.sum, histogram.count)
+                for key, histogram in self.histograms.items()
+            }
+
+
+class LogSink:
+    """Writes every trace as one JSON log record."""
+
+    def __init__(self, level=logging.INFO):
+        self.level = level
+
+    def emit(self, trace: RequestTrace):
+        if logger.isEnabledFor(self.level):
+            data = trace.as_dict()
+            logger.log(self.level, 'trace %s', json.dumps(data), extra={'trace': data})
+
+
+HISTOGRAMS = HistogramSink()
+_sinks: typing.List = [HISTOGRAMS]
+if config.TRACE_LOG:
+    _sinks.append(LogSink())
+
+
+def add_sink(sink):
+    _sinks.append(sink)
+
+
+def remove_sink(sink):
+    _sinks.remove(sink)
+
+
+def _emit(trace: RequestTrace):
+    for sink in _sinks:
+        try:
+            sink.emit(trace)
+        except Exception:
+            logger.exception('Trace sink %r failed', sink)
+
+
+def current() -> RequestTrace:
+    trace = _current_trace.get()
+    if trace is None:
+        # Untraced call: collect into a throwaway object
+        trace = RequestTrace(ENDPOINT_UNKNOWN, CALLER_UNKNOWN)
+    return trace
+
+
+@contextlib.contextmanager
+def trace(endpoint: str, caller: str):
+    trace_ = RequestTrace(endpoint, caller)
+    token = _current_trace.set(trace_)
+    try:
+        yield trace_
+        trace_.success = True
+    except BaseException as e:
+        trace_.error = type(e).__name__
+        raise
+    finally:
+        _current_trace.reset(token)
+        trace_.total = time.monotonic() - trace_.started
+        _emit(trace_)
+
+
+async def _on_request_start(session, ctx, params):
+    ctx.ttfb_start = time.monotonic()
+
+
+async def _on_request_sent(session, ctx, params):
+    # Waiting for the response starts after dns, connect and the request body
+    ctx.ttfb_start = time.monotonic()
+
+
+async def _on_request_end(session, ctx, params):
+    # Fired when response headers are received, on_request_redirect for every hop but the last
+    trace_ = ctx.trace_request_ctx
+    now = time.monotonic()
+    if isinstance(trace_, RequestTrace):
+        trace_.ttfb += now - ctx.ttfb_start
+    ctx.ttfb_start = now
+
+
+async def _on_dns_start(session, ctx, params):
+    ctx.dns_start = time.monotonic()
+
+
+async def _on_dns_end(session, ctx, params):
+    trace_ = ctx.trace_request_ctx
+    if isinstance(trace_, RequestTrace):
+        trace_.dns += time.monotonic() - ctx.dns_start
+
+
+async def _on_connection_start(session, ctx, params):
+    ctx.connection_start = time.monotonic()
+
+
+async def _on_connection_end(session, ctx, params):
+    # Includes proxy handshake for SOCKS connectors
+    trace_ = ctx.trace_request_ctx
+    now = time.monotonic()
+    if isinstance(trace_, RequestTrace):
+        trace_.connect += now - ctx.connection_start
+    ctx.ttfb_start = now
+
+
+def trace_config() -> aiohttp.TraceConfig:
+    trace_config_ = aiohttp.TraceConfig(trace_config_ctx_factory=types.SimpleNamespace)
+    trace_config_.on_request_start.append(_on_request_start)
+    trace_config_.on_request_chunk_sent.append(_on_request_sent)
+    trace_config_.on_request_end.append(_on_request_end)
+    trace_config_.on_request_redirect.append(_on_request_end)
+    trace_config_.on_dns_resolvehost_start.append(_on_dns_start)
+    trace_config_.on_dns_resolvehost_end.append(_on_dns_end)
+    trace_config_.on_connection_create_start.append(_on_connection_start)
+    trace_config_.on_connection_create_end.append(_on_connection_end)
+    return trace_config_
@@ -0,0 +1,103 @@
+"""
+Checks import time of the entry points against a recorded baseline.
+
+    python scripts/check_import_time.py [--repeat 5] [--tolerance 0.15]
+    python scripts/check_import_time.py --record
+
+Every module is imported in a fresh interpreter with ``-X importtime``. Raw
+milliseconds depend on the machine and its load, so the best time of a module
+is divided by the best time of REFERENCE measured in the same runs, and that
+ratio is compared with the one recorded in BASELINE_PATH, which holds the
+ratios of the tree before imports were made free of side effects. Exits with 1
+when a module is more than ``tolerance`` slower than its baseline.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, 'scripts', 'import_time_baseline.json')
+
+MODULES = ('run_terminal', 'run_export', 'run_collector', 'run_bot')
+# Standard library only, so its cost does not change with our dependencies
+REFERENCE = 'asyncio'
+
+
+def import_time(module: str) -> float:
+    """Cumulative import time of ``module``, milliseconds."""
+    # Token and database are not needed: importing has no side effects
+    env = {**os.environ, 'PYTHONPATH': ROOT}
+    for name in ('RZD_TICKETS_MONITOR_BOT_TOKEN', 'DB_CONNECTION_STRING'):
+        env.pop(name, None)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    for line in reversed(result.stderr.splitlines()):
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        if name.strip() == module:
+            return int(cumulative) / 1000
+    raise RuntimeError(f'No import time reported for {module}')
+
+
+def measure(repeat: int):
+    """Best time of every module and of REFERENCE, runs are interleaved to share the load."""
+    best = {}
+    for _ in range(repeat):
+        for module in (REFERENCE, *MODULES):
+            elapsed = import_time(module)
+            best[module] = min(best.get(module, elapsed), elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check import time of the entry points.')
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=5,
+        help='Runs per module, the best one is checked. Default is 5',
+    )
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=0.15,
+        help='Allowed slowdown against the baseline, 0.15 is 15%%. Default is 0.15',
+    )
+    parser.add_argument(
+        '--record',
+        action='store_true',
+        help=f'Write the measured ratios to {os.path.relpath(BASELINE_PATH, ROOT)}',
+    )
+    args = parser.parse_args()
+
+    best = measure(args.repeat)
+    reference = best[REFERENCE]
+    ratios = {module: round(best[module] / reference, 2) for module in MODULES}
+    print(f'{REFERENCE:<15} {reference:8.1f} ms  reference')
+    if args.record:
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(ratios, f, indent=2)
+            f.write('\n')
+        for module in MODULES:
+            print(f'{module:<15} {best[module]:8.1f} ms  x{ratios[module]:.2f}  recorded')
+        return
+
+    with open(BASELINE_PATH) as f:
+        baseline = json.load(f)
+    failed = False
+    for module in MODULES:
+        budget = baseline[module] * (1 + args.tolerance)
+        status = 'ok' if ratios[module] <= budget else 'OVER BUDGET'
+        failed = failed or ratios[module] > budget
+        print(f'{module:<15} {best[module]:8.1f} ms  x{ratios[module]:.2f}  budget x{budget:.2f}  {status}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+import os
+
+# Metrics
+METRICS_HOST = os.getenv('METRICS_HOST', '0.0.0.0')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0)) or None
+METRICS_PATH = '/metrics'
+LOOP_LAG_INTERVAL = 1
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+# Profiling, see shared.profiling
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_SECONDS = 30
+PROFILE_MAX_SECONDS = 300
+PROFILE_INTERVAL = 0.01
+
+# Logging
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = '%(asctime)s [%(levelname)-5.5s] [%(name)s] %(message)s'
+LOG_MAX_BYTES = 100 * 2 ** 20
+LOG_BACKUP_COUNT = 10
+LOG_COMPRESS_CHUNK = 2 ** 20
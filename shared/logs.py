@@ -0,0 +1,49 @@
+import atexit
+import gzip
+import logging.handlers
+import os
+import queue
+import shutil
+import typing
+
+from shared import config
+
+_listener: typing.Optional[logging.handlers.QueueListener] = None
+
+
+def namer(name):
+    return name + '.gz'
+
+
+def rotator(source, dest):
+    # Runs on the listener thread; compresses in chunks instead of reading the whole file
+    with open(source, 'rb') as sf, gzip.open(dest, 'wb') as df:
+        shutil.copyfileobj(sf, df, config.LOG_COMPRESS_CHUNK)
+    os.remove(source)
+
+
+def setup_logging(filename: str):
+    """Route all records through a queue to a background file/stream writer."""
+    global _listener
+    if _listener is not None:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+
+    formatter = logging.Formatter(config.LOG_FORMAT)
+    rh = logging.handlers.RotatingFileHandler(
+        filename, 'a', encoding='utf8', maxBytes=config.LOG_MAX_BYTES, backupCount=config.LOG_BACKUP_COUNT,
+    )
+    rh.rotator = rotator
+    rh.namer = namer
+    stream_handler = logging.StreamHandler()
+    for handler in (rh, stream_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, rh, stream_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    root.setLevel(config.LOG_LEVEL)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
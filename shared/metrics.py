@@ -0,0 +1,284 @@
+import asyncio
+import logging
+import time
+import typing
+
+from rzd_client import config as rzd_config
+from rzd_client import resilience
+from rzd_client import scheduler
+from rzd_client import tracing
+from shared import config
+
+if typing.TYPE_CHECKING:
+    from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+_metrics: typing.List['_Metric'] = []
+_collectors: typing.List[typing.Callable[[], typing.Iterable[str]]] = []
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ''
+    pairs = (
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for name, value in zip(names, values)
+    )
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric:
+    type_ = None
+
+    def __init__(self, name: str, documentation: str, labelnames: typing.Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: typing.Dict[tuple, typing.Any] = {}
+        _metrics.append(self)
+
+    def _header(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.type_}'
+
+    def render(self) -> typing.Iterable[str]:
+        yield from self._header()
+        for values, value in list(self._values.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}'
+
+
+class Counter(_Metric):
+    type_ = 'counter'
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    type_ = 'gauge'
+
+    def __init__(self, *args, function: typing.Optional[typing.Callable[[], float]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function = function
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def remove(self, *labels):
+        self._values.pop(labels, None)
+
+    def render(self):
+        if self._function is not None:
+            self._values[()] = self._function()
+        yield from super().render()
+
+
+class Histogram(_Metric):
+    type_ = 'histogram'
+
+    def __init__(self, *args, buckets=rzd_config.TRACE_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._buckets = buckets
+
+    def observe(self, value, *labels):
+        histogram = self._values.get(labels)
+        if histogram is None:
+            histogram = self._values[labels] = tracing.Histogram(self._buckets)
+        histogram.observe(value)
+
+    def get(self, *labels) -> typing.Optional[tracing.Histogram]:
+        return self._values.get(labels)
+
+    def render(self):
+        yield from self._header()
+        for values, histogram in list(self._values.items()):
+            yield from render_histogram(
+                self.name, self.labelnames, values,
+                histogram.cumulative(), histogram.sum, histogram.count,
+            )
+
+
+def render_histogram(name, labelnames, values, cumulative, sum_, count):
+    for bound, bucket_count in cumulative:
+        labels = _format_labels((*labelnames, 'le'), (*values, _format_value(bound)))
+        yield f'{name}_bucket{labels} {bucket_count}'
+    labels = _format_labels(labelnames, values)
+    yield f'{name}_sum{labels} {_format_value(sum_)}'
+    yield f'{name}_count{labels} {count}'
+
+
+def register_collector(collector: typing.Callable[[], typing.Iterable[str]]):
+    """Register a callable producing exposition lines at scrape time."""
+    _collectors.append(collector)
+
+
+def unregister_collector(collector):
+    _collectors.remove(collector)
+
+
+def _collect_rzd_traces():
+    sink = tracing.HISTOGRAMS
+    labelnames = ('endpoint', 'caller', 'phase')
+    yield '# HELP rzd_request_phase_seconds Time spent in each phase of RZD fetches.'
+    yield '# TYPE rzd_request_phase_seconds histogram'
+    for values, (cumulative, sum_, count) in sink.snapshot().items():
+        yield from render_histogram(
+            'rzd_request_phase_seconds', labelnames, values, cumulative, sum_, count,
+        )
+    yield '# HELP rzd_requests_total Logical RZD fetches by result.'
+    yield '# TYPE rzd_requests_total counter'
+    for (endpoint, caller, success), count in list(sink.results.items()):
+        labels = _format_labels(
+            ('endpoint', 'caller', 'result'),
+            (endpoint, caller, 'success' if success else 'error'),
+        )
+        yield f'rzd_requests_total{labels} {count}'
+    yield '# HELP rzd_rid_rounds_total RID polling rounds.'
+    yield '# TYPE rzd_rid_rounds_total counter'
+    for values, count in list(sink.rid_rounds.items()):
+        yield f'rzd_rid_rounds_total{_format_labels(("endpoint", "caller"), values)} {count}'
+
+
+register_collector(_collect_rzd_traces)
+
+
+def _collect_rzd_resilience():
+    yield '# HELP rzd_circuit_state Circuit breaker state per endpoint (1 for the current state).'
+    yield '# TYPE rzd_circuit_state gauge'
+    for endpoint, breaker in resilience.BREAKERS.items():
+        for state in resilience.STATES:
+            labels = _format_labels(('endpoint', 'state'), (endpoint, state))
+            yield f'rzd_circuit_state{labels} {int(breaker.state == state)}'
+    yield '# HELP rzd_circuit_transitions_total Circuit breaker transitions into a state.'
+    yield '# TYPE rzd_circuit_transitions_total counter'
+    for endpoint, breaker in resilience.BREAKERS.items():
+        for state, count in breaker.transitions.items():
+            labels = _format_labels(('endpoint', 'state'), (endpoint, state))
+            yield f'rzd_circuit_transitions_total{labels} {count}'
+    yield '# HELP rzd_circuit_rejected_total Fetches rejected by an open circuit.'
+    yield '# TYPE rzd_circuit_rejected_total counter'
+    for endpoint, breaker in resilience.BREAKERS.items():
+        yield f'rzd_circuit_rejected_total{_format_labels(("endpoint",), (endpoint,))} {breaker.rejected}'
+    budget = resilience.RETRY_BUDGET
+    yield '# HELP rzd_retry_budget_tokens Retries currently allowed by the budget.'
+    yield '# TYPE rzd_retry_budget_tokens gauge'
+    yield f'rzd_retry_budget_tokens {budget.tokens:.3f}'
+    yield '# HELP rzd_retries_total Retries paid from the budget.'
+    yield '# TYPE rzd_retries_total counter'
+    yield f'rzd_retries_total {budget.spent}'
+    yield '# HELP rzd_retry_budget_exhausted_total Retries refused by the budget.'
+    yield '# TYPE rzd_retry_budget_exhausted_total counter'
+    yield f'rzd_retry_budget_exhausted_total {budget.exhausted}'
+    yield '# HELP rzd_hedged_requests_total Fetches that got a second, hedged attempt.'
+    yield '# TYPE rzd_hedged_requests_total counter'
+    for endpoint, latencies in resilience.LATENCIES.items():
+        yield f'rzd_hedged_requests_total{_format_labels(("endpoint",), (endpoint,))} {latencies.hedged}'
+    yield '# HELP rzd_hedge_wins_total Hedged fetches won by the second attempt.'
+    yield '# TYPE rzd_hedge_wins_total counter'
+    for endpoint, latencies in resilience.LATENCIES.items():
+        yield f'rzd_hedge_wins_total{_format_labels(("endpoint",), (endpoint,))} {latencies.hedge_wins}'
+
+
+register_collector(_collect_rzd_resilience)
+
+
+def _collect_rzd_scheduler():
+    sched = scheduler.SCHEDULER
+    yield '# HELP rzd_scheduler_queued HTTP requests waiting for a grant by priority.'
+    yield '# TYPE rzd_scheduler_queued gauge'
+    for priority in scheduler.PRIORITIES:
+        yield f'rzd_scheduler_queued{_format_labels(("priority",), (priority,))} {sched.queued(priority)}'
+    yield '# HELP rzd_scheduler_granted_total HTTP requests granted by priority.'
+    yield '# TYPE rzd_scheduler_granted_total counter'
+    for priority, count in sched.granted.items():
+        yield f'rzd_scheduler_granted_total{_format_labels(("priority",), (priority,))} {count}'
+    yield '# HELP rzd_scheduler_wait_seconds_total Time spent waiting for grants by priority.'
+    yield '# TYPE rzd_scheduler_wait_seconds_total counter'
+    for priority, seconds in sched.wait_seconds.items():
+        yield f'rzd_scheduler_wait_seconds_total{_format_labels(("priority",), (priority,))} {seconds:.3f}'
+
+
+register_collector(_collect_rzd_scheduler)
+
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            lines.extend(collector())
+        except Exception:
+            logger.exception('Metrics collector %r failed', collector)
+    lines.append('')
+    return '\n'.join(lines)
+
+
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Cache lookups by cache name and result.', ('cache', 'result'),
+)
+LOOP_LAG = Histogram(
+    'event_loop_lag_seconds', 'Event loop scheduling delay.', buckets=config.LOOP_LAG_BUCKETS,
+)
+LOOP_LAG_LAST = Gauge('event_loop_lag_last_seconds', 'Last measured event loop delay.')
+_loop_lag_task: typing.Optional[asyncio.Task] = None
+
+
+async def monitor_loop_lag(interval=config.LOOP_LAG_INTERVAL):
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        lag = max(time.monotonic() - started - interval, 0.0)
+        LOOP_LAG.observe(lag)
+        LOOP_LAG_LAST.set(lag)
+
+
+def ensure_loop_lag_monitor() -> asyncio.Task:
+    """Start loop lag monitoring once per process."""
+    global _loop_lag_task
+    if _loop_lag_task is None or _loop_lag_task.done():
+        _loop_lag_task = asyncio.create_task(monitor_loop_lag(), name='loop-lag-monitor')
+    return _loop_lag_task
+
+
+async def handle_metrics(request: 'web.Request') -> 'web.Response':
+    # aiohttp.web is imported only by processes that serve metrics
+    from aiohttp import web
+
+    return web.Response(text=render(), content_type='text/plain', charset='utf-8')
+
+
+def setup_routes(app: 'web.Application'):
+    app.router.add_get(config.METRICS_PATH, handle_metrics)
+
+
+async def start_server(
+        host: str = config.METRICS_HOST,
+        port: typing.Optional[int] = config.METRICS_PORT,
+) -> typing.Optional['web.AppRunner']:
+    """Serve /metrics and start loop lag monitoring. No-op without a port."""
+    if not port:
+        return None
+    from aiohttp import web
+
+    app = web.Application()
+    setup_routes(app)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    ensure_loop_lag_monitor()
+    logger.info('Serving metrics on %s:%s%s', host, port, config.METRICS_PATH)
+    return runner
@@ -0,0 +1,222 @@
+import asyncio
+import collections
+import datetime
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import typing
+import weakref
+
+from shared import config
+from shared import metrics
+
+logger = logging.getLogger(__name__)
+
+# Creation time of tasks made after install(); Task objects have no __dict__
+_created: 'weakref.WeakKeyDictionary[asyncio.Task, float]' = weakref.WeakKeyDictionary()
+# Tasks started by signal handlers
+_background: typing.Set[asyncio.Task] = set()
+_lock = threading.Lock()
+_active: typing.Optional['SamplingProfiler'] = None
+
+
+class ProfilerBusyError(RuntimeError):
+    pass
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f'{name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})'
+
+
+class SamplingProfiler:
+    """
+    Samples stacks into collapsed stacks, one ``frame;frame;frame count`` line per stack,
+    readable by flamegraph.pl and speedscope.
+
+    On the main thread of a POSIX process the event loop thread is interrupted by
+    SIGPROF every ``interval`` of CPU time, so short handlers are sampled as often
+    as they burn CPU and idle waiting in ``select`` is not sampled at all.
+    Elsewhere all threads are sampled from a background thread. That thread gets
+    the GIL only when the loop releases it, mostly in ``select``, so only stalls
+    longer than ``sys.getswitchinterval()`` show up there.
+    """
+
+    def __init__(self, interval: float = config.PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples: typing.Counter[str] = collections.Counter()
+        self.sample_count = 0
+        self.use_signal = hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+        self._previous_handler = None
+        self._stop = threading.Event()
+        self._thread: typing.Optional[threading.Thread] = None
+
+    def _add(self, frame, thread_name: str):
+        stack = []
+        while frame is not None:
+            stack.append(_frame_name(frame))
+            frame = frame.f_back
+        stack.append(thread_name)
+        self.samples[';'.join(reversed(stack))] += 1
+
+    def _on_signal(self, signum, frame):
+        self._add(frame, threading.main_thread().name)
+        self.sample_count += 1
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id != own:
+                self._add(frame, names.get(thread_id, str(thread_id)))
+        self.sample_count += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        if self.use_signal:
+            self._previous_handler = signal.signal(signal.SIGPROF, self._on_signal)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+            return
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self.use_signal:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+            return
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+
+async def profile(seconds: float = config.PROFILE_SECONDS, directory: str = config.PROFILE_DIR) -> str:
+    """Sample for ``seconds`` and write collapsed stacks to a file, returns its path."""
+    global _active
+    seconds = min(seconds, config.PROFILE_MAX_SECONDS)
+    with _lock:
+        if _active is not None:
+            raise ProfilerBusyError('Profiler is already running')
+        _active = profiler = SamplingProfiler()
+    logger.info('Profiling for %.1f sec', seconds)
+    try:
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.stop()
+    finally:
+        _active = None
+    path = _write(directory, 'profile', 'folded', profiler.collapsed())
+    logger.info('Profile with %d samples written to %s', profiler.sample_count, path)
+    return path
+
+
+def _write(directory: str, kind: str, extension: str, text: str) -> str:
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(directory, f'{kind}-{os.getpid()}-{stamp}.{extension}')
+    with open(path, 'w', encoding='utf8') as f:
+        f.write(text)
+    return path
+
+
+def task_factory(loop, coro, **kwargs):
+    task = asyncio.Task(coro, loop=loop, **kwargs)
+    _created[task] = time.monotonic()
+    return task
+
+
+def await_point(task: asyncio.Task) -> str:
+    """Chain of suspended coroutine frames of the task, outermost first."""
+    coro = task.get_coro()
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None)
+        if frame is None:
+            break
+        frames.append(_frame_name(frame))
+        coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None)
+    return ' -> '.join(frames) or '?'
+
+
+def tasks_report(loop: typing.Optional[asyncio.AbstractEventLoop] = None) -> str:
+    """Live tasks, oldest first, with age, state and await point."""
+    now = time.monotonic()
+    rows = []
+    for task in asyncio.all_tasks(loop):
+        created = _created.get(task)
+        age = now - created if created is not None else None
+        state = 'done' if task.done() else 'pending'
+        rows.append((age if age is not None else float('inf'), task.get_name(), state, await_point(task)))
+    rows.sort(key=lambda row: row[0], reverse=True)
+    lines = [f'{len(rows)} tasks']
+    for age, name, state, location in rows:
+        age_text = 'unknown' if age == float('inf') else f'{age:.1f}s'
+        lines.append(f'{age_text:>10} {state:<7} {name}: {location}')
+    return '\n'.join(lines)
+
+
+def loop_lag_report() -> str:
+    histogram = metrics.LOOP_LAG.get()
+    if histogram is None or not histogram.count:
+        return 'Loop lag: no data'
+    lines = [f'Loop lag: {histogram.count} samples, mean {histogram.sum / histogram.count * 1000:.1f} ms']
+    previous = 0
+    for bound, total in histogram.cumulative():
+        bucket = total - previous
+        previous = total
+        label = '+Inf' if bound == float('inf') else f'{bound * 1000:g} ms'
+        lines.append(f'  <= {label:>8}: {bucket}')
+    return '\n'.join(lines)
+
+
+def report() -> str:
+    return '\n\n'.join((loop_lag_report(), tasks_report()))
+
+
+def dump_tasks(directory: str = config.PROFILE_DIR) -> str:
+    text = report()
+    path = _write(directory, 'tasks', 'txt', text)
+    logger.info('Tasks report written to %s', path)
+    return path
+
+
+def _spawn(coro, name):
+    task = asyncio.create_task(coro, name=name)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def _profile_logged():
+    try:
+        await profile()
+    except ProfilerBusyError as e:
+        logger.warning('%s', e)
+
+
+def _on_profile_signal():
+    _spawn(_profile_logged(), 'profiler')
+
+
+def install(loop: typing.Optional[asyncio.AbstractEventLoop] = None):
+    """
+    Record task creation times and start loop lag monitoring.
+    SIGUSR1 runs the profiler for PROFILE_SECONDS, SIGUSR2 dumps live tasks.
+    """
+    loop = loop or asyncio.get_running_loop()
+    loop.set_task_factory(task_factory)
+    metrics.ensure_loop_lag_monitor()
+    if not hasattr(signal, 'SIGUSR1'):
+        return
+    loop.add_signal_handler(signal.SIGUSR1, _on_profile_signal)
+    loop.add_signal_handler(signal.SIGUSR2, dump_tasks)
@@ -0,0 +1,63 @@
+import datetime
+import types
+
+import pytest
+
+from collector_app import backtest
+
+START = datetime.datetime(2099, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _snapshots(free_seats_by_minute):
+    res = []
+    for minute, free_seats in enumerate(free_seats_by_minute):
+        trains = [{'number': '001А', 'serviceCategories': [{'typeCarNumCode': 1, 'freeSeats': free_seats}]}]
+        row = types.SimpleNamespace(
+            config_id=1,
+            departure_date=datetime.date(2099, 1, 3),
+            collected_at=START + datetime.timedelta(minutes=minute),
+            raw_data=trains,
+        )
+        res.append(backtest.Snapshot.from_row(row))
+    return res
+
+
+def test_every_snapshot_polled_catches_everything():
+    report = backtest.Backtest(backtest.fixed_schedule(60)).run(_snapshots([0, 0, 3, 0, 0, 2, 2, 2, 0]))
+    assert (report.appearances, report.caught, report.missed, report.pending) == (2, 2, 0, 0)
+    assert report.requests == 9
+    assert report.delay_percentiles()['max'] == 0
+
+
+def test_sparse_polling_misses_short_availability():
+    report = backtest.Backtest(backtest.fixed_schedule(300)).run(_snapshots([0, 0, 3, 0, 0, 2, 2, 2, 2]))
+    assert (report.appearances, report.caught, report.missed) == (2, 1, 1)
+    assert report.requests == 2
+    assert report.catch_rate == 0.5
+
+
+def test_delay_between_appearance_and_poll():
+    report = backtest.Backtest(backtest.fixed_schedule(150)).run(_snapshots([0, 2, 2, 2]))
+    assert report.caught == 1
+    assert report.delays == [90.0]
+
+
+def test_short_delays_are_not_clamped():
+    report = backtest.Backtest(backtest.fixed_schedule(5)).run(_snapshots([0, 0]))
+    assert report.requests == 13
+
+
+def test_available_at_the_end_is_pending():
+    report = backtest.Backtest(backtest.fixed_schedule(600)).run(_snapshots([0, 0, 1]))
+    assert (report.caught, report.missed, report.pending) == (0, 0, 1)
+
+
+def test_notification_policy_filters_categories():
+    policy = backtest.FreeSeatsPolicy(cars_type_codes=frozenset({4}))
+    report = backtest.Backtest(backtest.fixed_schedule(60), policy).run(_snapshots([0, 3]))
+    assert report.appearances == 0
+
+
+def test_non_positive_delay_is_rejected():
+    with pytest.raises(ValueError):
+        backtest.Backtest(backtest.fixed_schedule(0)).run(_snapshots([0, 1]))
@@ -0,0 +1,43 @@
+import decimal
+import struct
+
+import pytest
+
+from collector_app import codec
+from rzd_client import models
+
+
+def _category(code, free_seats, price_from, price_to, bonus):
+    return models.AvailableServiceCategory(
+        category=models.ServiceCategory(code),
+        free_seats=free_seats,
+        price_from=decimal.Decimal(price_from),
+        price_to=None if price_to is None else decimal.Decimal(price_to),
+        rzd_bonus_points=None if bonus is None else decimal.Decimal(bonus),
+    )
+
+
+def test_round_trip_keeps_missing_fields():
+    categories = [
+        _category(1, 12, '1500.50', '2300.99', '35.5'),
+        _category(3, 4, '4100', None, None),
+        _category(4, 0, '0', '0', '0'),
+    ]
+    assert codec.decode(codec.encode(categories)) == categories
+
+
+def test_missing_fields_are_marked_the_same_way():
+    data = codec.encode([_category(1, 2, '100', None, None)])
+    *_, price_to, bonus = struct.unpack('<HHIII', data[1:])
+    assert price_to == bonus == codec.MISSING
+
+
+def test_version_1_is_decoded():
+    data = bytes((1,)) + struct.pack('<HHIII', 1, 2, 10000, 0, 550)
+    assert list(codec.iter_records(data)) == [(1, 2, 10000, None, 550)]
+
+
+@pytest.mark.parametrize('data', [b'', b'\x09', codec.encode([]) + b'\x00'])
+def test_broken_data_is_rejected(data):
+    with pytest.raises(codec.DecodeError):
+        codec.decode(data)
@@ -0,0 +1,39 @@
+import asyncio
+import datetime
+
+from app import hub
+from rzd_client import models
+
+
+class FakeMonitor:
+    def __init__(self, args, seats_filter='any'):
+        self.args = args
+        self.seats_filter = seats_filter
+
+
+class FakeHub(hub.MonitorHub):
+    async def fetch_trains_overview(self, args):
+        return []
+
+
+def test_route_poller_restarts_finished_task():
+    async def run():
+        route = hub._RoutePoller(FakeHub(), models.TrainsOverviewRequestArgs(
+            departure_date=datetime.date(2024, 2, 1),
+            departure_station=models.Station(2000000),
+            arrival_station=models.Station(2004000),
+        ))
+        first = FakeMonitor('train 1')
+        route.add(first)
+        started = route._task
+        route.remove(first)
+        # Emptied before the loop started: it ends at once
+        await started
+
+        route.add(FakeMonitor('train 2'))
+        restarted = route._task
+        route.cancel()
+        return started, restarted
+
+    started, restarted = asyncio.run(run())
+    assert restarted is not started
@@ -0,0 +1,116 @@
+import asyncio
+import types
+
+from app import monitor
+from rzd_client import models
+
+COUPE = models.ServiceCategory(3)
+
+
+def _car(number, free, size=54, category=COUPE):
+    seats = [i + 1 in free for i in range(size)]
+    return models.Car(category=category, number=number, seats=seats, seats_count=sum(seats))
+
+
+def _train(*cars):
+    return types.SimpleNamespace(cars=list(cars))
+
+
+def test_any_free_seat_matches():
+    filter_ = monitor.SeatsFilter(cars_type_code=COUPE.code)
+    assert filter_.matching_seats_in_car(_car('01', {1, 2, 40})) == (1, 2, 40)
+
+
+def test_mask_drops_unwanted_seats():
+    # Seats beyond the mask are not filtered
+    filter_ = monitor.SeatsFilter(cars_type_code=COUPE.code, mask=(True, False, True))
+    assert filter_.matching_seats_in_car(_car('01', {1, 2, 3, 4, 40})) == (1, 3, 4, 40)
+
+
+def test_same_coupe_needs_requested_count_in_one_coupe():
+    filter_ = monitor.SeatsFilter(cars_type_code=COUPE.code, requested_count=2, same_coupe=True)
+    # Coupe 1 has one free seat, coupe 2 has two, side seats after 36 are not coupes
+    car = _car('01', {1, 5, 6, 37, 38})
+    assert filter_.matching_seats_in_car(car) == (5, 6)
+    assert filter_.seats_count_in_car(car) == 2
+
+
+def test_same_coupe_respects_coupe_size_and_mask():
+    filter_ = monitor.SeatsFilter(
+        cars_type_code=COUPE.code, requested_count=2, same_coupe=True, coupe_size=2, mask=(False,),
+    )
+    assert filter_.matching_seats_in_car(_car('01', {1, 2, 3, 4})) == (3, 4)
+
+
+def test_matching_seats_by_car_of_wanted_category():
+    filter_ = monitor.SeatsFilter(cars_type_code=COUPE.code)
+    train = _train(
+        _car('01', {1}),
+        _car('02', set()),
+        _car('03', {7}, category=models.ServiceCategory(1)),
+        _car('01', {2}),
+    )
+    assert filter_.matching_seats(filter_.wanted_cars(train)) == {'01': (1, 2)}
+    assert filter_.count_tickets(train) == 2
+
+
+def test_format_seats():
+    assert monitor._format_seats([14, 13, 20]) == 'seats 13–14, 20'
+    assert monitor._format_seats([5]) == 'seat 5'
+
+
+def test_diff_seats():
+    old = {'07': (10,), '09': (1, 2)}
+    new = {'07': (10, 13, 14), '09': (2,)}
+    assert monitor.diff_seats(old, new) == [
+        '+2 in car 07, seats 13–14',
+        '-1 in car 09, seat 1',
+    ]
+    assert monitor.diff_seats(new, new) == []
+
+
+def _monitor(requested_count=2):
+    sent = []
+
+    async def callback(msg):
+        sent.append(msg)
+
+    monitor_ = monitor.AsyncMonitor(
+        args=None, requested_count=requested_count, cars_type=COUPE, callback=callback, resumed=True,
+    )
+    return monitor_, sent
+
+
+def test_notifies_on_transitions_and_changes_only():
+    monitor_, sent = _monitor()
+
+    async def run():
+        await monitor_.process_train(_train(_car('07', {13})))
+        await monitor_.process_train(_train(_car('07', {13, 14})))
+        await monitor_.process_train(_train(_car('07', {13, 14})))
+        await monitor_.process_train(_train(_car('07', {13, 14, 15})))
+        await monitor_.process_train(_train(_car('07', {15})))
+        await monitor_.process_train(_train(_car('07', {15, 16})))
+        await monitor_.process_overview(0)
+
+    asyncio.run(run())
+    assert sent == [
+        # Up: all matching seats are listed
+        'Total: 2 tickets\n+2 in car 07, seats 13–14',
+        # The same seats again are not news
+        'Total: 3 tickets\n+1 in car 07, seat 15',
+        # Down
+        'Total: 1 tickets, not enough anymore',
+        'Total: 2 tickets\n+2 in car 07, seats 15–16',
+        'Overview: 0 free seats, not enough anymore',
+    ]
+    assert not monitor_.available
+
+
+def test_new_monitor_stops_when_tickets_are_available():
+    monitor_, sent = _monitor(requested_count=1)
+    monitor_._first_request = True
+
+    asyncio.run(monitor_.process_train(_train(_car('07', {13}))))
+    assert monitor_.stop
+    assert sent == ['Total: 1 tickets\n+1 in car 07, seat 13']
@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+from app import outbound
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((time.monotonic(), chat_id, text))
+        return text
+
+
+def test_reply_is_not_delayed_by_notifications():
+    bot = FakeBot()
+
+    async def run():
+        outbox = outbound.Outbox(bot, chat_rate=1, chat_burst=1, coalesce_window=0)
+        for i in range(5):
+            outbox.enqueue(1, f'notification {i}', priority=outbound.NOTIFICATION)
+        await asyncio.sleep(0.05)
+        started = time.monotonic()
+        await outbox.send_message(1, 'reply')
+        elapsed = time.monotonic() - started
+        await outbox.close()
+        return elapsed
+
+    assert asyncio.run(run()) < 0.5
+    assert [text for _, _, text in bot.sent] == ['notification 0', 'reply']
+
+
+def test_notifications_are_coalesced():
+    bot = FakeBot()
+
+    async def run():
+        outbox = outbound.Outbox(bot, coalesce_window=0.05)
+        first = outbox.notify(1, 'a')
+        second = outbox.notify(1, 'b')
+        assert first is second
+        await first
+        await outbox.close()
+
+    asyncio.run(run())
+    assert [text for _, _, text in bot.sent] == ['a\n\nb']
+
+
+def test_failed_notification_is_logged(caplog):
+    class FailingBot:
+        async def send_message(self, chat_id, text, **kwargs):
+            raise RuntimeError('blocked')
+
+    async def run():
+        outbox = outbound.Outbox(FailingBot(), coalesce_window=0)
+        outbox.notify(1, 'with markup', reply_markup='x')
+        await asyncio.sleep(0.05)
+        await outbox.close()
+
+    asyncio.run(run())
+    assert 'Cannot send notification' in caplog.text
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from rzd_client import resilience
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock_ = FakeClock()
+    monkeypatch.setattr(resilience, 'time', clock_)
+    return clock_
+
+
+def _fail(breaker):
+    with pytest.raises(ValueError):
+        with breaker:
+            raise ValueError
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = resilience.CircuitBreaker('test', failure_threshold=3, recovery_timeout=10)
+    for _ in range(2):
+        _fail(breaker)
+    assert breaker.state == resilience.STATE_CLOSED
+    _fail(breaker)
+    assert breaker.state == resilience.STATE_OPEN
+
+    clock.now += 4
+    with pytest.raises(resilience.CircuitOpenError) as e:
+        breaker.before_call()
+    assert e.value.retry_in == 6
+    assert breaker.rejected == 1
+
+
+def test_success_resets_failures(clock):
+    breaker = resilience.CircuitBreaker('test', failure_threshold=2)
+    _fail(breaker)
+    with breaker:
+        pass
+    _fail(breaker)
+    assert breaker.state == resilience.STATE_CLOSED
+
+
+def test_half_open_limits_probes_and_closes_on_success(clock):
+    breaker = resilience.CircuitBreaker('test', failure_threshold=1, recovery_timeout=10, half_open_calls=1)
+    _fail(breaker)
+    clock.now += 10
+    probe = breaker.__enter__()
+    assert breaker.state == resilience.STATE_HALF_OPEN
+    with pytest.raises(resilience.CircuitOpenError):
+        breaker.before_call()
+    probe.__exit__(None, None, None)
+    assert breaker.state == resilience.STATE_CLOSED
+    assert breaker.transitions == {
+        resilience.STATE_CLOSED: 1, resilience.STATE_OPEN: 1, resilience.STATE_HALF_OPEN: 1,
+    }
+
+
+def test_half_open_failure_opens_again(clock):
+    breaker = resilience.CircuitBreaker('test', failure_threshold=5, recovery_timeout=10)
+    for _ in range(5):
+        _fail(breaker)
+    clock.now += 10
+    _fail(breaker)
+    assert breaker.state == resilience.STATE_OPEN
+    assert breaker.retry_in() == 10
+
+
+def test_cancelled_probe_lets_another_through(clock):
+    breaker = resilience.CircuitBreaker('test', failure_threshold=1, recovery_timeout=10, half_open_calls=1)
+    _fail(breaker)
+    clock.now += 10
+    with pytest.raises(asyncio.CancelledError):
+        with breaker:
+            raise asyncio.CancelledError
+    assert breaker.state == resilience.STATE_HALF_OPEN
+    with breaker:
+        pass
+    assert breaker.state == resilience.STATE_CLOSED
+
+
+def test_retry_budget_is_paid_by_successes(clock):
+    budget = resilience.RetryBudget(ratio=0.5, min_per_second=0, capacity=2)
+    assert budget.try_spend() and budget.try_spend()
+    assert not budget.try_spend()
+    budget.record_success()
+    assert not budget.try_spend()
+    budget.record_success()
+    assert budget.try_spend()
+    assert (budget.spent, budget.exhausted) == (3, 2)
+
+
+def test_retry_budget_trickles_and_is_capped(clock):
+    budget = resilience.RetryBudget(ratio=0.1, min_per_second=0.5, capacity=3)
+    for _ in range(3):
+        assert budget.try_spend()
+    assert not budget.try_spend()
+    clock.now += 2
+    assert budget.try_spend()
+    clock.now += 3600
+    budget.record_success()
+    assert budget.tokens == 3
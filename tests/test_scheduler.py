@@ -0,0 +1,73 @@
+import asyncio
+
+from rzd_client import scheduler
+
+
+def _grant_order(scheduler_, priorities):
+    order = []
+
+    async def request(priority):
+        await scheduler_.acquire(priority)
+        order.append(priority)
+
+    async def run():
+        await asyncio.gather(*(request(priority) for priority in priorities))
+
+    asyncio.run(run())
+    return order
+
+
+def test_no_rate_means_no_limit():
+    scheduler_ = scheduler.RequestScheduler(rate=0)
+    assert _grant_order(scheduler_, [scheduler.PRIORITY_BACKGROUND] * 3) == [scheduler.PRIORITY_BACKGROUND] * 3
+    assert scheduler_.granted[scheduler.PRIORITY_BACKGROUND] == 0
+
+
+def test_interactive_goes_first():
+    scheduler_ = scheduler.RequestScheduler(rate=200, burst=1)
+    priorities = [scheduler.PRIORITY_BACKGROUND] * 3 + [scheduler.PRIORITY_MONITOR] * 3
+    order = _grant_order(scheduler_, priorities + [scheduler.PRIORITY_INTERACTIVE])
+    # The first one takes the burst before anybody else is queued
+    assert order[:2] == [scheduler.PRIORITY_BACKGROUND, scheduler.PRIORITY_INTERACTIVE]
+
+
+def test_weights_share_the_rate():
+    scheduler_ = scheduler.RequestScheduler(
+        rate=200,
+        burst=1,
+        weights={scheduler.PRIORITY_MONITOR: 3, scheduler.PRIORITY_BACKGROUND: 1},
+    )
+    priorities = [scheduler.PRIORITY_MONITOR] * 12 + [scheduler.PRIORITY_BACKGROUND] * 12
+    order = _grant_order(scheduler_, priorities)
+    # Both are queued from the start: 3 monitor requests per background one
+    assert order[1:13].count(scheduler.PRIORITY_MONITOR) == 9
+    assert scheduler_.granted == {
+        scheduler.PRIORITY_INTERACTIVE: 0, scheduler.PRIORITY_MONITOR: 12, scheduler.PRIORITY_BACKGROUND: 12,
+    }
+
+
+def test_idle_class_gets_no_credit():
+    scheduler_ = scheduler.RequestScheduler(rate=200, burst=1)
+    _grant_order(scheduler_, [scheduler.PRIORITY_MONITOR] * 10)
+    # Background was idle while monitors were served, it does not get 10 grants in a row now
+    order = _grant_order(scheduler_, [scheduler.PRIORITY_MONITOR] * 6 + [scheduler.PRIORITY_BACKGROUND] * 6)
+    assert scheduler.PRIORITY_BACKGROUND in order[:4]
+    assert scheduler.PRIORITY_MONITOR in order[1:5]
+
+
+def test_works_across_event_loops():
+    scheduler_ = scheduler.RequestScheduler(rate=10, burst=1)
+
+    async def abandoned():
+        await scheduler_.acquire(scheduler.PRIORITY_MONITOR)
+        # The loop ends while the request waits, leaving its timer and waiter behind
+        task = asyncio.ensure_future(scheduler_.acquire(scheduler.PRIORITY_MONITOR))
+        await asyncio.sleep(0.01)
+        assert not task.done()
+
+    async def next_run():
+        await asyncio.wait_for(scheduler_.acquire(scheduler.PRIORITY_MONITOR), 1)
+
+    asyncio.run(abandoned())
+    asyncio.run(next_run())
+    assert scheduler_.queued(scheduler.PRIORITY_MONITOR) == 0
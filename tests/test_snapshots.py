@@ -0,0 +1,76 @@
+import asyncio
+import datetime
+import types
+
+from collector_app import snapshots
+from rzd_client import models
+
+CONFIG = types.SimpleNamespace(
+    id=1, departure_date=datetime.date(2099, 1, 1), departure_station_id=2000000, arrival_station_id=2004000,
+)
+
+
+def _train(number='001А', free_seats=0, price=1000):
+    return models.TrainOverview.from_rzd_json({
+        'number': number,
+        'code0': 2000000,
+        'code1': 2004000,
+        'station0': 'A',
+        'station1': 'B',
+        'date0': '01.01.2099',
+        'time0': '10:00',
+        'date1': '01.01.2099',
+        'time1': '20:00',
+        'serviceCategories': [{'typeCarNumCode': 1, 'freeSeats': free_seats, 'price': price}],
+    })
+
+
+def test_same_availability_does_not_bump_version():
+    index = snapshots.SnapshotIndex()
+    index.update(CONFIG, [_train(free_seats=2)])
+    assert index.config_version(1) == index.version == 1
+    index.update(CONFIG, [_train(free_seats=2)])
+    assert index.version == 1
+
+
+def test_changes_bump_version():
+    index = snapshots.SnapshotIndex()
+    index.update(CONFIG, [_train(free_seats=2)])
+    index.update(CONFIG, [_train(free_seats=3)])
+    assert index.version == 2
+    index.update(CONFIG, [_train(free_seats=3, price=1200)])
+    assert index.version == 3
+    index.update(CONFIG, [_train(free_seats=3, price=1200), _train('002А')])
+    assert index.version == 4
+    assert sorted(index.view(1)['trains']) == ['001А', '002А']
+
+
+def test_removal_is_reported_as_tombstone():
+    index = snapshots.SnapshotIndex()
+    index.update(CONFIG, [_train()])
+    index.remove(1)
+    assert index.config_version(1) is None
+    assert index.view(1) is None
+    assert index.changed_since(1) == [{'config_id': 1, 'version': 2, 'removed': True}]
+    assert index.changed_since(2) == []
+
+
+def test_find_filters_routes():
+    index = snapshots.SnapshotIndex()
+    index.update(CONFIG, [_train()])
+    assert [v['config_id'] for v in index.find(departure_date=datetime.date(2099, 1, 1))] == [1]
+    assert index.find(departure_station=1) == []
+
+
+def test_wait_changed():
+    index = snapshots.SnapshotIndex()
+
+    async def run():
+        assert not await index.wait_changed(0, 0.01)
+        waiter = asyncio.create_task(index.wait_changed(0, 1))
+        await asyncio.sleep(0)
+        index.update(CONFIG, [_train()])
+        assert await waiter
+        assert await index.wait_changed(0, 0)
+
+    asyncio.run(run())
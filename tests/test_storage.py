@@ -0,0 +1,43 @@
+import asyncio
+
+from app import storage
+
+
+def test_close_writes_queued_state(tmp_path):
+    path = str(tmp_path / 'bot.sqlite')
+
+    async def run():
+        fsm = storage.SQLiteStorage(storage.Database(path))
+        await fsm.set_state(chat=1, user=2, state='Form:date')
+        # Queued, not awaited: close must still write it
+        pending = asyncio.ensure_future(fsm.set_data(chat=1, user=2, data={'date': '01.02.2024'}))
+        await asyncio.sleep(0)
+        await fsm.close()
+        await fsm.wait_closed()
+        await pending
+
+    asyncio.run(run())
+
+    async def reopen():
+        database = storage.Database(path)
+        fsm = storage.SQLiteStorage(database)
+        res = await fsm.get_state(chat=1, user=2), await fsm.get_data(chat=1, user=2)
+        await fsm.close()
+        await fsm.wait_closed()
+        return res
+
+    assert asyncio.run(reopen()) == ('Form:date', {'date': '01.02.2024'})
+
+
+def test_close_shuts_down_the_thread(tmp_path):
+    database = storage.Database(str(tmp_path / 'bot.sqlite'))
+    fsm = storage.SQLiteStorage(database)
+
+    async def run():
+        await fsm.close()
+        await fsm.close()
+        await fsm.wait_closed()
+
+    asyncio.run(run())
+    assert database._executor._shutdown
+    database.close()
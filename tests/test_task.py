@@ -0,0 +1,81 @@
+import asyncio
+import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+
+from collector_app import orm
+from collector_app import snapshots
+from collector_app import task
+from rzd_client import models
+
+
+@compiles(JSONB, 'sqlite')
+def _jsonb_sqlite(type_, compiler, **kwargs):
+    return 'JSON'
+
+
+class FakeWorker:
+    def __init__(self):
+        self.scheduled = 0
+
+    async def schedule_query(self, args, callback):
+        self.scheduled += 1
+
+
+def _train(free_seats):
+    return models.TrainOverview.from_rzd_json({
+        'number': '001А',
+        'code0': 2000000,
+        'code1': 2004000,
+        'station0': 'A',
+        'station1': 'B',
+        'date0': '01.01.2099',
+        'time0': '10:00',
+        'date1': '01.01.2099',
+        'time1': '20:00',
+        'serviceCategories': [{'typeCarNumCode': 1, 'freeSeats': free_seats, 'price': 1000}],
+    })
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = create_engine('sqlite://', future=True)
+    orm.Base.metadata.create_all(engine)
+    monkeypatch.setattr(orm, '_engine', engine)
+    monkeypatch.setattr(task, 'calculate_delay', lambda days: 0)
+    return engine
+
+
+def test_callback_keeps_collecting_after_successful_polls(engine):
+    with Session(engine, expire_on_commit=False) as session:
+        conf = orm.Config(
+            departure_date=datetime.date(2099, 1, 1),
+            departure_station_id=2000000,
+            arrival_station_id=2004000,
+            enabled=True,
+        )
+        session.add(conf)
+        session.commit()
+    args = models.TrainsOverviewRequestArgs(
+        models.Station(2000000), models.Station(2004000), datetime.date(2099, 1, 1),
+    )
+    worker = FakeWorker()
+    index = snapshots.SnapshotIndex()
+    t = task.Task(args, conf, worker, index)
+
+    async def run():
+        await t.callback(True, [_train(0)])
+        await t.callback(True, [_train(2)])
+
+    asyncio.run(run())
+
+    assert worker.scheduled == 2
+    assert index.view(conf.id)['trains']['001А'][0]['free_seats'] == 2
+    with Session(engine) as session:
+        assert len(session.scalars(select(orm.CollectedDataRaw)).all()) == 2
+        assert len(session.scalars(select(orm.CollectedData)).all()) == 2
@@ -0,0 +1,45 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+
+from rzd_client import tracing
+
+CONNECT_DELAY = 0.2
+RESPONSE_DELAY = 0.1
+
+
+class SlowConnector(aiohttp.TCPConnector):
+    async def _create_connection(self, req, traces, timeout):
+        await asyncio.sleep(CONNECT_DELAY)
+        return await super()._create_connection(req, traces, timeout)
+
+
+async def _handler(request):
+    await asyncio.sleep(RESPONSE_DELAY)
+    return web.Response(text='ok')
+
+
+def test_ttfb_excludes_connect():
+    async def run():
+        app = web.Application()
+        app.router.add_get('/', _handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            async with aiohttp.ClientSession(
+                    connector=SlowConnector(), trace_configs=[tracing.trace_config()],
+            ) as session:
+                with tracing.trace(tracing.ENDPOINT_OVERVIEW, tracing.CALLER_UNKNOWN) as trace_:
+                    async with session.get(f'http://127.0.0.1:{port}/', trace_request_ctx=trace_) as response:
+                        await response.read()
+        finally:
+            await runner.cleanup()
+        return trace_
+
+    trace_ = asyncio.run(run())
+    assert trace_.connect >= CONNECT_DELAY
+    assert RESPONSE_DELAY <= trace_.ttfb < CONNECT_DELAY